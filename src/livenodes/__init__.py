@@ -18,8 +18,16 @@ from .components.node_connector import Attr
 from .components.port import Port, Ports_collection
 
 
-from .components.bridges import Bridge_local, Bridge_thread, Bridge_process, Bridge_aioprocessing
+from .components.bridges import Bridge_local, Bridge_thread, Bridge_process, Bridge_shm, Bridge_pipe, Bridge_socket, Bridge_aioprocessing
 REGISTRY.bridges.register('Bridge_local', Bridge_local)
 REGISTRY.bridges.register('Bridge_thread', Bridge_thread)
 REGISTRY.bridges.register('Bridge_process', Bridge_process)
+REGISTRY.bridges.register('Bridge_shm', Bridge_shm)
+REGISTRY.bridges.register('Bridge_pipe', Bridge_pipe)
+REGISTRY.bridges.register('Bridge_socket', Bridge_socket)
 # REGISTRY.bridges.register('Bridge_aioprocessing', Bridge_aioprocessing)
+
+from .components.bridges.codec import Codec_pickle, Codec_ndarray, Codec_str_list
+REGISTRY.codecs.register('Codec_pickle', Codec_pickle)
+REGISTRY.codecs.register('Codec_ndarray', Codec_ndarray)
+REGISTRY.codecs.register('Codec_str_list', Codec_str_list)
@@ -3,6 +3,9 @@ from .bridge_abstract import Bridge
 from .bridge_local import Bridge_local
 from .bridge_thread import Bridge_thread
 from .bridge_process import Bridge_process
+from .bridge_shm import Bridge_shm
+from .bridge_pipe import Bridge_pipe
+from .bridge_socket import Bridge_socket
 from .bridge_aioprocessing import Bridge_aioprocessing
 
 from .mp_data_storage import Multiprocessing_Data_Storage
\ No newline at end of file
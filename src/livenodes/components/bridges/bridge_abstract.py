@@ -1,20 +1,55 @@
+import time
+import asyncio
+
 from livenodes.components.node_logger import Logger
+from livenodes.components.computer import parse_location
+
+from .shared_pool import Pool_Handle, Pool_Releaser
+from .codec import Codec_pickle
+from .bridge_stats import Bridge_stats
+from .ctr_buffer import Ctr_buffer
 
 class Bridge(Logger):
+    # bridges that serialize items implement encode and put_encoded, so that an emitted item is only encoded once for all of them
+    encodes = False
+    # bridges for which encoding only pays off if it is shared, a single one of them is handed the item itself (see Multiprocessing_Data_Storage)
+    encodes_shared_only = False
+    report_every_x_seconds = 5
 
     # _build thread
     # TODO: this is a serious design flaw:
     # if __init__ is called in the _build / main thread, the queues etc are not only shared between the nodes using them, but also the _build thread
     # explicitly: if a local queue is created for two nodes inside of the same process computer (ie mp process) it is still shared between two processes (main and computer/worker)
     # however: we might be lucky as the main thread never uses it / keeps it.
-    def __init__(self, _from=None, _to=None, _data_type=None):
+    # processes forked from the _build thread need everything they share to exist before the fork, so the _build thread keeps creating it, but closes its copies once both ends run (see release_parent)
+    def __init__(self, _from=None, _to=None, _data_type=None, codec=None, capacity=None, overflow='block', name=None, compression=None, priority='bulk'):
         super().__init__()
         self._from = _from
         self._to = _to
         self._data_type = _data_type
+        # used by bridges that serialize, chosen from the emitting port
+        self.codec = codec if codec is not None else Codec_pickle
+        # used by bridges that serialize, chosen by the connection (see Compressor), None: send frames as they are
+        self.compression = compression
+        # of the connection (see connection.PRIORITIES), bridges sharing a transport send 'control' items first
+        self.priority = priority
+        # compact string of the connection, used in reports
+        self.name = name if name is not None else str(self)
+
+        # number of items waiting for the receiver (None: unbounded) and what to do if another one arrives (see connection.OVERFLOW_POLICIES)
+        self.capacity = 1 if overflow == 'latest' else capacity
+        self.overflow = overflow
+        # counted by whichever side applies the overflow policy, reported by the receiving side
+        self.n_dropped = 0
+        # written by both ends, readable from every process (see Bridge_stats)
+        self.stats = Bridge_stats()
 
         # _to thread
-        self._read = {}
+        self._read = Ctr_buffer()
+        self._n_dropped_reported = 0
+        self._dropped_report_timer = None
+        self._pool_releaser = Pool_Releaser()
+        self._on_closed = None
 
     def __str__(self) -> str:
         return f"<{self.__class__.__name__}>:{id(self)}"
@@ -29,9 +64,88 @@ class Bridge(Logger):
     def ready_recv(self):
         raise NotImplementedError()
 
+    # called by the graph once the computers of both ends are set up in processes of their own, which inherited everything created in __init__ on fork
+    # closes the build process' copies of os resources (file descriptors, mappings), so that it does not keep those of every bridge open for the whole run
+    # _build thread
+    def release_parent(self):
+        pass
+
+
+    def blocks(self):
+        return self.capacity is not None and self.overflow == 'block'
+
+    def drops(self):
+        return self.capacity is not None and self.overflow != 'block'
+
+    # thread that fills the inbox
+    def _inbox_append(self, inbox, entry):
+        # applies the drop policies to a deque of (ctr, item), blocking is up to the sending side of the bridges
+        if not self.drops() or len(inbox) < self.capacity:
+            inbox.append(entry)
+            return
+        self.n_dropped += 1
+        if self.overflow == 'drop_newest':
+            self._discard(entry[1])
+            return
+        self._discard(inbox.popleft()[1])
+        inbox.append(entry)
+
+    @staticmethod
+    def _discard(item):
+        # dropped frames from a shared buffer pool are never processed, so hand them back right away
+        if type(item) is Pool_Handle:
+            item.release()
+
+    # _to thread
+    def _report_dropped(self, force=False):
+        # drops may happen on every emit while the receiver is behind, so only report every x seconds
+        if self.n_dropped == self._n_dropped_reported:
+            return
+        now = time.time()
+        if force or self._dropped_report_timer is None or now - self._dropped_report_timer > self.report_every_x_seconds:
+            if self._dropped_report_timer is None:
+                self.warn(f'Receiver is behind, dropping items ({self.overflow}, capacity {self.capacity})')
+            self._dropped_report_timer = now
+            self._n_dropped_reported = self.n_dropped
+            self._report(dropped={self.name: self.n_dropped})
+
+    # _from thread
+    def has_credit(self):
+        # whether the receiver has room for another item without blocking the sender, always true for connections that do not block
+        return True
+
+    # _from thread
+    async def wait_credit(self):
+        # resolves once has_credit, ie nodes await this before they produce their next item (credit-based flow control)
+        pass
+
+    # _build thread
+    def crosses_process(self):
+        # data put into this bridge needs to be transferred into another process (or host), ie cannot be passed by reference
+        from_host, from_process, _ = parse_location(self._from)
+        to_host, to_process, _ = parse_location(self._to)
+        return from_host != to_host or from_process != to_process
+
+    # _build thread
+    def crosses_host(self):
+        # data put into this bridge is sent to another host, ie not even shared memory is available
+        return parse_location(self._from)[0] != parse_location(self._to)[0]
+
+    # _build thread
+    @classmethod
+    def check_received(cls, bridges):
+        # called with all bridges of this class that nodes locked in the same build receive from (see Graph.lock_all), raises if they cannot work together
+        pass
+
+    # _build thread
+    @classmethod
+    def honors(cls, capacity=None, overflow='block', compression=None):
+        # whether the bridge applies these settings of a connection (see Connection) instead of ignoring them, measurements do not know about them (see rank_bridges)
+        return compression is None or cls.encodes
 
     @staticmethod
     def can_handle(_from, _to, _data_type=None):
+        # _data_type is the class of the emitting port, bridges may specialize on its codec and hints (e.g. payload_bytes, rate)
         # Returns
         #   - True if it can handle this connection
         #   - 0-10 how high the handle cost (indicates which implementation to use if multiple can handle this)
@@ -45,13 +159,54 @@ class Bridge(Logger):
     def put(self):
         raise NotImplementedError()
 
-    # _to thread (called by _should_process)
+    # _from thread
+    def encode(self, item):
+        raise NotImplementedError()
+
+    # _from thread
+    def put_encoded(self, ctr, encoded):
+        raise NotImplementedError()
+
+    # _from thread
+    def encoded_nbytes(self, encoded):
+        # bytes sent for an item encoded by this bridge
+        raise NotImplementedError()
+
+    # _from thread
+    def encoded_saved(self, encoded):
+        # bytes saved by compressing an item encoded by this bridge
+        raise NotImplementedError()
+
+    # _to thread
+    def has_waiting(self):
+        # whether update would return an item without waiting, cheap as it is checked for every bulk item a node takes while it also receives 'control' items (see Node._await_input)
+        return False
+
+    # _to thread (called by onclose)
     def closed_and_empty(self):
         raise NotImplementedError()
 
+    # _to thread
+    def _check_closed(self):
+        # resolves the awaitable of onclose, once the sender closed the bridge and the last item was consumed
+        # subclasses call this whenever either of those might have changed
+        if self._on_closed is not None and not self._on_closed.done() and self.closed_and_empty():
+            self._on_closed.set_result(None)
+
     # _to thread
     async def onclose(self):
-        raise NotImplementedError()
+        if not self.closed_and_empty():
+            # several tasks may wait for the same bridge (e.g. the data storage and a circ breaker node)
+            if self._on_closed is None:
+                self._on_closed = asyncio.get_event_loop().create_future()
+            await asyncio.shield(self._on_closed)
+        self._report_dropped(force=True)
+        self.debug('Closed and empty -- telling multiprocessing data storage')
+
+    # _to thread
+    def release_shared(self):
+        # called once the bridge is closed and empty, hands back all frames still held from shared buffer pools
+        self._pool_releaser.close()
 
     # _to thread
     async def update(self):
@@ -60,17 +215,19 @@ class Bridge(Logger):
     # _to thread
     # TODO: rename, this is not before, but before and including
     def discard_before(self, ctr):
-        # TODO: this should be doable more efficiently...
-        # maybe choose a diferent datasetructur
-        self._read = {
-            key: val
-            for key, val in self._read.items() if key > ctr
-        }
+        for val in self._read.pop_until(ctr):
+            # frames from a shared buffer pool are handed back to the emitter once processed
+            if type(val) is Pool_Handle:
+                self._pool_releaser.add(val)
+        self._check_closed()
 
     # _to thread
     def get(self, ctr):
         # in the process and thread case the queue should always be empty if we arrive here
         # This should also never be executed in process or thread, as then the update function does not block and keys are skipped!
         if ctr in self._read:
-            return True, self._read[ctr]
+            val = self._read[ctr]
+            if type(val) is Pool_Handle:
+                return True, val.resolve()
+            return True, val
         return False, None
@@ -69,7 +69,7 @@ class Bridge_aioprocessing(Bridge):
     
     # _to thread
     def empty(self):
-        return self.queue.empty() and self._read == {}
+        return self.queue.empty() and len(self._read) == 0
     
     def closed_and_empty(self):
         ret = self.closed() and self.empty()    
@@ -16,11 +16,16 @@ class Bridge_local(Bridge):
         # both threads (?)
         self.queue = None
         self.closed_event = None
+        # senders awaiting room in the queue (every input listener of the sending node), see wait_credit
+        self._credit_waiters = set()
+        self._receiver_stopped = False
 
     # _computer thread
     def ready_send(self):
         self.queue = asyncio.Queue()
         self.closed_event = th.Event()
+        if self.blocks():
+            self.debug('Cannot block the sender within the same thread, capacity is only enforced on nodes awaiting credit (see wait_credit).')
 
     # _computer thread
     def ready_recv(self):
@@ -36,6 +41,8 @@ class Bridge_local(Bridge):
     # _from thread
     def close(self):
         self.closed_event.set()
+        # same thread as the receiver, so we can resolve its close awaitable directly
+        self._check_closed()
         # if self.queue:
         #     if hasattr(self.queue, 'close'):
         #         self.queue.close()
@@ -45,8 +52,34 @@ class Bridge_local(Bridge):
     # _from thread
     def put(self, ctr, item):
         # # print('putting value', ctr)
+        if self.drops() and self.queue.qsize() >= self.capacity:
+            self.n_dropped += 1
+            if self.overflow == 'drop_newest':
+                self._discard(item)
+                return
+            self._discard(self.queue.get_nowait()[1])
         self.queue.put_nowait((ctr, item))
 
+    # _from thread
+    def has_credit(self):
+        return not self.blocks() or self.queue.qsize() < self.capacity or self._receiver_stopped
+
+    # _from thread
+    async def wait_credit(self):
+        while not self.has_credit():
+            waiter = asyncio.get_event_loop().create_future()
+            self._credit_waiters.add(waiter)
+            try:
+                await waiter
+            finally:
+                self._credit_waiters.discard(waiter)
+
+    # _to thread
+    def _give_credit(self):
+        for waiter in self._credit_waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
     # _to thread
     def closed(self):
         return self.closed_event.is_set()
@@ -55,28 +88,29 @@ class Bridge_local(Bridge):
     def closed_and_empty(self):
         return self.closed() and self.empty()
 
-    # _to thread
-    async def onclose(self):
-        # ouch, can we remove this to not be a busy wait somehow? -yh
-        while True:
-            await asyncio.sleep(0.01)
-            if self.closed_and_empty():
-                self.debug('Closed Event set and queue empty -- telling multiprocessing data storage')
-                return
-
     # _to thread
     def empty(self):
         # wait for the input queue to be empty == our input node / predecessor has sent all they wanted to send
         # then also wait for our node to have processed all of it (since _process on successfull execution calls discard_before) the _read should now be empty (discard before also discards the currently worked on value)
-        return self.queue.qsize() <= 0 and self._read == {}
+        return self.queue.qsize() <= 0 and len(self._read) == 0
+
+    # _to thread
+    def has_waiting(self):
+        return self.queue is not None and self.queue.qsize() > 0
 
     # _to thread
     async def update(self):
         # # print('waiting for asyncio to receive a value')
         try:
             itm_ctr, item = await self.queue.get()
+            self._give_credit()
             self._read[itm_ctr] = item
+            self._report_dropped()
             return itm_ctr
+        except asyncio.CancelledError:
+            self._receiver_stopped = True
+            self._give_credit()
+            raise
         except Exception as err:
             self.logger.exception(f'Could not get value')
             self.error(err)
@@ -0,0 +1,399 @@
+import os
+import time
+import select
+import struct
+import asyncio
+from itertools import islice
+from collections import deque
+
+from livenodes.components.computer import parse_location
+
+from .bridge_abstract import Bridge
+from .codec import Codec_pickle
+
+PIPE_BRIDGE_BUFFER_SIZE = int(os.getenv('PIPE_BRIDGE_BUFFER_SIZE', 65_536))  # Default to 64KB if not set
+PIPE_BRIDGE_CLOSE_TIMEOUT = float(os.getenv('PIPE_BRIDGE_CLOSE_TIMEOUT', 30))
+
+# every message starts with its ctr, the number of frames and its flags
+# followed by the size of each frame and the frames themselves
+# a message without frames marks the end of the stream
+_HEADER = struct.Struct('<qIB')
+# flags: the frames are pickled as fallback for the bridge's codec, the frames are compressed (see Compressor)
+_FALLBACK = 1
+_COMPRESSED = 2
+_SIZE = struct.Struct('<Q')
+# frames written with a single writev call, well below IOV_MAX
+_MAX_WRITE_FRAMES = 64
+# the receiver of a blocking connection acknowledges every item it took with one byte on a second pipe (or tells the sender that it stopped taking items)
+_ACK = b'\x01'
+_ACK_STOPPED = b'\x00'
+
+def _skip(parts, n):
+    # drop the first n bytes of a list of buffers
+    rest = []
+    for part in parts:
+        size = memoryview(part).nbytes
+        if n >= size:
+            n -= size
+            continue
+        rest.append(memoryview(part)[n:] if n > 0 else part)
+        n = 0
+    return rest
+
+
+class Frames_encoder:
+    # encode for bridges that send an item as its frames (see _HEADER), prefixed by their flags and sizes
+    # (flags, sizes, frames, saved) can be shared by all bridges with the same codec and compression
+
+    # _from thread
+    def encode(self, item):
+        codec = self.codec if self.codec.accepts(item) else Codec_pickle
+        frames = codec.encode(item)
+        flags, saved = (_FALLBACK if codec is not self.codec else 0), 0
+        compressed = self.compression.compress(frames) if self.compression is not None else None
+        if compressed is not None:
+            frames, saved = compressed
+            flags |= _COMPRESSED
+        sizes = b''.join(_SIZE.pack(memoryview(frame).nbytes) for frame in frames)
+        return flags, sizes, frames, saved
+
+    # _from thread
+    def encoded_nbytes(self, encoded):
+        flags, sizes, frames, saved = encoded
+        return sum(memoryview(frame).nbytes for frame in frames)
+
+    # _from thread
+    def encoded_saved(self, encoded):
+        return encoded[3]
+
+
+class Bridge_pipe(Frames_encoder, Bridge):
+    """
+    Process bridge on a non-blocking os.pipe, that is driven by the event loops of both ends.
+
+    Items are encoded into frames by the bridge's codec (by default pickle protocol 5, so that numpy buffers are sent as separate frames instead of being copied into the pickle stream).
+    The receiver registers the read end with loop.add_reader, reads everything available into a preallocated buffer and wakes update directly.
+    Large frames are read directly into their own buffer, which the decoded item may then use without further copies.
+    The sender writes the frames straight into the pipe. If the pipe is full, the rest is kept and written once the pipe is writable again (loop.add_writer), so that put never blocks and no feeder thread is needed.
+    If the connection blocks, the receiver hands back credit for every item it took through a second pipe, which the sender's loop reads (loop.add_reader).
+    """
+
+    encodes = True
+
+    buffer_size = PIPE_BRIDGE_BUFFER_SIZE
+    close_timeout = PIPE_BRIDGE_CLOSE_TIMEOUT
+
+    # _build thread
+    # TODO: this is a serious design flaw:
+    # if __init__ is called in the _build / main thread, the queues etc are not only shared between the nodes using them, but also the _build thread
+    # explicitly: if a local queue is created for two nodes inside of the same process computer (ie mp process) it is still shared between two processes (main and computer/worker)
+    # however: we might be lucky as the main thread never uses it / keeps it.
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+
+        # both processes (inherited on fork)
+        self._r, self._w = os.pipe()
+        self._ack_r, self._ack_w = os.pipe() if self.blocks() else (None, None)
+
+        # _from process
+        self._send_loop = None
+        self._outbox = deque()
+        # items the receiver has room for, None once the receiver stopped taking items (ie we should not wait anymore)
+        self._credit = self.capacity
+        # every input listener of the sending node awaits credit (see Node._await_input)
+        self._credit_waiters = set()
+
+        # _to process
+        self._loop = None
+        self._buffer = None
+        self._view = None
+        self._filled = 0
+        # message whose frames are currently received: (ctr, flags, frame sizes, received frames) and the frame currently read
+        self._message = None
+        self._frame = None
+        self._frame_filled = 0
+        self._inbox = deque()
+        self._waiter = None
+        self._closed = False
+
+    # _computer thread
+    def ready_send(self):
+        os.set_blocking(self._w, False)
+        self._send_loop = asyncio.get_event_loop()
+        if self._ack_r is not None:
+            os.set_blocking(self._ack_r, False)
+            self._send_loop.add_reader(self._ack_r, self._on_ack)
+
+    # _computer thread
+    def ready_recv(self):
+        os.set_blocking(self._r, False)
+        if self._ack_w is not None:
+            os.set_blocking(self._ack_w, False)
+        self._buffer = bytearray(self.buffer_size)
+        self._view = memoryview(self._buffer)
+        self._loop = asyncio.get_event_loop()
+        self._loop.add_reader(self._r, self._on_readable)
+
+    # _build thread
+    def release_parent(self):
+        for fd in (self._r, self._w, self._ack_r, self._ack_w):
+            if fd is not None:
+                os.close(fd)
+        self._r, self._w, self._ack_r, self._ack_w = None, None, None, None
+
+    # _build thread
+    @staticmethod
+    def can_handle(_from, _to, _data_type=None):
+        # cheaper than the mp.Queue based process bridge, as neither side polls and there is no feeder thread
+        from_host, from_process, from_thread = parse_location(_from)
+        to_host, to_process, to_thread = parse_location(_to)
+        return from_host == to_host and from_process != to_process, 3
+
+    # _from thread
+    def _send(self, parts):
+        if len(self._outbox) == 0:
+            # writev takes a limited number of buffers (IOV_MAX), but protocol 5 makes every array in e.g. a list its own frame
+            while len(parts) > 0:
+                try:
+                    n = os.writev(self._w, parts[:_MAX_WRITE_FRAMES])
+                except BlockingIOError:
+                    break
+                parts = _skip(parts, n)
+            if len(parts) == 0:
+                return
+            self._send_loop.add_writer(self._w, self._flush)
+        # keep the order: wait behind what is already queued
+        # note: the frames reference the emitted data (as in the thread bridges), it is not copied
+        self._outbox.extend(parts)
+
+    # _from thread
+    def _write_outbox(self):
+        try:
+            n = os.writev(self._w, list(islice(self._outbox, _MAX_WRITE_FRAMES)))
+        except BlockingIOError:
+            return
+        while n > 0:
+            part = self._outbox.popleft()
+            size = memoryview(part).nbytes
+            if n < size:
+                self._outbox.appendleft(memoryview(part)[n:])
+            n -= size
+
+    # _from thread
+    def _flush(self):
+        self._write_outbox()
+        if len(self._outbox) == 0:
+            self._send_loop.remove_writer(self._w)
+
+    # _from thread
+    def _read_acks(self):
+        while self._credit is not None:
+            try:
+                acks = os.read(self._ack_r, 4096)
+            except BlockingIOError:
+                return
+            if len(acks) == 0 or _ACK_STOPPED in acks:
+                self._credit = None
+                self._send_loop.remove_reader(self._ack_r)
+                return
+            self._credit += len(acks)
+
+    # _from thread
+    def _on_ack(self):
+        self._read_acks()
+        if self.has_credit():
+            for waiter in self._credit_waiters:
+                if not waiter.done():
+                    waiter.set_result(None)
+
+    # _from thread
+    def has_credit(self):
+        return self._ack_r is None or self._credit is None or self._credit > 0
+
+    # _from thread
+    async def wait_credit(self):
+        while not self.has_credit():
+            waiter = self._send_loop.create_future()
+            self._credit_waiters.add(waiter)
+            try:
+                await waiter
+            finally:
+                self._credit_waiters.discard(waiter)
+
+    # _from thread
+    def _acquire_credit(self):
+        # blocks until the receiver has room, meanwhile keep writing what is queued, as the receiver may need it to make room
+        # returns False if the receiver stopped taking items
+        self._read_acks()
+        while not self.has_credit():
+            writing = [self._w] if len(self._outbox) > 0 else []
+            select.select([self._ack_r], writing, [])
+            if len(self._outbox) > 0:
+                self._flush()
+            self._read_acks()
+        if self._credit is None:
+            return False
+        self._credit -= 1
+        return True
+
+    # _from thread
+    def put_encoded(self, ctr, encoded):
+        # the encoded frames may be shared with other bridges, we only reference them
+        if self._ack_r is not None and not self._acquire_credit():
+            return
+        flags, sizes, frames, saved = encoded
+        self._send([_HEADER.pack(ctr, len(frames), flags) + sizes] + frames)
+
+    # _from thread
+    def put(self, ctr, item):
+        self.put_encoded(ctr, self.encode(item))
+
+    # _from thread
+    def close(self):
+        self._send([_HEADER.pack(-1, 0, 0)])
+        if len(self._outbox) > 0:
+            # our loop might be closed right after this, so write the rest now, as long as the receiver keeps reading
+            self._send_loop.remove_writer(self._w)
+            deadline = time.time() + self.close_timeout
+            while len(self._outbox) > 0 and time.time() < deadline:
+                select.select([], [self._w], [], max(0, deadline - time.time()))
+                self._write_outbox()
+            if len(self._outbox) > 0:
+                self.error(f'Receiver did not read the last {sum(memoryview(part).nbytes for part in self._outbox)} bytes within {self.close_timeout}s, dropping them')
+                self._outbox.clear()
+
+    # _to thread
+    def _collect_frames(self, pos):
+        # copy the frames of the current message, that are already in our buffer, into their own buffers
+        # stops at the first frame that is incomplete, its rest is then read directly into the frame's buffer (see _on_readable)
+        ctr, flags, sizes, frames = self._message
+        while len(frames) < len(sizes):
+            if self._frame is None:
+                self._frame = bytearray(sizes[len(frames)])
+                self._frame_filled = 0
+            take = min(len(self._frame) - self._frame_filled, self._filled - pos)
+            self._frame[self._frame_filled:self._frame_filled + take] = self._view[pos:pos + take]
+            self._frame_filled += take
+            pos += take
+            if self._frame_filled < len(self._frame):
+                return pos
+            frames.append(self._frame)
+            self._frame = None
+
+        if flags & _COMPRESSED:
+            frames = self.compression.decompress(frames)
+        codec = Codec_pickle if flags & _FALLBACK else self.codec
+        self._inbox_append(self._inbox, (ctr, codec.decode(frames)))
+        self._message = None
+        return pos
+
+    # _to thread
+    def _parse(self):
+        pos = 0
+        needed = 0
+        while True:
+            if self._message is not None:
+                pos = self._collect_frames(pos)
+                if self._message is not None:
+                    break
+                continue
+
+            available = self._filled - pos
+            if available < _HEADER.size:
+                needed = _HEADER.size
+                break
+            ctr, n_frames, flags = _HEADER.unpack_from(self._buffer, pos)
+            needed = _HEADER.size + n_frames * _SIZE.size
+            if available < needed:
+                break
+            if n_frames == 0:
+                self._closed = True
+                pos += needed
+                continue
+            sizes = struct.unpack_from(f'<{n_frames}Q', self._buffer, pos + _HEADER.size)
+            self._message = (ctr, flags, sizes, [])
+            pos += needed
+            needed = 0
+
+        # move the incomplete rest to the front of the buffer
+        rest = self._filled - pos
+        if pos > 0 and rest > 0:
+            self._buffer[:rest] = self._buffer[pos:self._filled]
+        self._filled = rest
+
+        # grow the buffer, if the next message header does not fit
+        if needed > len(self._buffer):
+            buffer = bytearray(needed)
+            buffer[:rest] = self._buffer[:rest]
+            self._view.release()
+            self._buffer, self._view = buffer, memoryview(buffer)
+
+    # _to thread
+    def _on_readable(self):
+        # read everything that is available, so that the sender can continue writing
+        while not self._closed:
+            targets = [self._view[self._filled:]]
+            if self._frame is not None:
+                # large frames are read directly into their own buffer, our buffer only takes what follows
+                targets.insert(0, memoryview(self._frame)[self._frame_filled:])
+            try:
+                n = os.readv(self._r, targets)
+            except BlockingIOError:
+                break
+            if n == 0:
+                # all write ends are closed
+                break
+            if self._frame is not None:
+                take = min(n, len(self._frame) - self._frame_filled)
+                self._frame_filled += take
+                n -= take
+            self._filled += n
+            self._parse()
+
+        if self._closed:
+            self._loop.remove_reader(self._r)
+        if len(self._inbox) > 0 and self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+        self._check_closed()
+
+    # _to thread
+    def _ack(self, ack):
+        # the sender only has capacity many items in flight, so there are never more unread acks than that
+        if self._ack_w is not None:
+            try:
+                os.write(self._ack_w, ack)
+            except BlockingIOError:
+                self.warn('Sender does not read its acknowledgements, cannot give back credit')
+
+    # _to thread
+    def closed(self):
+        return self._closed
+
+    # _to thread
+    def empty(self):
+        return len(self._inbox) == 0 and len(self._read) == 0
+
+    # _to thread
+    def has_waiting(self):
+        return len(self._inbox) > 0
+
+    # _to thread
+    def closed_and_empty(self):
+        return self.closed() and self.empty()
+
+    # _to thread
+    async def update(self):
+        while len(self._inbox) == 0:
+            self._waiter = self._loop.create_future()
+            try:
+                await self._waiter
+            except asyncio.CancelledError:
+                self._ack(_ACK_STOPPED)
+                raise
+            finally:
+                self._waiter = None
+        itm_ctr, item = self._inbox.popleft()
+        self._ack(_ACK)
+        self._read[itm_ctr] = item
+        self._report_dropped()
+        return itm_ctr
@@ -0,0 +1,248 @@
+import os
+import sys
+import queue
+import struct
+import multiprocessing as mp
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from livenodes.components.computer import parse_location
+
+from .bridge_process import Bridge_process
+
+SHM_BRIDGE_SLOTS = int(os.getenv('SHM_BRIDGE_SLOTS', 8))
+SHM_BRIDGE_SLOT_SIZE = int(os.getenv('SHM_BRIDGE_SLOT_SIZE', 262_144))  # Default to 256KB if not set
+
+# segment header: number of messages the sender has put so far (ring and fallback queue combined)
+_SEGMENT_HEADER = struct.Struct('<q')
+_SEGMENT_HEADER_SIZE = 64
+# slot header: seq, ctr, ndim, dtype string, followed by up to _MAX_NDIM shape entries
+_MAX_NDIM = 8
+_SLOT_HEADER = struct.Struct(f'<qqB16s{_MAX_NDIM}q')
+_SLOT_DATA_OFFSET = 128
+
+
+class _Segment(shared_memory.SharedMemory):
+    # the receiver hands out numpy views into the segment, which keep the underlying buffer exported
+    # closing (also via __del__) would then raise a BufferError, in which case we leave the mapping to be freed with its last view
+    def close(self):
+        try:
+            super().close()
+        except BufferError:
+            pass
+
+
+class Bridge_shm(Bridge_process):
+    """
+    Single-producer/single-consumer ring of slots in shared memory.
+
+    Numpy arrays are written (header + raw bytes) straight into a free slot and received as zero-copy views into that slot.
+    The slot is handed back to the sender once the receiving node processed the ctr (ie in discard_before).
+    Everything else (non-arrays, object dtypes, arrays larger than a slot or a full ring) falls back to the pickling mp.Queue of Bridge_process.
+    Both paths share one sequence counter, so that the receiver can restore the original order.
+
+    Note: received arrays are only valid until their ctr is processed. Nodes that keep inputs around (e.g. as state) must copy them.
+    If a node keeps a reference anyway, the slot stays pinned and is not reused.
+    """
+
+    n_slots = SHM_BRIDGE_SLOTS
+    slot_size = SHM_BRIDGE_SLOT_SIZE
+    # arrays are written into our own ring, which a shared encoding would bypass
+    encodes = False
+
+    # _build thread
+    # TODO: this is a serious design flaw:
+    # if __init__ is called in the _build / main thread, the queues etc are not only shared between the nodes using them, but also the _build thread
+    # explicitly: if a local queue is created for two nodes inside of the same process computer (ie mp process) it is still shared between two processes (main and computer/worker)
+    # however: we might be lucky as the main thread never uses it / keeps it.
+    def __init__(self, **kwargs):
+        # the ring and its fallback queue restore the order by a shared sequence counter, which dropping items would break
+        capacity, overflow = kwargs.pop('capacity', None), kwargs.pop('overflow', 'block')
+        super().__init__(**kwargs)
+        if capacity is not None or overflow == 'latest':
+            self.warn(f'Capacity and overflow policy ({overflow}) are not supported by {self.__class__.__name__}, ignoring them')
+
+        # both processes
+        self._shm = _Segment(create=True, size=_SEGMENT_HEADER_SIZE + self.n_slots * self.slot_size)
+        _SEGMENT_HEADER.pack_into(self._shm.buf, 0, 0)
+        self._free = mp.Semaphore(self.n_slots)
+        self._filled = mp.Semaphore(0)
+
+        # _from process
+        self._send_seq = 0
+        self._write_idx = 0
+
+        # _to process
+        self._next_seq = 0
+        # seq of the end of the stream, once received
+        self._end_seq = None
+        self._read_idx = 0
+        self._release_idx = 0
+        self._slot_free = [True] * self.n_slots
+        self._pending = {}
+        # ctr -> [(slot, array)] of the views currently handed out to the node
+        self._held = {}
+        # (slot, array) of processed ctrs, which are handed back once the node let go of the array
+        self._releasing = []
+        self._n_pinned = 0
+
+    # _build thread
+    @classmethod
+    def honors(cls, capacity=None, overflow='block', compression=None):
+        return capacity is None and overflow != 'latest' and super().honors(capacity, overflow, compression)
+
+    @staticmethod
+    def can_handle(_from, _to, _data_type=None):
+        # only worth it across processes, within a process the thread and local bridges pass references anyway
+        from_host, from_process, from_thread = parse_location(_from)
+        to_host, to_process, to_thread = parse_location(_to)
+        return from_host == to_host and from_process != to_process, 4
+
+    def _slot_offset(self, slot):
+        return _SEGMENT_HEADER_SIZE + slot * self.slot_size
+
+    def _fits_slot(self, item):
+        return isinstance(item, np.ndarray) \
+            and not item.dtype.hasobject \
+            and item.dtype.fields is None \
+            and item.ndim <= _MAX_NDIM \
+            and len(item.dtype.str) <= 16 \
+            and item.nbytes <= self.slot_size - _SLOT_DATA_OFFSET
+
+    # _from thread
+    def put(self, ctr, item):
+        seq = self._send_seq
+        self._send_seq += 1
+
+        if self._fits_slot(item) and self._free.acquire(block=False):
+            slot = self._write_idx % self.n_slots
+            self._write_idx += 1
+
+            offset = self._slot_offset(slot)
+            shape = tuple(item.shape) + (0,) * (_MAX_NDIM - item.ndim)
+            _SLOT_HEADER.pack_into(self._shm.buf, offset, seq, ctr, item.ndim, item.dtype.str.encode('ascii'), *shape)
+            target = np.ndarray(item.shape, dtype=item.dtype, buffer=self._shm.buf, offset=offset + _SLOT_DATA_OFFSET)
+            np.copyto(target, item)
+            del target
+            self._filled.release()
+        else:
+            # non-array payload or no free slot: pickle through the queue
+            self.queue.put_nowait((seq, ctr, item))
+
+        _SEGMENT_HEADER.pack_into(self._shm.buf, 0, self._send_seq)
+
+    # _from thread
+    def close(self):
+        # the end of the stream follows the last item in seq, it does not count as sent item (see empty)
+        self.queue.put_nowait((self._send_seq, None, None))
+
+    # _to thread
+    def _read_slot(self):
+        slot = self._read_idx % self.n_slots
+        self._read_idx += 1
+        self._slot_free[slot] = False
+
+        offset = self._slot_offset(slot)
+        seq, ctr, ndim, dtype, *shape = _SLOT_HEADER.unpack_from(self._shm.buf, offset)
+        item = np.ndarray(tuple(shape[:ndim]), dtype=np.dtype(dtype.rstrip(b'\x00').decode('ascii')), buffer=self._shm.buf, offset=offset + _SLOT_DATA_OFFSET)
+        self._pending[seq] = (ctr, item, slot)
+
+    # _to thread
+    def _drain(self):
+        self._release_processed()
+
+        while self._filled.acquire(block=False):
+            self._read_slot()
+
+        while True:
+            try:
+                seq, ctr, item = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if ctr is None:
+                self._end_seq = seq
+                self._check_closed()
+                break
+            self._pending[seq] = (ctr, item, None)
+
+    # _to thread
+    def _fetch(self):
+        if self._end_seq is None or self._next_seq < self._end_seq:
+            self._drain()
+        return self._next_seq in self._pending
+
+    # _to thread
+    def _release(self, slot):
+        self._slot_free[slot] = True
+        # the sender re-uses slots in ring order, so only hand back the contiguous prefix of freed slots
+        while self._release_idx < self._read_idx and self._slot_free[self._release_idx % self.n_slots]:
+            self._release_idx += 1
+            self._free.release()
+
+    # _to thread
+    def _release_processed(self):
+        # this is called from update, ie after _process returned and dropped its references to the inputs
+        # if the node still references an array (e.g. kept it as state), the slot stays pinned and is re-checked next time
+        pinned = []
+        for slot, item in self._releasing:
+            # references: the tuple in self._releasing, the loop variable and getrefcount's argument
+            if sys.getrefcount(item) > 3:
+                pinned.append((slot, item))
+            else:
+                self._release(slot)
+        if len(pinned) > self._n_pinned:
+            self.debug(f'Node still references {len(pinned)} received array(s), not re-using their slots')
+        self._n_pinned = len(pinned)
+        self._releasing = pinned
+
+    # _to thread
+    async def update(self):
+        await self._poll()
+
+        ctr, item, slot = self._pending.pop(self._next_seq)
+        self._next_seq += 1
+
+        if slot is not None:
+            self._held.setdefault(ctr, []).append((slot, item))
+        self._read[ctr] = item
+        return ctr
+
+    # _to thread
+    def discard_before(self, ctr):
+        super().discard_before(ctr)
+        for key in [key for key in self._held if key <= ctr]:
+            self._releasing.extend(self._held.pop(key))
+
+    # _to thread
+    def closed(self):
+        return self._end_seq is not None
+
+    # _to thread
+    def empty(self):
+        sent = _SEGMENT_HEADER.unpack_from(self._shm.buf, 0)[0]
+        return self._next_seq >= sent and len(self._read) == 0
+
+    # _to thread
+    def has_waiting(self):
+        # only what was already drained, the shared memory is polled by update
+        return self._next_seq in self._pending
+
+    # _to thread (called by onclose)
+    def closed_and_empty(self):
+        return self._end_seq is not None and self._next_seq >= self._end_seq and len(self._read) == 0
+
+    # _build thread
+    def release_parent(self):
+        super().release_parent()
+        # unlinked by the receiver, once it consumed everything
+        self._shm.close()
+
+    # _to thread
+    async def onclose(self):
+        await super().onclose()
+        # we are the last one using the segment, the sender closed and we consumed everything
+        try:
+            self._shm.unlink()
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,503 @@
+import os
+import hmac
+import time
+import select
+import socket
+import struct
+import asyncio
+import threading as th
+from collections import deque
+
+from livenodes.components.computer import parse_location
+from livenodes.components.node_logger import Logger
+
+from .bridge_abstract import Bridge
+from .bridge_pipe import Frames_encoder, _skip, _FALLBACK, _COMPRESSED
+from .codec import Codec_pickle
+
+SOCKET_BRIDGE_CONNECT_TIMEOUT = float(os.getenv('SOCKET_BRIDGE_CONNECT_TIMEOUT', 30))
+SOCKET_BRIDGE_CLOSE_TIMEOUT = float(os.getenv('SOCKET_BRIDGE_CLOSE_TIMEOUT', 30))
+# shared secret of all hosts of a graph, senders have to prove they know it before the receiver decodes (ie possibly unpickles) anything they send
+SOCKET_BRIDGE_AUTHKEY = os.getenv('SOCKET_BRIDGE_AUTHKEY', '').encode('utf-8')
+
+# every message starts with its kind, the channel (ie bridge) on the connection, its ctr, the number of frames and its flags (as in Bridge_pipe)
+# followed by the size of each frame and the frames themselves
+_HEADER = struct.Struct('<BIqIB')
+_SIZE = struct.Struct('<Q')
+# a channel is opened once per connection with the bridge's name as only frame, data and close messages then only carry the channel number
+_OPEN, _DATA, _CLOSE = 0, 1, 2
+# frames written with a single sendmsg call, well below IOV_MAX
+_MAX_WRITE_FRAMES = 64
+# every connection starts with a challenge by the receiver, which the sender answers with its hmac under the authkey, the receiver then accepts or closes the connection
+_CHALLENGE_SIZE = 32
+_ACCEPTED = b'\x01'
+
+
+def _digest(authkey, challenge):
+    return hmac.new(authkey, challenge, 'sha256').digest()
+
+
+def _address(location):
+    # the host part of a location (host:port) is where the receiving side listens
+    host, port = parse_location(location)[0].rsplit(':', 1)
+    return host, int(port)
+
+
+class _Connection(Logger):
+    """
+    Sending side: one tcp connection per event loop and receiving host, shared by all bridges of that loop to that host.
+    Written without blocking (like Bridge_pipe): what does not fit into the socket is kept and written once it is writable again.
+    Messages of 'control' bridges are queued ahead of those of 'bulk' bridges (but behind a message that is partly written), so that they do not wait behind sensor data.
+    """
+    # (loop, address) -> _Connection
+    _open = {}
+
+    connect_timeout = SOCKET_BRIDGE_CONNECT_TIMEOUT
+    close_timeout = SOCKET_BRIDGE_CLOSE_TIMEOUT
+
+    @classmethod
+    def get(cls, address, authkey):
+        loop = asyncio.get_event_loop()
+        if (loop, address) not in cls._open:
+            cls._open[(loop, address)] = cls(address, authkey, loop)
+        return cls._open[(loop, address)]
+
+    def __init__(self, address, authkey, loop):
+        super().__init__()
+        self.address = address
+        self.authkey = authkey
+        self._loop = loop
+        self._sock = None
+        # (control, parts) per message, the first one might be partly written
+        self._outbox = deque()
+        self._partial = False
+        self._channels = {}
+        self._n_open = 0
+        # the receiver might not listen yet, keep trying in the background, everything sent meanwhile is kept in the outbox
+        self._connecting = loop.create_task(self._connect())
+
+    def __str__(self) -> str:
+        return f"<{self.__class__.__name__}>:{self.address[0]}:{self.address[1]}"
+
+    def _connect_address(self):
+        host, port = self.address
+        return (host if host != '' else 'localhost', port)
+
+    def _connected(self, sock):
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._sock = sock
+        self.debug('Connected')
+        if len(self._outbox) > 0:
+            self._loop.add_writer(self._sock.fileno(), self._flush)
+
+    async def _connect(self):
+        deadline = time.time() + self.connect_timeout
+        while True:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.setblocking(False)
+            try:
+                await self._loop.sock_connect(sock, self._connect_address())
+                challenge = await self._recv_challenge(sock)
+                await self._loop.sock_sendall(sock, _digest(self.authkey, challenge))
+                accepted = await self._loop.sock_recv(sock, len(_ACCEPTED))
+                break
+            except OSError as err:
+                sock.close()
+                if time.time() > deadline:
+                    self.error(f'Could not connect within {self.connect_timeout}s: {err}')
+                    return
+            await asyncio.sleep(0.05)
+        self._authenticated(sock, accepted)
+
+    async def _recv_challenge(self, sock):
+        challenge = b''
+        while len(challenge) < _CHALLENGE_SIZE:
+            part = await self._loop.sock_recv(sock, _CHALLENGE_SIZE - len(challenge))
+            if len(part) == 0:
+                raise ConnectionError('Receiver closed the connection before its challenge')
+            challenge += part
+        return challenge
+
+    def _authenticated(self, sock, accepted):
+        # an empty answer: the receiver closed the connection, as our digest did not match
+        if accepted != _ACCEPTED:
+            sock.close()
+            self.error('Receiver refused our authkey (SOCKET_BRIDGE_AUTHKEY has to be the same on all hosts), dropping everything sent to it')
+            self._sock = None
+            self._outbox.clear()
+            return False
+        self._connected(sock)
+        return True
+
+    def _connect_blocking(self):
+        # we are closing before the receiver accepted us, our loop might not run anymore, so connect right here
+        self._connecting.cancel()
+        deadline = time.time() + self.connect_timeout
+        while time.time() < deadline:
+            sock = None
+            try:
+                sock = socket.create_connection(self._connect_address(), timeout=max(0.1, deadline - time.time()))
+                challenge = b''
+                while len(challenge) < _CHALLENGE_SIZE:
+                    part = sock.recv(_CHALLENGE_SIZE - len(challenge))
+                    if len(part) == 0:
+                        raise ConnectionError('Receiver closed the connection before its challenge')
+                    challenge += part
+                sock.sendall(_digest(self.authkey, challenge))
+                accepted = sock.recv(len(_ACCEPTED))
+                sock.setblocking(False)
+                return self._authenticated(sock, accepted)
+            except OSError:
+                if sock is not None:
+                    sock.close()
+                time.sleep(0.05)
+        self.error(f'Could not connect within {self.connect_timeout}s, dropping {self._n_queued()} bytes')
+        return False
+
+    def open_channel(self, name, control=False):
+        # all messages of a channel use the same lane, so that none of them overtakes its open or close
+        channel = len(self._channels)
+        self._channels[name] = channel
+        self._n_open += 1
+        encoded = name.encode('utf-8')
+        self.send([_HEADER.pack(_OPEN, channel, 0, 1, 0) + _SIZE.pack(len(encoded)), encoded], control)
+        return channel
+
+    def close_channel(self, channel, control=False):
+        self.send([_HEADER.pack(_CLOSE, channel, -1, 0, 0)], control)
+        self._n_open -= 1
+        if self._n_open == 0:
+            self._close()
+
+    def send(self, parts, control=False):
+        if self._sock is not None and len(self._outbox) == 0:
+            # sendmsg takes a limited number of buffers (IOV_MAX), but protocol 5 makes every array in e.g. a list its own frame
+            sent = 0
+            while len(parts) > 0:
+                try:
+                    n = self._sock.sendmsg(parts[:_MAX_WRITE_FRAMES])
+                except BlockingIOError:
+                    break
+                parts = _skip(parts, n)
+                sent += n
+            if len(parts) == 0:
+                return
+            self._loop.add_writer(self._sock.fileno(), self._flush)
+            self._partial = sent > 0
+            self._outbox.append((control, parts))
+            return
+        if not control:
+            # keep the order: wait behind what is already queued
+            self._outbox.append((False, parts))
+            return
+        # behind the partly written message and the control messages already queued
+        i = 1 if self._partial else 0
+        while i < len(self._outbox) and self._outbox[i][0]:
+            i += 1
+        self._outbox.insert(i, (True, parts))
+
+    def _n_queued(self):
+        return sum(memoryview(part).nbytes for _, parts in self._outbox for part in parts)
+
+    def _write_outbox(self):
+        parts = []
+        for _, message in self._outbox:
+            parts.extend(message)
+            if len(parts) >= _MAX_WRITE_FRAMES:
+                break
+        try:
+            n = self._sock.sendmsg(parts[:_MAX_WRITE_FRAMES])
+        except BlockingIOError:
+            return
+        while n > 0:
+            control, message = self._outbox[0]
+            size = sum(memoryview(part).nbytes for part in message)
+            if n < size:
+                self._outbox[0] = (control, _skip(message, n))
+                self._partial = True
+                return
+            self._outbox.popleft()
+            self._partial = False
+            n -= size
+
+    def _flush(self):
+        self._write_outbox()
+        if len(self._outbox) == 0:
+            self._loop.remove_writer(self._sock.fileno())
+
+    def _close(self):
+        # our loop might be closed right after this, so write the rest now, as long as the receiver keeps reading
+        self._open.pop((self._loop, self.address), None)
+        if self._sock is None and not self._connect_blocking():
+            return
+        self._loop.remove_writer(self._sock.fileno())
+        deadline = time.time() + self.close_timeout
+        while len(self._outbox) > 0 and time.time() < deadline:
+            select.select([], [self._sock], [], max(0, deadline - time.time()))
+            self._write_outbox()
+        if len(self._outbox) > 0:
+            self.error(f'Receiver did not read the last {self._n_queued()} bytes within {self.close_timeout}s, dropping them')
+            self._outbox.clear()
+        self._sock.close()
+
+
+class _Listener(Logger):
+    """
+    Receiving side: one server per process and listening address, which hands the messages of all incoming connections to the registered bridges by their name.
+    Runs on a loop in a thread of its own, so that it keeps serving bridges on other threads, no matter which of their loops ends first, until the last bridge deregistered.
+    """
+    # address -> _Listener
+    _open = {}
+    _open_lock = th.Lock()
+
+    @classmethod
+    def get(cls, address, authkey):
+        with cls._open_lock:
+            if address not in cls._open:
+                cls._open[address] = cls(address, authkey)
+            return cls._open[address]
+
+    def __init__(self, address, authkey):
+        super().__init__()
+        self.address = address
+        self.authkey = authkey
+        # bound right here, so that a second process listening on the same address fails when readying its bridges instead of waiting for messages forever
+        try:
+            self._sock = socket.create_server(address)
+        except OSError as err:
+            raise RuntimeError(f'{self} could not listen: {err}. Only one process per host:port can receive from other hosts.') from err
+        self._lock = th.Lock()
+        self.bridges = {}
+        # messages for bridges that are not registered yet (ie the sender was faster than our node became ready)
+        self._pending = {}
+        self._loop = asyncio.new_event_loop()
+        self._server = None
+        self._thread = th.Thread(target=self._run, name=str(self), daemon=True)
+        self._thread.start()
+
+    def __str__(self) -> str:
+        return f"<{self.__class__.__name__}>:{self.address[0]}:{self.address[1]}"
+
+    # listener thread
+    def _run(self):
+        asyncio.set_event_loop(self._loop)
+        self._server = self._loop.run_until_complete(asyncio.start_server(self._serve, sock=self._sock))
+        self.debug('Listening')
+        try:
+            self._loop.run_forever()
+        finally:
+            self._server.close()
+            # close the connections of senders that are still open
+            connections = asyncio.all_tasks(self._loop)
+            for task in connections:
+                task.cancel()
+            self._loop.run_until_complete(asyncio.gather(*connections, self._server.wait_closed(), return_exceptions=True))
+            self._loop.run_until_complete(asyncio.sleep(0))
+            self._loop.close()
+
+    # bridge thread
+    def register(self, bridge):
+        with self._lock:
+            self.bridges[bridge.name] = bridge
+            # before anything the listener dispatches once we release the lock
+            for message in self._pending.pop(bridge.name, []):
+                bridge._receive(*message)
+
+    # bridge thread
+    def deregister(self, bridge):
+        with self._lock:
+            self.bridges.pop(bridge.name, None)
+            if len(self.bridges) > 0:
+                return
+        with self._open_lock:
+            self._open.pop(self.address, None)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+    # listener thread
+    def _dispatch(self, name, message):
+        with self._lock:
+            bridge = self.bridges.get(name)
+            if bridge is None:
+                self._pending.setdefault(name, []).append(message)
+                return
+        try:
+            bridge._loop.call_soon_threadsafe(bridge._receive, *message)
+        except RuntimeError:
+            # the receiving loop is already closed
+            pass
+
+    # listener thread
+    async def _authenticate(self, reader, writer):
+        challenge = os.urandom(_CHALLENGE_SIZE)
+        writer.write(challenge)
+        answer = await reader.readexactly(len(_digest(self.authkey, challenge)))
+        if not hmac.compare_digest(answer, _digest(self.authkey, challenge)):
+            self.error(f"Refused connection from {writer.get_extra_info('peername')}: wrong authkey")
+            return False
+        writer.write(_ACCEPTED)
+        return True
+
+    # listener thread
+    async def _serve(self, reader, writer):
+        writer.get_extra_info('socket').setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        channels = {}
+        try:
+            # nothing is decoded before the sender proved that it knows our authkey
+            if not await self._authenticate(reader, writer):
+                return
+            while True:
+                kind, channel, ctr, n_frames, flags = _HEADER.unpack(await reader.readexactly(_HEADER.size))
+                sizes = struct.unpack(f'<{n_frames}Q', await reader.readexactly(n_frames * _SIZE.size)) if n_frames > 0 else ()
+                frames = [await reader.readexactly(size) for size in sizes]
+                if kind == _DATA and not flags & _COMPRESSED:
+                    # readexactly returns bytes, which codecs would decode into read-only arrays (decompressed and piped frames are writable)
+                    frames = [bytearray(frame) for frame in frames]
+                if kind == _OPEN:
+                    channels[channel] = str(frames[0], 'utf-8')
+                else:
+                    self._dispatch(channels[channel], (kind, ctr, flags, frames))
+        except asyncio.IncompleteReadError:
+            # the sender closed the connection
+            pass
+        except asyncio.CancelledError:
+            # the last bridge deregistered while the sender is still connected (see _run), which asyncio would otherwise log as error
+            pass
+        finally:
+            writer.close()
+
+
+class Bridge_socket(Frames_encoder, Bridge):
+    """
+    Bridge between hosts over tcp, the host part of the receiving location (host:port:process:thread) is the address the receiving side listens on.
+
+    All bridges from one event loop to the same host share one connection (TCP_NODELAY), each message is framed by the sizes of its frames (see _HEADER).
+    The receiving side reads with asyncio streams on a listener thread of its process, the sending side writes without blocking, keeping what does not fit until the socket is writable again (as Bridge_pipe).
+    Items are encoded by the bridge's codec, falling back to pickle.
+
+    Decoding pickled frames runs arbitrary code, so the receiving side only reads from connections that proved knowing the authkey (SOCKET_BRIDGE_AUTHKEY, the same on all hosts of a graph) by a hmac challenge.
+    Bridges are not created without one. The frames themselves are neither encrypted nor signed, so use trusted networks (or tunnel them) only.
+
+    Both ends find each other by the bridge's name (the connection's compact string), which therefore has to be the same on both hosts.
+    Only one process per host:port can receive from other hosts (checked when locking the graph), use different ports for multiple receiving processes on one machine.
+    """
+
+    encodes = True
+    authkey = SOCKET_BRIDGE_AUTHKEY
+
+    # _build thread
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        if len(self.authkey) == 0:
+            raise ValueError('Sending items between hosts requires a shared authkey, set SOCKET_BRIDGE_AUTHKEY to the same secret on all hosts')
+        if self.blocks():
+            self.warn('Capacity of blocking connections is not enforced across hosts')
+
+        # _from thread
+        self._conn = None
+        self._channel = None
+        self._control = False
+
+        # _to thread
+        self._loop = None
+        self._listener = None
+        self._inbox = deque()
+        self._waiter = None
+        self._closed = False
+
+    # _computer thread
+    def ready_send(self):
+        self._conn = _Connection.get(_address(self._to), self.authkey)
+        self._control = self.priority == 'control'
+        self._channel = self._conn.open_channel(self.name, self._control)
+
+    # _computer thread
+    def ready_recv(self):
+        self._loop = asyncio.get_event_loop()
+        self._listener = _Listener.get(_address(self._to), self.authkey)
+        self._listener.register(self)
+
+    # _build thread
+    @classmethod
+    def check_received(cls, bridges):
+        processes = {}
+        for bridge in bridges:
+            host, process, _ = parse_location(bridge._to)
+            processes.setdefault(host, set()).add(process)
+        for host, ps in processes.items():
+            if len(ps) > 1:
+                raise ValueError(f'Nodes of processes {sorted(ps)} receive from other hosts on {host}. Only one process per host:port can receive from other hosts, use different ports.')
+
+    # _build thread
+    @classmethod
+    def honors(cls, capacity=None, overflow='block', compression=None):
+        # drop policies are applied by the receiver, but blocking is not enforced across hosts
+        return not (capacity is not None and overflow == 'block') and super().honors(capacity, overflow, compression)
+
+    # _build thread
+    @staticmethod
+    def can_handle(_from, _to, _data_type=None):
+        # the only bridge across hosts, the receiving host needs a port to listen on
+        from_host, _, _ = parse_location(_from)
+        to_host, _, _ = parse_location(_to)
+        return from_host != to_host and to_host.rsplit(':', 1)[1] != '', 8
+
+    # _from thread
+    def put_encoded(self, ctr, encoded):
+        # the encoded frames may be shared with other bridges, we only reference them
+        flags, sizes, frames, saved = encoded
+        self._conn.send([_HEADER.pack(_DATA, self._channel, ctr, len(frames), flags) + sizes] + frames, self._control)
+
+    # _from thread
+    def put(self, ctr, item):
+        self.put_encoded(ctr, self.encode(item))
+
+    # _from thread
+    def close(self):
+        self._conn.close_channel(self._channel, self._control)
+
+    # _to thread
+    def _receive(self, kind, ctr, flags, frames):
+        if kind == _CLOSE:
+            self._closed = True
+        else:
+            if flags & _COMPRESSED:
+                frames = self.compression.decompress(frames)
+            codec = Codec_pickle if flags & _FALLBACK else self.codec
+            self._inbox_append(self._inbox, (ctr, codec.decode(frames)))
+        if len(self._inbox) > 0 and self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+        self._check_closed()
+
+    # _to thread
+    def closed(self):
+        return self._closed
+
+    # _to thread
+    def empty(self):
+        return len(self._inbox) == 0 and len(self._read) == 0
+
+    # _to thread
+    def has_waiting(self):
+        return len(self._inbox) > 0
+
+    # _to thread
+    def closed_and_empty(self):
+        return self.closed() and self.empty()
+
+    # _to thread
+    async def update(self):
+        while len(self._inbox) == 0:
+            self._waiter = self._loop.create_future()
+            try:
+                await self._waiter
+            finally:
+                self._waiter = None
+        itm_ctr, item = self._inbox.popleft()
+        self._read[itm_ctr] = item
+        self._report_dropped()
+        return itm_ctr
+
+    # _to thread
+    async def onclose(self):
+        await super().onclose()
+        self._listener.deregister(self)
@@ -0,0 +1,77 @@
+import os
+import time
+from multiprocessing.sharedctypes import RawArray
+
+# send times of the last x ctrs are kept for the latency, receivers further behind than that are not sampled
+BRIDGE_STATS_SEND_TIMES = int(os.getenv('BRIDGE_STATS_SEND_TIMES', 256))
+
+# counters, each written by one side only: sender (put, bytes, bytes saved by compression, high water mark, send times), receiver (got, dropped, latencies)
+_PUT, _GOT, _DROPPED, _BYTES, _SAVED, _HIGH_WATER, _LATENCY_N, _LATENCY_SUM = range(8)
+# latency histogram: bucket i counts latencies below 2**i microseconds (and at least 2**(i-1))
+_HISTOGRAM = 8
+_N_BUCKETS = 32
+_SEND_TIMES = _HISTOGRAM + _N_BUCKETS
+
+
+class Bridge_stats():
+    """
+    Counters of one bridge: items put and got, bytes put (where known) and saved by compression, depth and its high water mark, and a histogram of the time from put to update.
+
+    Kept in shared memory, which is created with the bridge (ie in the _build thread before the computers fork), so that both ends write their side directly
+    and every process of the graph, e.g. the main process (see Graph.bridge_stats), reads the current numbers without any messages.
+    Both ends of a bridge between hosts only see their own side.
+
+    The send times are kept by ctr in a small ring, which the receiver looks up (both use time.monotonic, which is the same across processes).
+    """
+    n_send_times = BRIDGE_STATS_SEND_TIMES
+
+    # _build thread
+    def __init__(self):
+        self._v = RawArray('d', _SEND_TIMES + 2 * self.n_send_times)
+        # no ctr sent yet
+        self._v[_SEND_TIMES::2] = [-1] * self.n_send_times
+
+    # _from thread
+    def put(self, ctr, nbytes=0, saved=0):
+        v = self._v
+        v[_PUT] += 1
+        v[_BYTES] += nbytes
+        v[_SAVED] += saved
+        depth = v[_PUT] - v[_GOT] - v[_DROPPED]
+        if depth > v[_HIGH_WATER]:
+            v[_HIGH_WATER] = depth
+        slot = _SEND_TIMES + 2 * (ctr % self.n_send_times)
+        v[slot] = ctr
+        v[slot + 1] = time.monotonic()
+
+    # _to thread
+    def got(self, ctr, n_dropped=0):
+        v = self._v
+        v[_GOT] += 1
+        v[_DROPPED] = n_dropped
+        slot = _SEND_TIMES + 2 * (ctr % self.n_send_times)
+        if v[slot] == ctr:
+            latency = time.monotonic() - v[slot + 1]
+            v[_LATENCY_N] += 1
+            v[_LATENCY_SUM] += latency
+            v[_HISTOGRAM + min(int(latency * 1e6).bit_length(), _N_BUCKETS - 1)] += 1
+
+    def read(self):
+        v = self._v
+        put, got, dropped = int(v[_PUT]), int(v[_GOT]), int(v[_DROPPED])
+        n = int(v[_LATENCY_N])
+        return {
+            'put': put,
+            'got': got,
+            'dropped': dropped,
+            'depth': max(0, put - got - dropped),
+            'high_water': int(v[_HIGH_WATER]),
+            'bytes': int(v[_BYTES]),
+            'saved': int(v[_SAVED]),
+            'latency': {
+                'n': n,
+                'mean': v[_LATENCY_SUM] / n if n > 0 else None,
+                # upper bound in microseconds -> number of items
+                'histogram': {2 ** i: int(v[_HISTOGRAM + i]) for i in range(_N_BUCKETS) if v[_HISTOGRAM + i] > 0},
+            },
+        }
@@ -1,6 +1,6 @@
 import asyncio
-import queue
 import threading as th
+from collections import deque
 from livenodes.components.computer import parse_location
 
 from .bridge_abstract import Bridge
@@ -15,8 +15,20 @@ class Bridge_thread(Bridge):
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         # both threads
-        self.queue = queue.Queue()
+        # the sender appends to the inbox and only wakes the receiver's loop if it is currently waiting in update
+        self._inbox = deque()
+        self._waiting_lock = th.Lock()
+        self._waiter = None
         self.closed_event = th.Event()
+        # if the connection blocks, the sender waits for space in the inbox (notified by the receiver), either blocking in put or awaiting credit
+        # once the receiver stopped taking items the sender should not wait anymore
+        self._space = th.Condition(self._waiting_lock) if self.blocks() else None
+        # every input listener of the sending node awaits credit (see Node._await_input), so there may be several waiters
+        self._credit_waiters = set()
+        self._receiver_stopped = th.Event()
+
+        # _to thread
+        self._loop = None
 
     # _computer thread
     def ready_send(self):
@@ -26,7 +38,7 @@ class Bridge_thread(Bridge):
 
     # _computer thread
     def ready_recv(self):
-        pass
+        self._loop = asyncio.get_event_loop()
 
     # _build thread
     @staticmethod
@@ -39,23 +51,75 @@ class Bridge_thread(Bridge):
     # _from thread
     def close(self):
         self.closed_event.set()
+        # let the receiver check if it consumed everything
+        # if its loop is not known yet, its onclose will find the closed event set anyway
+        if self._loop is not None:
+            try:
+                self._loop.call_soon_threadsafe(self._check_closed)
+            except RuntimeError:
+                # the receiving loop is already closed
+                pass
         # if self.queue:
         #     if hasattr(self.queue, 'close'):
         #         self.queue.close()
         #     elif hasattr(self.queue, 'shutdown'):
         #         self.queue.shutdown()
 
+    # _from thread
+    def has_credit(self):
+        return self._space is None or len(self._inbox) < self.capacity or self._receiver_stopped.is_set()
+
+    # _from thread
+    async def wait_credit(self):
+        while not self.has_credit():
+            waiter = asyncio.get_event_loop().create_future()
+            with self._waiting_lock:
+                # re-check under the lock, the receiver might have taken an item since our last look
+                if self.has_credit():
+                    break
+                self._credit_waiters.add(waiter)
+            try:
+                await waiter
+            finally:
+                with self._waiting_lock:
+                    self._credit_waiters.discard(waiter)
+
     # _from thread
     def put(self, ctr, item):
-        self.queue.put_nowait((ctr, item))
+        with self._waiting_lock:
+            if self._space is not None:
+                # blocks until there is space in the receiver's inbox
+                # gives up if the receiver stopped taking items (e.g. it was stopped), as we would otherwise wait forever
+                while not self.has_credit():
+                    self._space.wait(timeout=0.1)
+                if self._receiver_stopped.is_set():
+                    return
+            self._inbox_append(self._inbox, (ctr, item))
+            waiter, self._waiter = self._waiter, None
+        if waiter is not None:
+            try:
+                self._loop.call_soon_threadsafe(self._wake, waiter)
+            except RuntimeError:
+                # the receiving loop is already closed, nothing to wake
+                pass
 
     # _to thread
-    async def onclose(self):
-        while True:
-            await asyncio.sleep(0.01)
-            if self.closed_and_empty():
-                self.debug('Closed Event set and queue empty -- telling multiprocessing data storage')
-                break
+    @staticmethod
+    def _wake(waiter):
+        if not waiter.done():
+            waiter.set_result(None)
+
+    # _to thread
+    def _give_credit(self):
+        # called with the waiting lock held, once the receiver took an item (or stopped taking them)
+        self._space.notify()
+        waiters, self._credit_waiters = self._credit_waiters, set()
+        for waiter in waiters:
+            try:
+                waiter.get_loop().call_soon_threadsafe(self._wake, waiter)
+            except RuntimeError:
+                # the sending loop is already closed, nothing to wake
+                pass
 
     # _to thread
     def closed(self):
@@ -63,22 +127,42 @@ class Bridge_thread(Bridge):
 
     # _to thread
     def empty(self):
-        return self.queue.empty() and self._read == {}
+        return len(self._inbox) == 0 and len(self._read) == 0
+
+    # _to thread
+    def has_waiting(self):
+        return self._inbox is not None and len(self._inbox) > 0
 
     def closed_and_empty(self):
         return self.closed() and self.empty()
 
     # _to thread
     async def update(self):
-        # # print('waiting for asyncio to receive a value')
-        got_item = False
-        while not got_item:
+        while len(self._inbox) == 0:
+            waiter = self._loop.create_future()
+            with self._waiting_lock:
+                # re-check under the lock, the sender might have appended since our last look
+                if len(self._inbox) > 0:
+                    break
+                self._waiter = waiter
             try:
-                itm_ctr, item = self.queue.get_nowait()
-                got_item = True
-            except queue.Empty:
-                await asyncio.sleep(0.001)
+                await waiter
+            except asyncio.CancelledError:
+                self._receiver_stopped.set()
+                if self._space is not None:
+                    with self._waiting_lock:
+                        self._give_credit()
+                raise
+            finally:
+                with self._waiting_lock:
+                    if self._waiter is waiter:
+                        self._waiter = None
+        with self._waiting_lock:
+            itm_ctr, item = self._inbox.popleft()
+            if self._space is not None:
+                self._give_credit()
         self._read[itm_ctr] = item
+        self._report_dropped()
         return itm_ctr
 
 
@@ -0,0 +1,252 @@
+import os
+import json
+import math
+import time
+import asyncio
+import argparse
+import platform
+import threading as th
+import multiprocessing as mp
+
+import numpy as np
+
+from livenodes.components.computer import parse_location
+
+import logging
+logger = logging.getLogger('livenodes')
+
+# measurements of the bridges on this machine, used by Multiprocessing_Data_Storage.resolve_bridge once they exist (ie calibrate was run), empty to disable
+BRIDGE_CALIBRATION_FILE = os.getenv('BRIDGE_CALIBRATION_FILE', os.path.join(os.path.expanduser('~'), '.cache', 'livenodes', 'bridge_calibration.json'))
+# payload sizes in bytes: 8 is sent as a float, all others as numpy arrays
+BRIDGE_CALIBRATION_PAYLOADS = [int(size) for size in os.getenv('BRIDGE_CALIBRATION_PAYLOADS', '8,1024,131072').split(',')]
+# payload size assumed for ports that do not declare one (see Port.payload_bytes)
+BRIDGE_CALIBRATION_DEFAULT_PAYLOAD = int(os.getenv('BRIDGE_CALIBRATION_DEFAULT_PAYLOAD', 1024))
+
+MP_CTX = mp.get_context('fork')
+
+# location pairs of each relationship between sender and receiver that can be measured on one machine
+RELATIONS = {
+    'local': ('1:1', '1:1'),
+    'thread': ('1:1', '1:2'),
+    'process': ('1:1', '2:1'),
+}
+
+
+def relation(_from, _to):
+    if _from == _to:
+        return 'local'
+    from_host, from_process, _ = parse_location(_from)
+    to_host, to_process, _ = parse_location(_to)
+    if from_host != to_host:
+        return 'host'
+    return 'thread' if from_process == to_process else 'process'
+
+
+def _payload(size):
+    return 1.0 if size <= 8 else np.random.rand(size // 8)
+
+
+def _in_loop(fn, *args):
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        return loop.run_until_complete(fn(*args))
+    finally:
+        loop.close()
+
+def _run_pair(rel, main, other):
+    # runs the coroutine function other where a receiver of the given relation would run and main right here, returns the result of main
+    if rel == 'local':
+        async def both():
+            task = asyncio.get_event_loop().create_task(other())
+            res = await main()
+            await task
+            return res
+        return _in_loop(both)
+
+    worker = (th.Thread if rel == 'thread' else MP_CTX.Process)(target=_in_loop, args=(other,))
+    worker.start()
+    try:
+        return _in_loop(main)
+    finally:
+        worker.join()
+
+def _barrier(rel):
+    return th.Barrier(2) if rel == 'thread' else MP_CTX.Barrier(2) if rel == 'process' else None
+
+async def _both_ready(barrier):
+    # within one thread, let the other side ready its ends (e.g. Bridge_local creates its queue in ready_send)
+    if barrier is None:
+        await asyncio.sleep(0)
+    else:
+        barrier.wait()
+
+def _latency(bridge_cls, rel, item, n):
+    # mean one-way time of a ping-pong between both ends in seconds
+    _from, _to = RELATIONS[rel]
+    ping = bridge_cls(_from=_from, _to=_to)
+    pong = bridge_cls(_from=_to, _to=_from)
+    ready = _barrier(rel)
+
+    async def echo():
+        ping.ready_recv()
+        pong.ready_send()
+        await _both_ready(ready)
+        for _ in range(n):
+            ctr = await ping.update()
+            _, value = ping.get(ctr)
+            pong.put(ctr, value)
+            del value
+            ping.discard_before(ctr)
+        pong.close()
+        await ping.onclose()
+
+    async def run():
+        pong.ready_recv()
+        ping.ready_send()
+        await _both_ready(ready)
+        # the first round trips include setting up both ends
+        warmup = min(10, n // 2)
+        for ctr in range(n):
+            if ctr == warmup:
+                start = time.perf_counter()
+            ping.put(ctr, item)
+            ctr = await pong.update()
+            pong.discard_before(ctr)
+        elapsed = time.perf_counter() - start
+        ping.close()
+        await pong.onclose()
+        return elapsed / (2 * (n - warmup))
+
+    return _run_pair(rel, run, echo)
+
+def _throughput(bridge_cls, rel, item, n):
+    # items per second the receiver gets, while the sender emits as fast as it can
+    _from, _to = RELATIONS[rel]
+    bridge = bridge_cls(_from=_from, _to=_to)
+    ready = _barrier(rel)
+
+    async def send():
+        bridge.ready_send()
+        await _both_ready(ready)
+        for ctr in range(n):
+            bridge.put(ctr, item)
+            if ctr % 100 == 0:
+                await asyncio.sleep(0)
+        bridge.close()
+
+    async def receive():
+        bridge.ready_recv()
+        await _both_ready(ready)
+        start = time.perf_counter()
+        for _ in range(n):
+            ctr = await bridge.update()
+            bridge.discard_before(ctr)
+        elapsed = time.perf_counter() - start
+        await bridge.onclose()
+        return n / elapsed
+
+    return _run_pair(rel, receive, send)
+
+
+def calibrate(bridges=None, payloads=None, n_latency=200, n_throughput=2000, path=None):
+    """
+    Measures latency (s) and throughput (items/s) of every bridge for each relation it can handle and each payload size, and writes them to path (default BRIDGE_CALIBRATION_FILE).
+    Bridges default to all registered ones, so that bridges of other packages compete on the same numbers.
+    Returns the calibration: {'machine': ..., 'results': {bridge name: {relation: {payload size: {'latency': s, 'throughput': items/s}}}}}
+    """
+    from livenodes import get_registry
+
+    if bridges is None:
+        get_registry().bridges.prefetch()
+        bridges = list(get_registry().bridges.values())
+    payloads = BRIDGE_CALIBRATION_PAYLOADS if payloads is None else payloads
+    path = BRIDGE_CALIBRATION_FILE if path is None else path
+
+    results = {}
+    for bridge_cls in bridges:
+        for rel, (_from, _to) in RELATIONS.items():
+            if not bridge_cls.can_handle(_from, _to)[0]:
+                continue
+            for size in payloads:
+                item = _payload(size)
+                try:
+                    measured = {'latency': _latency(bridge_cls, rel, item, n_latency), 'throughput': _throughput(bridge_cls, rel, item, n_throughput)}
+                except Exception as err:
+                    logger.warning(f'Could not calibrate {bridge_cls.__name__} ({rel}, {size} bytes): {err}')
+                    continue
+                logger.info(f"Calibrated {bridge_cls.__name__:>16} {rel:>8} {size:>8} bytes: {measured['latency'] * 1e6:8.1f} us, {measured['throughput']:10.0f} items/s")
+                results.setdefault(bridge_cls.__name__, {}).setdefault(rel, {})[str(size)] = measured
+
+    calibration = {'machine': platform.node(), 'results': results}
+    if path:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(calibration, f, indent=2)
+    _loaded.pop(path, None)
+    return calibration
+
+
+# path -> (mtime, calibration)
+_loaded = {}
+
+def load_calibration(path=None):
+    """Calibration of this machine from path (default BRIDGE_CALIBRATION_FILE), None if there is none."""
+    path = BRIDGE_CALIBRATION_FILE if path is None else path
+    if not path:
+        return None
+    try:
+        mtime = os.stat(path).st_mtime
+    except FileNotFoundError:
+        return None
+    if path not in _loaded or _loaded[path][0] != mtime:
+        with open(path) as f:
+            calibration = json.load(f)
+        if calibration.get('machine') != platform.node():
+            logger.warning(f"Bridge calibration {path} was measured on {calibration.get('machine')}, ignoring it. Please recalibrate.")
+            calibration = None
+        _loaded[path] = (mtime, calibration)
+    return _loaded[path][1]
+
+def rank_bridges(bridges, _from, _to, _data_type=None, calibration=None):
+    """
+    Orders the given bridge classes by their measurements for this connection: the lowest latency among those keeping up with the port's declared rate (see Port.rate),
+    the highest throughput if none does. Measurements of the payload size closest to the port's declared one (see Port.payload_bytes) are used.
+    Returns None if any of the bridges was not measured for this relation, in which case the static costs should be used.
+    """
+    results = (calibration or {}).get('results', {})
+    rel = relation(_from, _to)
+    payload_bytes = getattr(_data_type, 'payload_bytes', None) or BRIDGE_CALIBRATION_DEFAULT_PAYLOAD
+    rate = getattr(_data_type, 'rate', None)
+
+    measured = []
+    for bridge_cls in bridges:
+        sizes = results.get(bridge_cls.__name__, {}).get(rel)
+        if not sizes:
+            return None
+        size = min(sizes, key=lambda s: abs(math.log(int(s)) - math.log(payload_bytes)))
+        measured.append((bridge_cls, sizes[size]))
+
+    keeps_up = [(b, m) for b, m in measured if rate is None or m['throughput'] >= rate]
+    if len(keeps_up) > 0:
+        ranked = sorted(keeps_up, key=lambda t: t[1]['latency']) + sorted([t for t in measured if t not in keeps_up], key=lambda t: -t[1]['throughput'])
+    else:
+        ranked = sorted(measured, key=lambda t: -t[1]['throughput'])
+    return [b for b, _ in ranked]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Measure the bridges on this machine, so that connections use the fastest one.')
+    parser.add_argument('--path', default=BRIDGE_CALIBRATION_FILE, help='file to write the calibration to')
+    args = parser.parse_args(argv)
+
+    calibration = calibrate(path=args.path)
+    for name, relations in calibration['results'].items():
+        for rel, sizes in relations.items():
+            for size, m in sizes.items():
+                print(f"{name:>16} {rel:>8} {size:>8} bytes: {m['latency'] * 1e6:8.1f} us, {m['throughput']:10.0f} items/s")
+    print(f'Written to {args.path}')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+import pickle
+import struct
+
+import numpy as np
+
+
+class Codec():
+    """
+    Turns items into a list of frames (bytes-like objects) and back.
+
+    Bridges that serialize send the frames as they are, ie without joining them into one buffer.
+    On the receiving side every frame is read into its own buffer, so decode may keep references to them (e.g. numpy arrays over the frame).
+
+    Ports declare the codec of the values they carry (see Port.codec), bridges fall back to Codec_pickle for every item the codec does not accept.
+    """
+
+    @staticmethod
+    def accepts(item):
+        return True
+
+    @staticmethod
+    def encode(item):
+        raise NotImplementedError()
+
+    @staticmethod
+    def decode(frames):
+        raise NotImplementedError()
+
+
+class Codec_pickle(Codec):
+    # pickle protocol 5 hands out buffers (e.g. numpy arrays, also nested in dicts or lists) out-of-band instead of copying them into the stream
+    @staticmethod
+    def encode(item):
+        buffers = []
+        main = pickle.dumps(item, protocol=5, buffer_callback=buffers.append)
+        return [main] + [buffer.raw() for buffer in buffers]
+
+    @staticmethod
+    def decode(frames):
+        return pickle.loads(frames[0], buffers=frames[1:])
+
+
+# dtype string, ndim, followed by the shape
+_MAX_NDIM = 8
+_NDARRAY_HEADER = struct.Struct(f'<16sB{_MAX_NDIM}q')
+
+class Codec_ndarray(Codec):
+    # numpy arrays of plain dtypes as a small header and their raw bytes
+    @staticmethod
+    def accepts(item):
+        return isinstance(item, np.ndarray) \
+            and not item.dtype.hasobject \
+            and item.dtype.fields is None \
+            and item.ndim <= _MAX_NDIM \
+            and len(item.dtype.str) <= 16
+
+    @staticmethod
+    def encode(item):
+        shape = tuple(item.shape) + (0,) * (_MAX_NDIM - item.ndim)
+        header = _NDARRAY_HEADER.pack(item.dtype.str.encode('ascii'), item.ndim, *shape)
+        return [header, np.ascontiguousarray(item).reshape(-1).view(np.uint8).data]
+
+    @staticmethod
+    def decode(frames):
+        dtype, ndim, *shape = _NDARRAY_HEADER.unpack(frames[0])
+        dtype = np.dtype(dtype.rstrip(b'\x00').decode('ascii'))
+        return np.frombuffer(frames[1], dtype=dtype).reshape(shape[:ndim])
+
+
+class Codec_str_list(Codec):
+    # lists of strings (e.g. channel names) as their number and the null-separated utf-8 bytes
+    @staticmethod
+    def accepts(item):
+        return type(item) is list and all(type(x) is str and '\x00' not in x for x in item)
+
+    @staticmethod
+    def encode(item):
+        return [str(len(item)).encode('ascii'), '\x00'.join(item).encode('utf-8')]
+
+    @staticmethod
+    def decode(frames):
+        if bytes(frames[0]) == b'0':
+            return []
+        return str(frames[1], 'utf-8').split('\x00')
+
+
+def get_codec(port):
+    """
+    Codec of the values the given port (class or instance) emits, Codec_pickle if the port does not declare one.
+    Ports may declare the codec class directly or by its name in the codec registry.
+    """
+    codec = getattr(port, 'codec', None)
+    if codec is None:
+        return Codec_pickle
+    if isinstance(codec, str):
+        from livenodes import get_registry
+        return get_registry().codecs.get_class(codec)
+    return codec
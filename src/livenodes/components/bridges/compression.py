@@ -0,0 +1,81 @@
+import os
+import zlib
+import lzma
+
+# messages (all frames of an item) smaller than this are sent as they are
+COMPRESSION_THRESHOLD = int(os.getenv('COMPRESSION_THRESHOLD', 1024))
+# adaptive compression measures the ratio (sent / raw bytes) over this many compressed messages
+COMPRESSION_ADAPTIVE_WINDOW = int(os.getenv('COMPRESSION_ADAPTIVE_WINDOW', 16))
+# and sends the next COMPRESSION_ADAPTIVE_RETRY messages as they are if it was above this, before measuring again (the data might have changed)
+COMPRESSION_ADAPTIVE_MAX_RATIO = float(os.getenv('COMPRESSION_ADAPTIVE_MAX_RATIO', 0.9))
+COMPRESSION_ADAPTIVE_RETRY = int(os.getenv('COMPRESSION_ADAPTIVE_RETRY', 1000))
+
+# fast levels, as items are compressed while they are emitted
+COMPRESSION_METHODS = {
+    'zlib': (lambda frame: zlib.compress(frame, 1), zlib.decompress),
+    'lzma': (lambda frame: lzma.compress(frame, preset=1), lzma.decompress),
+}
+
+
+class Compressor():
+    """
+    Compresses the frames of encoded items for bridges that serialize (see Bridge.encodes), set per connection (see Connection.default_settings).
+
+    Every frame is compressed on its own, so that the codecs decode the same frames as without compression.
+    Messages below the threshold and messages that would not get smaller are sent as they are, which the bridges mark in their header.
+    In adaptive mode, compression is switched off for a while once it does not save enough, e.g. for noisy sensor data.
+    """
+    adaptive_window = COMPRESSION_ADAPTIVE_WINDOW
+    adaptive_max_ratio = COMPRESSION_ADAPTIVE_MAX_RATIO
+    adaptive_retry = COMPRESSION_ADAPTIVE_RETRY
+
+    # _build thread
+    def __init__(self, method, threshold=None, adaptive=False):
+        if method not in COMPRESSION_METHODS:
+            raise ValueError(f'Unknown compression: {method}. Available: {list(COMPRESSION_METHODS)}')
+        self.method = method
+        self.threshold = COMPRESSION_THRESHOLD if threshold is None else threshold
+        self.adaptive = adaptive
+        self._compress, self._decompress = COMPRESSION_METHODS[method]
+
+        # _from thread
+        self._window_n = 0
+        self._window_raw = 0
+        self._window_sent = 0
+        self._skip = 0
+
+    def key(self):
+        # bridges compressing the same way may share the encoding of an item
+        return self.method, self.threshold, self.adaptive
+
+    # _from thread
+    def compress(self, frames):
+        # returns the compressed frames and the bytes saved, None if the frames should be sent as they are
+        raw = sum(memoryview(frame).nbytes for frame in frames)
+        if raw < self.threshold:
+            return None
+        if self._skip > 0:
+            self._skip -= 1
+            return None
+        compressed = [self._compress(frame) for frame in frames]
+        sent = sum(len(frame) for frame in compressed)
+        if self.adaptive:
+            self._measure(raw, sent)
+        if sent >= raw:
+            return None
+        return compressed, raw - sent
+
+    # _from thread
+    def _measure(self, raw, sent):
+        self._window_n += 1
+        self._window_raw += raw
+        self._window_sent += sent
+        if self._window_n >= self.adaptive_window:
+            if self._window_sent > self.adaptive_max_ratio * self._window_raw:
+                self._skip = self.adaptive_retry
+            self._window_n, self._window_raw, self._window_sent = 0, 0, 0
+
+    # _to thread
+    def decompress(self, frames):
+        # writable, like the frames the bridges receive otherwise
+        return [bytearray(self._decompress(frame)) for frame in frames]
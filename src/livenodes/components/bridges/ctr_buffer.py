@@ -0,0 +1,48 @@
+import bisect
+from collections import deque
+
+
+class Ctr_buffer():
+    """
+    Items a bridge received, but its node did not process yet, by their ctr.
+
+    Every emitting node sends increasing ctrs, so they are kept in order in a deque next to a dict of the items:
+    lookups are a dict access and discarding everything up to a ctr pops from the front, ie neither depends on the number of pending ctrs.
+    """
+    __slots__ = ('_ctrs', '_items')
+
+    def __init__(self):
+        self._ctrs = deque()
+        self._items = {}
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, ctr):
+        return ctr in self._items
+
+    def __getitem__(self, ctr):
+        return self._items[ctr]
+
+    def __iter__(self):
+        # ctrs in order
+        return iter(self._ctrs)
+
+    def get(self, ctr, default=None):
+        return self._items.get(ctr, default)
+
+    def __setitem__(self, ctr, item):
+        if ctr not in self._items:
+            if len(self._ctrs) == 0 or ctr > self._ctrs[-1]:
+                self._ctrs.append(ctr)
+            else:
+                # should not happen, but keep the order if it does
+                bisect.insort(self._ctrs, ctr)
+        self._items[ctr] = item
+
+    def pop_until(self, ctr):
+        # removes and returns all items up to and including ctr
+        popped = []
+        while len(self._ctrs) > 0 and self._ctrs[0] <= ctr:
+            popped.append(self._items.pop(self._ctrs.popleft()))
+        return popped
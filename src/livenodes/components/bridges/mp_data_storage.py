@@ -1,13 +1,23 @@
+import time
 import asyncio
+import numpy as np
 from livenodes.components.node_logger import Logger
 from livenodes.components.connection import Connection
 from livenodes import get_registry
 
+from .shared_pool import Shared_Buffer_Pool
+from .codec import get_codec
+from .compression import Compressor
+from .calibration import load_calibration, rank_bridges
+from .ctr_buffer import Ctr_buffer
+
 import logging
 logger = logging.getLogger('livenodes')
 
 # TODO: this should be part of Node class or at least a mixin?
 class Multiprocessing_Data_Storage(Logger):
+    report_every_x_seconds = 5
+
     # enpoints should be dicts with con.key: bridge
     def __init__(self, input_endpoints, output_endpoints) -> None:
         super().__init__()
@@ -21,7 +31,56 @@ class Multiprocessing_Data_Storage(Logger):
 
         for b in self.in_bridges.values():
             b.ready_recv()
+            # e.g. dropped items of bounded connections
+            b.register_reporter(self._report)
+
+        # one bit per input: which inputs received each pending ctr and which are closed and empty, so that nodes decide if a ctr is complete without looking at the bridges (see Node._should_process)
+        self.input_bits = {key: 1 << i for i, key in enumerate(self.in_bridges)}
+        self._bridge_bits = {id(b): self.input_bits[key] for key, b in self.in_bridges.items()}
+        self._arrived = Ctr_buffer()
+        self.closed_mask = 0
+        # called whenever an input closed, set by the node
+        self.on_input_closed = None
+
+        # (encoding groups, object bridges) per output, see _by_encoding
+        self._bridges = {channel: self._by_encoding(bl) for channel, bl in self.out_bridges.items()}
+
+        # large frames to consumers in other processes (on our host) are written once into a shared buffer pool and only handles are sent through these bridges
+        # bridges within our process or to other hosts keep receiving the item itself
+        self._pools = {}
+        self._pool_bridges = {}
+        self._pool_others = {}
+        for channel, bl in self.out_bridges.items():
+            cross = [b for b in bl if b.crosses_process() and not b.crosses_host()]
+            if len(cross) > 0:
+                self._pools[channel] = Shared_Buffer_Pool(n_consumers=len(cross), name=channel)
+                self._pool_bridges[channel] = cross
+                self._pool_others[channel] = self._by_encoding([b for b in bl if b not in cross])
+        self._pool_report_timer = None
+        self._stats_report_timer = None
+
+        # outputs whose items reach nodes in our process by reference
+        self._reference_channels = {channel for channel, bl in self.out_bridges.items() if any(not b.crosses_process() for b in bl)}
+
+        # inputs taken ahead of the others (see Node._await_input)
+        self._control_bridges = [b for b in self.in_bridges.values() if b.priority == 'control']
+
+        # receivers of connections that block hand back credit for every item they took, see wait_credit
+        self._credit_bridges = [b for bl in self.out_bridges.values() for b in bl if b.blocks()]
         
+    @staticmethod
+    def _by_encoding(bridges):
+        # bridges that serialize share one encoding per emit (grouped by how they encode, e.g. frames for pipes and sockets, by codec, which should be the same for all connections of an output, and by compression)
+        # all others, e.g. within our process, receive the item itself
+        by_codec = {}
+        for b in bridges:
+            if b.encodes:
+                by_codec.setdefault((type(b).encode, b.codec, b.compression.key() if b.compression is not None else None), []).append(b)
+        # unless there is nothing to share or compress
+        alone = [bl[0] for bl in by_codec.values() if len(bl) == 1 and bl[0].encodes_shared_only and bl[0].compression is None]
+        encoding = [bl for bl in by_codec.values() if bl[0] not in alone]
+        return encoding, [b for b in bridges if not b.encodes or b in alone]
+
     @staticmethod
     def resolve_bridge(connection: Connection):
         emit_loc = connection._emit_node.compute_on
@@ -32,30 +91,108 @@ class Multiprocessing_Data_Storage(Logger):
         # print('Bridging', emit_loc, recv_loc)
         # print('Bridging', parse_location(emit_loc), parse_location(recv_loc))
 
-        possible_bridges_pair = []
-        for bridge in get_registry().bridges.values():
-            can_handle, cost = bridge.can_handle(_from=emit_loc, _to=recv_loc)
-            if can_handle:
-                possible_bridges_pair.append((cost, bridge))
+        # bridges may specialize on what is sent, e.g. the codec and hints of the emitting port
+        data_type = type(connection._emit_port)
 
-        if len(possible_bridges_pair) == 0:
-            raise ValueError('No known bridge for connection', connection)
+        if connection.bridge is not None:
+            # explicitly chosen for this connection, it still has to be able to connect the two locations
+            try:
+                bridge_cls = get_registry().bridges.get_class(connection.bridge)
+            except KeyError:
+                raise ValueError(f'Unknown bridge {connection.bridge} for connection', connection)
+            if not bridge_cls.can_handle(_from=emit_loc, _to=recv_loc, _data_type=data_type)[0]:
+                raise ValueError(f'Bridge {connection.bridge} cannot handle connection', connection)
+            possible_bridges = [bridge_cls]
+        else:
+            possible_bridges_pair = []
+            for bridge in get_registry().bridges.values():
+                can_handle, cost = bridge.can_handle(_from=emit_loc, _to=recv_loc, _data_type=data_type)
+                if can_handle:
+                    possible_bridges_pair.append((cost, bridge))
 
-        possible_bridges = list(zip(*list(sorted(possible_bridges_pair, key=lambda t:t[0]))))[1]
+            if len(possible_bridges_pair) == 0:
+                raise ValueError('No known bridge for connection', connection)
+
+            possible_bridges = list(zip(*list(sorted(possible_bridges_pair, key=lambda t:t[0]))))[1]
+
+            # once the bridges were measured on this machine (see calibration.calibrate), rank them by their numbers instead of their static costs
+            # the numbers do not tell whether a bridge applies the connection's settings (e.g. its capacity), so only those that do are ranked
+            calibration = load_calibration()
+            if calibration is not None:
+                honoring = [b for b in possible_bridges if b.honors(connection.capacity, connection.overflow, connection.compression)]
+                possible_bridges = (len(honoring) > 0 and rank_bridges(honoring, emit_loc, recv_loc, data_type, calibration)) or possible_bridges
         logger.debug(f'Possible Bridges in order: {possible_bridges}')
         logger.info(f'Using Bridge: {possible_bridges[0]}')
+
+        compression = None
+        if connection.compression is not None:
+            if possible_bridges[0].encodes:
+                compression = Compressor(connection.compression, threshold=connection.compression_threshold, adaptive=connection.compression_adaptive)
+            else:
+                logger.info(f'{possible_bridges[0].__name__} does not serialize items, sending them uncompressed ({connection})')
         
-        bridge = possible_bridges[0](_from=emit_loc, _to=recv_loc)
+        priority = connection.priority if connection.priority is not None else connection._emit_port.priority
+        bridge = possible_bridges[0](_from=emit_loc, _to=recv_loc, _data_type=data_type, codec=get_codec(connection._emit_port),
+                                     capacity=connection.capacity, overflow=connection.overflow, name=connection.serialize_compact(), compression=compression,
+                                     priority=priority)
         endpoint_send, endpoint_receive = bridge, bridge
         return endpoint_send, endpoint_receive
 
+    # _from thread
+    def passes_references(self, output_channel):
+        return output_channel in self._reference_channels
+
+    # _to thread
+    def control_waiting(self, bridge):
+        # whether an input other than the given bulk one has 'control' items that its listener could take right away
+        return bridge.priority != 'control' and any(b.has_waiting() for b in self._control_bridges)
+
+    # _to thread
+    def received(self, bridge, ctr):
+        # called for every item taken from one of our input bridges
+        self._arrived[ctr] = self._arrived.get(ctr, 0) | self._bridge_bits[id(bridge)]
+        bridge.stats.got(ctr, bridge.n_dropped)
+        self._report_stats()
+
+    # _to thread
+    def arrived(self, ctr):
+        # bits of the inputs that hold an item of this ctr
+        return self._arrived.get(ctr, 0)
+
+    # _to thread
+    def pending_ctrs(self):
+        # ctrs received but not processed (ie discarded) yet, in order
+        return list(self._arrived)
+
+    def bridge_stats(self):
+        return {b.name: b.stats.read() for b in self.in_bridges.values()}
+
+    # _to thread
+    def _report_stats(self, force=False):
+        # the receiving side reports the stats of its bridges every x seconds
+        now = time.time()
+        if force or self._stats_report_timer is None or now - self._stats_report_timer > self.report_every_x_seconds:
+            self._stats_report_timer = now
+            self._report(bridges=self.bridge_stats())
+
     # _to thread
     def all_closed(self):
         return all([b.closed() for b in self.in_bridges])
 
+    # _to thread
+    async def _input_closed(self, key, bridge):
+        await bridge.onclose()
+        # closed and empty does not change back
+        self.closed_mask |= self.input_bits[key]
+        if self.on_input_closed is not None:
+            self.on_input_closed()
+
     # _to thread
     async def on_all_closed(self):
-        await asyncio.gather(*[b.onclose() for b in self.in_bridges.values()])
+        await asyncio.gather(*[self._input_closed(key, b) for key, b in self.in_bridges.items()])
+        for b in self.in_bridges.values():
+            b.release_shared()
+        self._report_stats(force=True)
         self.info('All bridges empty and closed')
 
     # TODO: may be removed?
@@ -77,20 +214,74 @@ class Multiprocessing_Data_Storage(Logger):
     
     # _to thread
     def discard_before(self, ctr):
+        self._arrived.pop_until(ctr)
         for bridge in self.in_bridges.values():
-            bridge.discard_before(ctr) 
+            bridge.discard_before(ctr)
 
     # _from thread
     def put(self, output_channel, ctr, data):
         # # print('data storage putting value', connection._recv_port.key, type(self.bridges[connection._recv_port.key]))
         # we are the emitting part :D
         # for b in self.out_bridges[connection._emit_port.key]:
-        for b in self.out_bridges[output_channel]:
+        pool = self._pools.get(output_channel)
+        if pool is not None and pool.accepts(data):
+            handles = pool.write(data)
+            if handles is not None:
+                for b, handle in zip(self._pool_bridges[output_channel], handles):
+                    b.stats.put(ctr, data.nbytes)
+                    b.put(ctr, handle)
+                self._put_item(ctr, data, *self._pool_others[output_channel])
+                return
+            # no free slot: fall back to sending the frame through each bridge
+            self._report_pools(starved=output_channel)
+
+        self._put_item(ctr, data, *self._bridges[output_channel])
+
+    # _from thread
+    def _put_item(self, ctr, data, encoding_bridges, object_bridges):
+        for bl in encoding_bridges:
+            encoded = bl[0].encode(data)
+            nbytes, saved = bl[0].encoded_nbytes(encoded), bl[0].encoded_saved(encoded)
+            for b in bl:
+                b.stats.put(ctr, nbytes, saved)
+                b.put_encoded(ctr, encoded)
+        for b in object_bridges:
+            # objects are passed by reference within a process, the bytes of other bridges are only known for arrays
+            b.stats.put(ctr, data.nbytes if isinstance(data, np.ndarray) and b.crosses_process() else 0)
             b.put(ctr, data)
 
+    # _from thread
+    # _computer thread
+    async def wait_credit(self):
+        # credit-based flow control: resolves once every blocking receiver has room for our next item
+        # nodes await this before taking their next input (producers before producing it), so a slow node holds back everything upstream of it instead of filling queues
+        # as we are the only sender, credit does not shrink while we wait, so one pass is enough
+        for b in self._credit_bridges:
+            if not b.has_credit():
+                await b.wait_credit()
+
+    def pool_stats(self):
+        return {channel: pool.stats() for channel, pool in self._pools.items()}
+
+    # _from thread
+    def _report_pools(self, starved=None, force=False):
+        # starvation may happen for every emit while consumers are behind, so only report every x seconds
+        now = time.time()
+        if force or self._pool_report_timer is None or now - self._pool_report_timer > self.report_every_x_seconds:
+            self._pool_report_timer = now
+            if starved is not None:
+                self.warn(f'Shared buffer pool of channel {starved} starved, sending frames without pool')
+            self._report(pool=self.pool_stats())
+
     # _from thread
     def close_bridges(self):
         # close all bridges we put data into
         for bridge_list in self.out_bridges.values():
             for bridge in bridge_list:
                 bridge.close()
+
+        if any(pool.n_written > 0 for pool in self._pools.values()):
+            self._report_pools(force=True)
+        for pool in self._pools.values():
+            pool.close()
+        self._pools = {}
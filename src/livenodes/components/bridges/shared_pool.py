@@ -0,0 +1,256 @@
+import os
+import sys
+import asyncio
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from livenodes.components.node_logger import Logger
+
+SHM_POOL_SLOTS = int(os.getenv('SHM_POOL_SLOTS', 8))
+SHM_POOL_MIN_BYTES = int(os.getenv('SHM_POOL_MIN_BYTES', 65_536))  # Default to 64KB if not set
+
+# segment layout: [closed flag | padding][n_slots * n_consumers released flags | padding][n_slots * slot_size data]
+_ALIGN = 64
+
+def _align(n):
+    return (n + _ALIGN - 1) // _ALIGN * _ALIGN
+
+# segments this process is attached to, so that every handle of a segment re-uses the same mapping
+_attached = {}
+
+def _attach(name):
+    if name not in _attached:
+        _attached[name] = _Pool_Segment(name=name)
+    return _attached[name]
+
+
+class _Pool_Segment(shared_memory.SharedMemory):
+    # consumers hand out numpy views into the segment, which keep the underlying buffer exported
+    # closing (also via __del__) would then raise a BufferError, in which case we leave the mapping to be freed with its last view
+    def close(self):
+        try:
+            super().close()
+        except BufferError:
+            pass
+
+    def setup(self, n_slots, n_consumers, slot_size):
+        self.n_slots = n_slots
+        self.n_consumers = n_consumers
+        self.slot_size = slot_size
+        self.flags_offset = _ALIGN
+        self.data_offset = self.flags_offset + _align(n_slots * n_consumers)
+        return self
+
+    @classmethod
+    def create(cls, n_slots, n_consumers, slot_size):
+        flags_size = _align(n_slots * n_consumers)
+        seg = cls(create=True, size=_ALIGN + flags_size + n_slots * slot_size).setup(n_slots, n_consumers, slot_size)
+        # all slots start out released by all consumers
+        seg.buf[0] = 0
+        seg.buf[seg.flags_offset:seg.flags_offset + n_slots * n_consumers] = b'\x01' * (n_slots * n_consumers)
+        return seg
+
+    def _slot_flags(self, slot):
+        start = self.flags_offset + slot * self.n_consumers
+        return self.buf[start:start + self.n_consumers]
+
+    def is_free(self, slot):
+        return self._slot_flags(slot) == self._all_released
+
+    @property
+    def _all_released(self):
+        return b'\x01' * self.n_consumers
+
+    def occupied(self):
+        return sum(not self.is_free(slot) for slot in range(self.n_slots))
+
+    def all_free(self):
+        return self.occupied() == 0
+
+    def closed(self):
+        return self.buf[0] == 1
+
+    def mark_closed(self):
+        self.buf[0] = 1
+        self.unlink_if_released()
+
+    def unlink_if_released(self):
+        # whoever sees the segment closed and every slot released first removes it
+        # (emitter on close or the consumer releasing the last slot, both might race, hence the FileNotFoundError)
+        if self.closed() and self.all_free():
+            try:
+                self.unlink()
+            except FileNotFoundError:
+                pass
+            _attached.pop(self.name, None)
+
+
+class Pool_Handle():
+    """
+    Small, picklable reference to a frame inside a Shared_Buffer_Pool segment.
+    Sent over the bridges instead of the frame itself; resolved into a zero-copy view on the receiving side.
+    """
+    def __init__(self, name, slot, offset, shape, dtype, consumer, n_slots, n_consumers, slot_size):
+        self.name = name
+        self.slot = slot
+        self.offset = offset
+        self.shape = shape
+        self.dtype = dtype
+        self.consumer = consumer
+        self.n_slots = n_slots
+        self.n_consumers = n_consumers
+        self.slot_size = slot_size
+        self._view = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_view'] = None
+        return state
+
+    def _segment(self):
+        seg = _attach(self.name)
+        if not hasattr(seg, 'n_slots'):
+            seg.setup(self.n_slots, self.n_consumers, self.slot_size)
+        return seg
+
+    # _to thread
+    def resolve(self):
+        if self._view is None:
+            self._view = np.ndarray(self.shape, dtype=self.dtype, buffer=self._segment().buf, offset=self.offset)
+        return self._view
+
+    # _to thread
+    def referenced(self):
+        # references: self._view and getrefcount's argument
+        return self._view is not None and sys.getrefcount(self._view) > 2
+
+    # _to thread
+    def release(self):
+        self._view = None
+        seg = self._segment()
+        seg.buf[seg.flags_offset + self.slot * self.n_consumers + self.consumer] = 1
+        seg.unlink_if_released()
+
+
+class Shared_Buffer_Pool(Logger):
+    """
+    Shared memory slots for large numpy frames, that are emitted to one or more consumers in other processes.
+
+    The emitter writes a frame once and every consumer only receives a Pool_Handle.
+    Each consumer releases its handle once it processed the according ctr, a slot is re-used once all consumers released it.
+    If no slot is free (starvation), write returns None and the caller should send the frame as is.
+    """
+    n_slots = SHM_POOL_SLOTS
+    min_bytes = SHM_POOL_MIN_BYTES
+
+    # _from thread
+    def __init__(self, n_consumers, name=''):
+        super().__init__()
+        self.n_consumers = n_consumers
+        self.name = name
+
+        self._segment = None
+        self._next_slot = 0
+
+        self.n_written = 0
+        self.n_starved = 0
+        self.n_oversized = 0
+
+    def __str__(self) -> str:
+        return f"<{self.__class__.__name__}>:{self.name}"
+
+    def accepts(self, item):
+        return isinstance(item, np.ndarray) \
+            and item.nbytes >= self.min_bytes \
+            and not item.dtype.hasobject \
+            and item.dtype.fields is None
+
+    def _ensure_segment(self, nbytes):
+        if self._segment is not None and nbytes <= self._segment.slot_size:
+            return
+        if self._segment is not None:
+            # frames grew larger than our slots: retire the segment (it is removed once all consumers released it) and start a larger one
+            self.n_oversized += 1
+            self.info(f'Frame of {nbytes} bytes exceeds slot size {self._segment.slot_size}, re-allocating pool')
+            self._segment.mark_closed()
+        slot_size = _align(max(nbytes, 1 << (nbytes - 1).bit_length()))
+        self._segment = _Pool_Segment.create(self.n_slots, self.n_consumers, slot_size)
+        self._next_slot = 0
+
+    def _find_free_slot(self):
+        for i in range(self.n_slots):
+            slot = (self._next_slot + i) % self.n_slots
+            if self._segment.is_free(slot):
+                self._next_slot = slot + 1
+                return slot
+        return None
+
+    # _from thread
+    def write(self, item):
+        self._ensure_segment(item.nbytes)
+        seg = self._segment
+
+        slot = self._find_free_slot()
+        if slot is None:
+            self.n_starved += 1
+            return None
+
+        offset = seg.data_offset + slot * seg.slot_size
+        target = np.ndarray(item.shape, dtype=item.dtype, buffer=seg.buf, offset=offset)
+        np.copyto(target, item)
+        del target
+        seg._slot_flags(slot)[:] = b'\x00' * self.n_consumers
+        self.n_written += 1
+
+        return [Pool_Handle(seg.name, slot, offset, item.shape, item.dtype.str, consumer, seg.n_slots, seg.n_consumers, seg.slot_size) for consumer in range(self.n_consumers)]
+
+    def stats(self):
+        return {
+            'slots': self.n_slots,
+            'slot_size': self._segment.slot_size if self._segment is not None else 0,
+            'occupied': self._segment.occupied() if self._segment is not None else 0,
+            'written': self.n_written,
+            'starved': self.n_starved,
+            'reallocated': self.n_oversized,
+        }
+
+    # _from thread
+    def close(self):
+        if self._segment is not None:
+            self._segment.mark_closed()
+            self._segment = None
+
+
+class Pool_Releaser():
+    """
+    Consumer side helper: releases discarded handles once the node let go of their views.
+    The check is deferred to the next loop iteration, as discard_before is called while _process still references its inputs.
+    """
+    def __init__(self):
+        self._releasing = []
+        self._scheduled = False
+
+    def add(self, handle):
+        self._releasing.append(handle)
+        if not self._scheduled:
+            self._scheduled = True
+            asyncio.get_event_loop().call_soon(self.release)
+
+    def release(self):
+        self._scheduled = False
+        pinned = []
+        for handle in self._releasing:
+            if handle.referenced():
+                # the node kept the view (e.g. as state), keep the slot until it is dropped
+                pinned.append(handle)
+            else:
+                handle.release()
+        self._releasing = pinned
+
+    def close(self):
+        # the node finished: hand back everything, views that are still referenced stay valid as the mapping is only removed with them
+        for handle in self._releasing:
+            handle.release()
+        self._releasing = []
+
@@ -2,4 +2,5 @@
 from .utils import parse_location
 from .cmp_local import Processor_local
 from .cmp_thread import Processor_threads
-from .cmp_process import Processor_process
\ No newline at end of file
+from .cmp_process import Processor_process
+from .cmp_host import Processor_host, Host_agent
@@ -0,0 +1,238 @@
+import os
+import json
+import time
+import socket
+import argparse
+import importlib
+from itertools import groupby
+
+from livenodes.components.node_logger import Logger
+from livenodes.components.utils.utils import NumpyEncoder
+
+HOST_AGENT_PORT = int(os.getenv('HOST_AGENT_PORT', 7100))
+# time we wait for the agent's answer on top of the timeouts it was given for its own handshakes
+HOST_AGENT_REPLY_MARGIN = float(os.getenv('HOST_AGENT_REPLY_MARGIN', 5))
+
+
+# requests and replies are single json lines, the graph is sent as its compact dict (settings as when saving it to json)
+def _send(stream, msg):
+    stream.write(json.dumps(msg, cls=NumpyEncoder) + '\n')
+    stream.flush()
+
+def _recv(stream):
+    line = stream.readline()
+    if line == '':
+        raise ConnectionError('Connection closed')
+    return json.loads(line)
+
+def _address(agent):
+    # agents are given as host:port, the port defaulting to HOST_AGENT_PORT
+    host, _, port = agent.partition(':')
+    return (host if host != '' else 'localhost', int(port) if port != '' else HOST_AGENT_PORT)
+
+
+class Processor_host(Logger):
+    """
+    Runs the nodes of one host through the agent on that host (see Host_agent).
+
+    Mirrors the handshakes of the process computers: setup returns once all nodes on the host are ready, start, stop and close are forwarded to the agent.
+    The agent instantiates the nodes from the compact graph dict and connects them to the rest of the graph through the bridges between hosts.
+    """
+
+    @classmethod
+    def group_factory(cls, items, agents, graph, start_timeout=30, stop_timeout=30, close_timeout=30):
+        """
+        items:  tuples of (host, node)
+        agents: mapping from host (as in the node's compute_on) to the address of its agent (host:port)
+        graph:  compact dict of the whole graph
+        """
+        items = list(sorted(items, key=lambda t: t[0]))
+        l = len(items) if len(items) > 0 else 1
+
+        computers = []
+        for host, group in groupby(items, key=lambda t: t[0]):
+            nodes = [str(entry[-1]) for entry in group]
+            computers.append(cls(location=host, agent=agents[host], graph=graph, nodes=nodes, start_timeout=start_timeout / l, stop_timeout=stop_timeout / l, close_timeout=close_timeout / l))
+        return computers
+
+    def __init__(self, location, agent, graph, nodes, start_timeout=30, stop_timeout=30, close_timeout=30):
+        super().__init__()
+        self.location = location
+        self.agent = agent
+        self.graph = graph
+        self.nodes = nodes
+        self.start_timeout = start_timeout
+        self.stop_timeout = stop_timeout
+        self.close_timeout = close_timeout
+        self._sock = None
+        self._stream = None
+        self._finished = False
+        self.info(f'Creating {self.__class__.__name__} with {len(self.nodes)} nodes ({self.nodes[:10]}) at location {self.location} through agent {self.agent}')
+
+    def __str__(self):
+        return f"CMP-HS:{self.location}"
+
+    def _request(self, cmd, timeout=None, **kwargs):
+        self._sock.settimeout(None if timeout is None else timeout + HOST_AGENT_REPLY_MARGIN)
+        try:
+            _send(self._stream, {'cmd': cmd, **kwargs})
+            reply = _recv(self._stream)
+        except socket.timeout:
+            raise TimeoutError(f"Agent did not answer {cmd} request")
+        if not reply['ok']:
+            raise RuntimeError(f"Agent failed to {cmd}: {reply['error']}")
+        return reply
+
+    def setup(self):
+        self.info('Readying')
+        self._sock = socket.create_connection(_address(self.agent), timeout=self.start_timeout)
+        self._stream = self._sock.makefile('rw', encoding='utf-8')
+
+        self.info('Waiting for agent to be ready')
+        self._request('setup', timeout=self.start_timeout,
+                      graph=self.graph, nodes=self.nodes,
+                      start_timeout=self.start_timeout, stop_timeout=self.stop_timeout, close_timeout=self.close_timeout)
+        self.info('Agent ready handshake complete')
+
+    def start(self):
+        self.info('Starting')
+        self._request('start', timeout=self.start_timeout)
+
+    def is_finished(self):
+        if not self._finished and self._stream is not None:
+            try:
+                self._finished = self._request('is_finished', timeout=self.stop_timeout)['finished']
+            except (ConnectionError, TimeoutError) as err:
+                self.warn(f'Lost agent: {err}')
+                self._finished = True
+        return self._finished
+
+    def join(self, timeout=None):
+        self.info(f'Joining (timeout={timeout})')
+        deadline = None if timeout is None else time.time() + timeout
+        while not self.is_finished() and (deadline is None or time.time() < deadline):
+            time.sleep(0.1)
+
+    def stop(self):
+        self.info(f'Requesting agent stop with timeout {self.stop_timeout}')
+        try:
+            self._request('stop', timeout=self.stop_timeout)
+            self.info('Agent stop handshake complete')
+        except (ConnectionError, TimeoutError) as err:
+            self.warn(f'Agent did not acknowledge stop request: {err}')
+
+    def close(self):
+        self.info(f'Closing agent with timeout {self.close_timeout}')
+        try:
+            self._request('close', timeout=self.close_timeout)
+            self.info('Agent close handshake complete')
+        except (ConnectionError, TimeoutError) as err:
+            self.warn(f'Agent did not acknowledge close request: {err}')
+        self._stream.close()
+        self._sock.close()
+        self._stream = None
+        self._sock = None
+
+
+class Host_agent(Logger):
+    """
+    Runs the nodes of its host for a graph started elsewhere (see Processor_host).
+
+    One session per connection: setup instantiates the whole graph from the compact dict through the registry, locks only the nodes assigned to this host
+    and runs them in process computers, exactly as Graph.start_all does for local nodes. Their connections to other hosts resolve to bridges between hosts.
+    If the connection is lost, the nodes are stopped and closed.
+
+    Sessions are not authenticated, anyone who can connect may run the registered nodes with any settings. Only listen on other interfaces than localhost within trusted networks.
+    """
+
+    def __init__(self, host='127.0.0.1', port=HOST_AGENT_PORT):
+        super().__init__()
+        self.host = host
+        self.port = port
+        self.computers = []
+
+    def __str__(self):
+        return f"Agent:{self.host}:{self.port}"
+
+    def serve(self, sessions=None):
+        # serve the given number of sessions, forever if None
+        with socket.create_server((self.host, self.port)) as server:
+            self.info('Listening')
+            while sessions is None or sessions > 0:
+                conn, addr = server.accept()
+                self.info(f'Session from {addr}')
+                with conn:
+                    self._session(conn)
+                if sessions is not None:
+                    sessions -= 1
+
+    def _session(self, conn):
+        stream = conn.makefile('rw', encoding='utf-8')
+        try:
+            while True:
+                try:
+                    msg = _recv(stream)
+                except ConnectionError:
+                    break
+                try:
+                    reply = {'ok': True, **(getattr(self, f"_on_{msg['cmd']}")(msg) or {})}
+                except Exception as err:
+                    self.exception(err)
+                    reply = {'ok': False, 'error': repr(err)}
+                _send(stream, reply)
+                if msg['cmd'] == 'close':
+                    break
+        finally:
+            if len(self.computers) > 0:
+                self.warn('Session ended without close, stopping nodes')
+                self._on_stop(None)
+                self._on_close(None)
+            stream.close()
+
+    def _on_setup(self, msg):
+        # not imported at module level, as the nodes themselves depend on the computers
+        from livenodes import Node, Graph
+
+        graph = Graph(start_node=Node.from_compact_dict(msg['graph']))
+        nodes = [n for n in graph.nodes if str(n) in msg['nodes']]
+        missing = set(msg['nodes']) - set(map(str, nodes))
+        if len(missing) > 0:
+            raise ValueError(f'Nodes not in graph: {sorted(missing)}')
+
+        self.computers = graph.local_computers(nodes, start_timeout=msg['start_timeout'], stop_timeout=msg['stop_timeout'], close_timeout=msg['close_timeout'])
+        self.info('Created computers:', list(map(str, self.computers)))
+        for cmp in self.computers:
+            cmp.setup()
+        graph.release_bridges()
+
+    def _on_start(self, msg):
+        for cmp in self.computers:
+            cmp.start()
+
+    def _on_is_finished(self, msg):
+        return {'finished': all(cmp.is_finished() for cmp in self.computers)}
+
+    def _on_stop(self, msg):
+        for cmp in self.computers:
+            cmp.stop()
+
+    def _on_close(self, msg):
+        for cmp in self.computers:
+            cmp.close()
+        self.computers = []
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run the nodes of this host for LiveNodes graphs started on other hosts.')
+    parser.add_argument('--host', default='127.0.0.1', help="address to listen on, '' for all interfaces (only within trusted networks, sessions are not authenticated)")
+    parser.add_argument('--port', type=int, default=HOST_AGENT_PORT, help='port to listen on')
+    parser.add_argument('--modules', nargs='*', default=[], help='modules to import before serving, e.g. those registering the nodes of the graphs')
+    args = parser.parse_args(argv)
+
+    for module in args.modules:
+        importlib.import_module(module)
+    Host_agent(host=args.host, port=args.port).serve()
+
+
+if __name__ == "__main__":
+    main()
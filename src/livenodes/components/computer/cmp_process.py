@@ -1,4 +1,5 @@
 import multiprocessing as mp
+from multiprocessing import resource_tracker
 from .cmp_common import Processor_base, child_main
 from .cmp_thread import Processor_threads
 
@@ -24,6 +25,9 @@ class Processor_process(Processor_base):
         return MP_CTX.Queue()
 
     def _make_worker(self, args, name):
+        # bridges and pools create shared memory inside the workers, start the resource tracker here, so that all workers share it
+        # otherwise each worker starts its own tracker, which unlinks the segments on worker exit, even if other processes still use them
+        resource_tracker.ensure_running()
         # spawn a child process using the shared child_main entrypoint
         return MP_CTX.Process(target=child_main, args=args, name=name)
 
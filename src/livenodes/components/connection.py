@@ -1,15 +1,70 @@
+# what a bridge does, if the receiving node has `capacity` items waiting and another one is emitted:
+#   block: the sender waits until the receiver took an item
+#   drop_oldest: the oldest waiting item is discarded
+#   drop_newest: the new item is discarded
+#   latest: only the latest item is kept (capacity is always 1)
+OVERFLOW_POLICIES = ['block', 'drop_oldest', 'drop_newest', 'latest']
+# stdlib codecs the frames of bridges that serialize may be compressed with (see bridges.compression)
+COMPRESSION_METHODS = ['zlib', 'lzma']
+# priority classes of connections: items of 'control' connections are sent and taken ahead of 'bulk' ones where bridges share a transport or a node's event loop
+PRIORITIES = ['bulk', 'control']
+
 class Connection():
+    # connection settings and their defaults, only non-default values are serialized
+    default_settings = {
+        # None: unbounded
+        "capacity": None,
+        "overflow": 'block',
+        # name of the bridge (in the bridge registry) to use instead of the one chosen by location and port (see Multiprocessing_Data_Storage.resolve_bridge)
+        "bridge": None,
+        # compress items sent through bridges that serialize (e.g. between processes and hosts) with one of COMPRESSION_METHODS, None: send them as they are
+        "compression": None,
+        # items smaller than this (in bytes) are not compressed, None: COMPRESSION_THRESHOLD
+        "compression_threshold": None,
+        # stop compressing for a while, if it does not save enough
+        "compression_adaptive": False,
+        # one of PRIORITIES, None: the priority of the emitting port (see Port.priority)
+        "priority": None,
+    }
+
     # TODO: consider creating a channel registry instead of using strings?
     def __init__(self,
                  emit_node: 'Connectionist',
                  recv_node: 'Connectionist',
                  emit_port: 'Port',
-                 recv_port: 'Port'):
+                 recv_port: 'Port',
+                 capacity: int = None,
+                 overflow: str = 'block',
+                 bridge: str = None,
+                 compression: str = None,
+                 compression_threshold: int = None,
+                 compression_adaptive: bool = False,
+                 priority: str = None):
         self._emit_node = emit_node
         self._recv_node = recv_node
         self._emit_port = emit_port
         self._recv_port = recv_port
 
+        if capacity is not None and capacity < 1:
+            raise ValueError(f'Capacity must be at least 1 or None (unbounded). Got: {capacity}')
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f'Unknown overflow policy: {overflow}. Available: {OVERFLOW_POLICIES}')
+        if compression is not None and compression not in COMPRESSION_METHODS:
+            raise ValueError(f'Unknown compression: {compression}. Available: {COMPRESSION_METHODS}')
+        if priority is not None and priority not in PRIORITIES:
+            raise ValueError(f'Unknown priority: {priority}. Available: {PRIORITIES}')
+        self.capacity = capacity
+        self.overflow = overflow
+        self.bridge = bridge
+        self.compression = compression
+        self.compression_threshold = compression_threshold
+        self.compression_adaptive = compression_adaptive
+        self.priority = priority
+
+    def settings(self):
+        # non-default settings of this connection
+        return {key: getattr(self, key) for key, default in self.default_settings.items() if getattr(self, key) != default}
+
     def __repr__(self):
         return f"{str(self._emit_node)}.{str(self._emit_port)} -> {str(self._recv_node)}.{str(self._recv_port)}"
 
@@ -33,7 +88,8 @@ class Connection():
             "emit_node": str(self._emit_node),
             "recv_node": str(self._recv_node),
             "emit_port": self._emit_port.key,
-            "recv_port": self._recv_port.key
+            "recv_port": self._recv_port.key,
+            **self.settings()
         }
 
     def __eq__(self, other):
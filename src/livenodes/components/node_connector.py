@@ -85,7 +85,7 @@ class Connectionist(Logger):
         #     raise ValueError(f'No possible input ports for key: {key} in node: {str(self)}')
         # return possible_ins[0]
         try:
-            return getattr(self.ports_in, key)
+            return self.ports_in._get(key)
         except Exception as err:
             self.debug(self, key)
             raise err
@@ -97,7 +97,7 @@ class Connectionist(Logger):
         #     raise ValueError(f'No possible output ports for key: {key} in node: {str(self)}')
         # return possible_outs[0]
         try:
-            return getattr(self.ports_out, key)
+            return self.ports_out._get(key)
         except Exception as err:
             self.debug(self, key)
             raise err
@@ -135,10 +135,12 @@ class Connectionist(Logger):
     def add_input(self,
                   emit_node: 'Connectionist',
                   emit_port: Port,
-                  recv_port: Port):
+                  recv_port: Port,
+                  **settings):
         """
         Add one input to self via attributes.
         Main function to connect two nodes together with connect_inputs_to
+        Further keyword arguments are settings of the connection (see Connection.default_settings), e.g. capacity and overflow.
         """
 
         # === Check if ports are available
@@ -169,7 +171,8 @@ class Connectionist(Logger):
         connection = Connection(emit_node,
                                 self,
                                 emit_port=emit_port,
-                                recv_port=recv_port)
+                                recv_port=recv_port,
+                                **settings)
 
         if len(list(filter(connection.__eq__, self.input_connections))) > 0:
             raise ValueError("Connection already exists.")
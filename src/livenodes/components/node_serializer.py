@@ -83,7 +83,8 @@ class Serializer():
                     items_instc[name].add_input(
                         emit_node = items_instc[con["emit_node"]],
                         emit_port = items_instc[con["emit_node"]].get_port_out_by_key(con['emit_port']),
-                        recv_port = items_instc[name].get_port_in_by_key(con['recv_port'])
+                        recv_port = items_instc[name].get_port_in_by_key(con['recv_port']),
+                        **{key: con[key] for key in Connection.default_settings if key in con}
                         )
                 except Exception as err:
                     if ignore_connection_errors:
@@ -105,17 +106,25 @@ class Serializer():
             cfg, ins, name = self.compact_settings()
             nodes = {name: cfg}
             inputs = ins
+            connections = self.input_connections
         else:
             nodes = {}
             inputs = []
+            connections = []
             # this does not include duplicates, as discover_graph removes them
             for node in self.discover_graph(self, direction='both', sort=True):
                 # the main reason for the implementation here is to support the macro node in the ln_macro package
                 cfg, ins, name = node.compact_settings()
                 nodes[name] = cfg
                 inputs.extend(ins)
+                connections.extend(node.input_connections)
 
-        return {'Nodes': nodes, 'Inputs': inputs}
+        res = {'Nodes': nodes, 'Inputs': inputs}
+        # settings of connections, that differ from the defaults (e.g. capacity), keyed by their compact string
+        settings = {con.serialize_compact(): con.settings() for con in connections if len(con.settings()) > 0}
+        if len(settings) > 0:
+            res['Connections'] = settings
+        return res
 
 
     @classmethod
@@ -125,9 +134,10 @@ class Serializer():
         for node_str, cfg in items['Nodes'].items():
             dct[node_str] = {'settings': cfg, 'inputs': [], **Connectionist.str_to_dict(node_str)}
 
+        settings = items.get('Connections', {})
         for inp in items['Inputs']:
             con = Connection.deserialize_compact(inp)
-            dct[con['recv_node']]['inputs'].append(con)
+            dct[con['recv_node']]['inputs'].append({**con, **settings.get(inp, {})})
 
         return cls.from_dict(dct, initial_node=initial_node, ignore_connection_errors=ignore_connection_errors, **kwargs)
 
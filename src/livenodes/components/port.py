@@ -16,35 +16,57 @@ ALL_VALUES = [
 
 class Ports_collection():
     # this is the problem we had with NamedTuple summed up: https://peps.python.org/pep-0557/#mutable-default-values
+    # ports are declared as class attributes, their keys are collected once per class (in the order of dir()), so that nodes look up ports without scanning the attributes
+    __slots__ = ('_ports', '_by_key', '_default')
+    _keys = ()
+
+    def __init_subclass__(cls):
+        super().__init_subclass__()
+        cls._keys = tuple(key for key in dir(cls) if not key.startswith('_') and isinstance(getattr(cls, key), Port))
+
     def __init__(self):
-        for key in self._itr_helper():
+        for key in self._keys:
             # set the key of the port to the key its located under in the port collection 
             setattr(self, key, getattr(self, key).contextualize(key))
+        self._ports = tuple(getattr(self, key) for key in self._keys)
+        self._by_key = dict(zip(self._keys, self._ports))
+        # nodes emit on this port if they do not name one
+        self._default = self._ports[0] if len(self._ports) > 0 else None
     
     def __iter__(self):
-        for key in self._itr_helper():
-            yield getattr(self, key)
-    
-    def _itr_helper(self):
-        for key in dir(self):
-            if not key.startswith('_') and isinstance(getattr(self, key), Port):
-                yield key
+        return iter(self._ports)
 
     def __len__(self):
-        return len(list(self._itr_helper()))
+        return len(self._ports)
+
+    def _get(self, key):
+        # AttributeError as getattr, if there is no port with this key
+        try:
+            return self._by_key[key]
+        except KeyError:
+            raise AttributeError(f'{self.__class__.__name__} has no port {key}') from None
 
     def _asdict(self):
-        return {key: getattr(self, key) for key in self._itr_helper()}
+        return dict(self._by_key)
     
     @property
     def _fields(self):
-        return list(self._itr_helper())
+        return list(self._keys)
 
 
 class Port():
     example_values = []
     compound_type = None
     label = 'No Label Set'
+    # codec (class or name in the codec registry) bridges use to serialize values of this port, None falls back to pickle
+    codec = None
+    # hints on the values of this port, which bridges may use to specialize (see Bridge.can_handle), None if unknown
+    # typical size of one value in bytes
+    payload_bytes = None
+    # typical number of values emitted per second
+    rate = None
+    # one of connection.PRIORITIES, e.g. 'control' for annotations and status, which should not wait behind bulk sensor data
+    priority = 'bulk'
 
     def __init__(self, label=None, optional=False, key=None):
         if label is not None:
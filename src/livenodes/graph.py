@@ -1,6 +1,7 @@
 from collections import defaultdict
 from .node import Node
-from .components.computer import parse_location, Processor_process
+from .components.computer import parse_location, Processor_process, Processor_host
+from .components.bridges import Multiprocessing_Data_Storage
 from .components.node_logger import Logger
 
 class Graph(Logger):
@@ -11,6 +12,7 @@ class Graph(Logger):
         self.nodes = Node.discover_graph(start_node)
 
         self.computers = []
+        self.bridges = {}
 
         self.info(f'Handling {len(self.nodes)} nodes.')
 
@@ -22,29 +24,88 @@ class Graph(Logger):
     #     for node in self.nodes:
     #         settings[str(node)] == node.
 
-    def lock_all(self):
+    def lock_all(self, nodes=None):
         # Lock all nodes for processing (ie no input/output or setting changes allowed from here on)
         # also resolves bridges between nodes soon to be bridges across computers
-        bridges = {str(n): {'emit': defaultdict(list), 'recv': {}} for n in self.nodes}
+        # if nodes are given, only those are locked (e.g. the ones of this host), the others are run elsewhere and resolve their own side of the bridges
+        nodes = self.nodes if nodes is None else nodes
+        bridges = {str(n): {'emit': defaultdict(list), 'recv': {}} for n in nodes}
 
-        for node in self.nodes:
+        for node in nodes:
             send_bridges, recv_bridges = node.lock()
 
             # one node can output/emit to multiple other nodes!
             # these connections may be unique, but at this point we don't really care about where they go, just that the output differs
             for con, bridge in send_bridges:
-                bridges[str(con._emit_node)]['emit'][con._emit_port.key].append(bridge)
+                if str(con._emit_node) in bridges:
+                    bridges[str(con._emit_node)]['emit'][con._emit_port.key].append(bridge)
+
+            # outputs to nodes that are not locked here are resolved by us, as their receiving side is resolved wherever they run
+            for con in node.output_connections:
+                if str(con._recv_node) not in bridges:
+                    bridge, _ = Multiprocessing_Data_Storage.resolve_bridge(con)
+                    bridges[str(node)]['emit'][con._emit_port.key].append(bridge)
 
             # currently we only have one input connection per channel on each node
             # TODO: change this if we at some point allow multiple inputs per channel per node
             for con, bridge in recv_bridges:
                 bridges[str(con._recv_node)]['recv'][con._recv_port.key] = bridge
 
+        # e.g. only one process per address may receive from other hosts (see Bridge_socket)
+        received = [b for node_bridges in bridges.values() for b in node_bridges['recv'].values()]
+        for bridge_cls in {type(b) for b in received}:
+            bridge_cls.check_received([b for b in received if type(b) is bridge_cls])
+
+        self.bridges = bridges
         return bridges
 
-    def start_all(self, start_timeout=30, stop_timeout=30, close_timeout=30):
+    def _resolved_bridges(self):
+        # every bridge resolved here once, the emit and recv side of a connection between two nodes locked here are the same object
+        resolved = {}
+        for node_bridges in self.bridges.values():
+            for bridge in [b for bl in node_bridges['emit'].values() for b in bl] + list(node_bridges['recv'].values()):
+                resolved[id(bridge)] = bridge
+        return list(resolved.values())
+
+    def bridge_stats(self):
+        # current stats of all bridges resolved here, both ends write them into shared memory, so this includes the nodes in other processes
+        # (but not those of other hosts)
+        return {bridge.name: bridge.stats.read() for bridge in self._resolved_bridges()}
+
+    def release_bridges(self):
+        # once the computers are set up (ie forked), the bridges between nodes in processes of their own are no longer used here (see Bridge.release_parent)
+        released = 0
+        for bridge in self._resolved_bridges():
+            if parse_location(bridge._from)[1] != '' and parse_location(bridge._to)[1] != '':
+                bridge.release_parent()
+                released += 1
+        self.info(f'Released {released} bridges')
+
+    def local_computers(self, nodes, start_timeout=30, stop_timeout=30, close_timeout=30):
+        # locks the given nodes and creates the computers running them in this host
+        self.info('Locking nodes and resolving bridges')
+        bridges = self.lock_all(nodes)
+
+        self.info('Resolving computers')
+        locations = [parse_location(n.compute_on) for n in nodes]
+        return Processor_process.group_factory(
+            items=[(process, thread, node) for (_, process, thread), node in zip(locations, nodes)],
+            bridges=bridges,
+            start_timeout=start_timeout,
+            stop_timeout=stop_timeout, 
+            close_timeout=close_timeout 
+        )
+
+    def start_all(self, start_timeout=30, stop_timeout=30, close_timeout=30, agents=None):
+        """
+        agents: mapping from host (as in the nodes' compute_on) to the address (host:port) of the agent running that host's nodes (see Host_agent).
+                Nodes on all other hosts are run here.
+        """
         self.info(f'Starting all {len(self.nodes)} nodes (set timeouts: start={start_timeout}, stop={stop_timeout}, close={close_timeout})')
-        hosts, processes, threads = list(zip(*[parse_location(n.compute_on) for n in self.nodes]))
+        agents = {} if agents is None else agents
+        hosts = [parse_location(n.compute_on)[0] for n in self.nodes]
+        local_nodes = [n for host, n in zip(hosts, self.nodes) if host not in agents]
+        remote_items = [(host, n) for host, n in zip(hosts, self.nodes) if host in agents]
 
         # required for asyncio to work for local nodes
         # not required for threading, as there its already implemented.
@@ -54,26 +115,24 @@ class Graph(Logger):
 
         # not sure yet if this should be called externally yet...
         # TODO: this should only be called if there are local nodes, so maybe we should clean up the computer mess we currently have and resolve that by adding a local computer and clear hierarchy? -yh
-        self.info('Locking all nodes and resolving bridges')
-        bridges = self.lock_all()
-
-        # ignore hosts for now, as we do not have an implementation for them atm
-        # host_group = groupby(sorted(zip(hosts, self.nodes), key=lambda t: t[0]))
-        # for host in hosts:
-
-        self.info('Resolving computers')
-        self.computers = Processor_process.group_factory(
-            items=zip(processes, threads, self.nodes),
-            bridges=bridges,
-            start_timeout=start_timeout,
-            stop_timeout=stop_timeout, 
-            close_timeout=close_timeout 
-        )
+        self.computers = self.local_computers(local_nodes, start_timeout=start_timeout, stop_timeout=stop_timeout, close_timeout=close_timeout)
+
+        # nodes of other hosts are run by their agents, which build them from the serialized graph
+        if len(remote_items) > 0:
+            self.computers += Processor_host.group_factory(
+                items=remote_items,
+                agents=agents,
+                graph=self.start_node.to_compact_dict(graph=True),
+                start_timeout=start_timeout,
+                stop_timeout=stop_timeout,
+                close_timeout=close_timeout
+            )
 
         self.info('Created computers:', list(map(str, self.computers)))
         self.info('Setting up computers')
         for cmp in self.computers:
             cmp.setup()
+        self.release_bridges()
 
         self.info('Starting up computers')
         for cmp in self.computers:
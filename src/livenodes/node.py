@@ -1,9 +1,11 @@
+import os
 import sys
 import asyncio
 from functools import partial
 import multiprocessing as mp
 import pathlib
 import traceback
+import numpy as np
 
 from .components.utils.perf import Time_Per_Call, Time_Between_Call
 from .components.port import Port
@@ -14,6 +16,36 @@ from .components.node_serializer import Serializer
 from .components.bridges import Multiprocessing_Data_Storage
 
 INSTALL_LOC = str(pathlib.Path(__file__).parent.resolve())
+# mark emitted arrays read-only, if they are passed by reference to nodes in our process (see Node.freeze_emitted)
+FREEZE_EMITTED_ARRAYS = bool(int(os.getenv('FREEZE_EMITTED_ARRAYS', 0)))
+# how often emitted values are checked against their port, if assertions are enabled (see Node.type_check)
+#   always: every value
+#   first: the first EMIT_TYPE_CHECK_N values of each output
+#   every: every EMIT_TYPE_CHECK_N-th value of each output (starting with the first)
+#   signature: the first value of each signature of each output and every EMIT_TYPE_CHECK_N-th value of it after that
+#              (its type, the types along the first elements of nested lists and tuples, dtype and ndim of numpy arrays)
+EMIT_TYPE_CHECKS = ['always', 'first', 'every', 'signature']
+EMIT_TYPE_CHECK = os.getenv('EMIT_TYPE_CHECK', 'signature')
+EMIT_TYPE_CHECK_N = int(os.getenv('EMIT_TYPE_CHECK_N', 100))
+
+def _signature(data):
+    # what the type check of a value mostly depends on, without looking at all of it (see EMIT_TYPE_CHECKS)
+    if isinstance(data, np.ndarray):
+        return type(data), data.dtype, data.ndim
+    if isinstance(data, (list, tuple)) and len(data) > 0:
+        return (type(data), *_signature(data[0]))
+    return (type(data),)
+
+def freeze(data):
+    # marks numpy arrays, also nested in lists, tuples and dicts, read-only (in place)
+    if isinstance(data, np.ndarray):
+        data.flags.writeable = False
+    elif isinstance(data, (list, tuple)):
+        for item in data:
+            freeze(item)
+    elif isinstance(data, dict):
+        for item in data.values():
+            freeze(item)
 
 class Node(Connectionist, Logger, Serializer):
     # === Information Stuff =================
@@ -25,6 +57,16 @@ class Node(Connectionist, Logger, Serializer):
 
     example_init = {}
 
+    # nodes in the same process receive emitted objects by reference, ie every in-place change of an array is seen by all of them (and the emitter)
+    # if set, emitted arrays are marked read-only instead, so that receivers do not need defensive copies and in-place changes raise right away
+    # arrays a node keeps as state must then be copied before being emitted (or changed after emitting)
+    freeze_emitted = FREEZE_EMITTED_ARRAYS
+
+    # checking every emitted value can cost more than processing it (e.g. nested lists), so by default only new kinds of values are checked, see EMIT_TYPE_CHECKS
+    # python -O still disables all checks
+    type_check = EMIT_TYPE_CHECK
+    type_check_n = EMIT_TYPE_CHECK_N
+
     # === Basic Stuff =================
     def __init__(self,
                  name="Name",
@@ -40,6 +82,12 @@ class Node(Connectionist, Logger, Serializer):
 
         self.should_time = should_time
         self.compute_on = compute_on
+
+        if self.type_check not in EMIT_TYPE_CHECKS:
+            raise ValueError(f'Unknown type check: {self.type_check}. Available: {EMIT_TYPE_CHECKS}')
+        # output -> number of emitted values, (output, signature) of values that passed the type check -> number of values since that check
+        self._n_emitted = {}
+        self._checked_signatures = {}
         # Fix this on creation such that we can still identify a node if it was pickled into another (spawned) process
         self._id_ = id(self)
         
@@ -70,7 +118,7 @@ class Node(Connectionist, Logger, Serializer):
         return id(self)
 
     # === Connection Stuff =================
-    def add_input(self, emit_node: 'Node', emit_port:Port, recv_port:Port):
+    def add_input(self, emit_node: 'Node', emit_port:Port, recv_port:Port, **settings):
         if not isinstance(emit_node, Node):
             raise ValueError("Emitting Node must be of instance Node. Got:",
                              emit_node)
@@ -79,7 +127,7 @@ class Node(Connectionist, Logger, Serializer):
             self.info(recv_port.accepts_inputs(emit_port.example_values))
             raise ValueError(f'Port {str(emit_port)} cannot input into {str(recv_port)}')
 
-        return super().add_input(emit_node, emit_port, recv_port)
+        return super().add_input(emit_node, emit_port, recv_port, **settings)
 
     # # === Subclass Validation Stuff =================
     def __init_subclass__(self, abstract_class=False):
@@ -152,6 +200,7 @@ class Node(Connectionist, Logger, Serializer):
         self.debug('unique recv endpoints', [str(b) for b in input_endpoints.values()])
 
         self.data_storage = Multiprocessing_Data_Storage(input_endpoints, output_endpoints)
+        self.data_storage.register_reporter(self._report)
 
         if not self.locked.is_set():
             self.error('Forgot to lock node')
@@ -167,10 +216,20 @@ class Node(Connectionist, Logger, Serializer):
             self.info("Node has no input connections, please make sure it calls self._finish once it's done")
         self._setup_process()
 
-        # pre-compute required keys for _should_process
+        # pre-compute the bits of the required keys for _should_process
         # all keys that are non-optional or if optional, but connected
+        # keys not present in the storage bridges (ie the node is wrongly connected) get a bit that is never set, so they stay required
         # see _should_process for more details
-        self._required_keys = [(x.key, not x.key in self.data_storage.in_bridges) for x in self.ports_in if not x.optional or self._is_input_connected(x)]
+        self._input_bits = dict(self.data_storage.input_bits)
+        self._required_mask = 0
+        for x in self.ports_in:
+            if not x.optional or self._is_input_connected(x):
+                if x.key not in self._input_bits:
+                    self._input_bits[x.key] = 1 << len(self._input_bits)
+                self._required_mask |= self._input_bits[x.key]
+        # nodes overriding _should_process decide on the values, all others on the bits of the storage
+        self._default_should_process = type(self)._should_process is Node._should_process
+        self.data_storage.on_input_closed = self._on_input_closed
 
         return self._finished
 
@@ -234,7 +293,13 @@ class Node(Connectionist, Logger, Serializer):
     async def _await_input(self, queue):
         while True:
             try:
+                # only take the next input once our receivers have room for what we might emit (see Connection overflow 'block')
+                await self.data_storage.wait_credit()
+                # update does not yield while bulk items are waiting, so let the listeners of our 'control' inputs take theirs first (see Connection priority)
+                if self.data_storage.control_waiting(queue):
+                    await asyncio.sleep(0)
                 ctr = await queue.update()
+                self.data_storage.received(queue, ctr)
                 self._process(ctr)
             except asyncio.CancelledError:
                 break
@@ -299,26 +364,47 @@ class Node(Connectionist, Logger, Serializer):
         #     self.warn('_emit_data should only be called by nodes directly if they know what they ')
 
         if channel is None:
-            channel = list(self.ports_out._asdict().values())[0].key
+            channel = self.ports_out._default.key
         elif isinstance(channel, Port):
             channel = channel.key
         elif type(channel) == str:
             # self.info(f'Call by str will be deprecated, got: {channel}', [p.key for p in self.ports_out])
-            if channel not in [p.key for p in self.ports_out]:
+            if channel not in self.ports_out._by_key:
                 #._fields:
                 raise ValueError(f'Unknown Port {str(self)}.{channel}')
 
         clock = self._ctr if ctr is None else ctr
 
         if __debug__:
-            # checks if the sent data adhere to the set port type
-            val_ok, msg = self.get_port_out_by_key(channel).check_value(data)
-            assert val_ok, f"Error: {msg}; On channel: {str(self)}.{channel}"
+            self._check_emitted(channel, data)
+
+        if self.freeze_emitted and self.data_storage.passes_references(channel):
+            freeze(data)
 
         self.debug(f'Emitting data of {type(data)} over {channel} at clock: {clock} / ctr: {ctr}')
         self.data_storage.put(channel, clock, data)
 
 
+    def _check_emitted(self, channel, data):
+        # checks if the sent data adhere to the set port type, as often as our type_check says
+        signature = None
+        if self.type_check == 'signature':
+            signature = (channel, *_signature(data))
+            n = self._checked_signatures.get(signature)
+            # values of a known signature may still differ further in (e.g. the last element of a list), so check one in type_check_n of them
+            if n is not None and n < self.type_check_n:
+                self._checked_signatures[signature] = n + 1
+                return
+        elif self.type_check != 'always':
+            n = self._n_emitted[channel] = self._n_emitted.get(channel, 0) + 1
+            if (self.type_check == 'first' and n > self.type_check_n) or (self.type_check == 'every' and (n - 1) % self.type_check_n != 0):
+                return
+
+        val_ok, msg = self.get_port_out_by_key(channel).check_value(data)
+        assert val_ok, f"Error: {msg}; On channel: {str(self)}.{channel}"
+        if signature is not None:
+            self._checked_signatures[signature] = 1
+
     def _process(self, ctr):
         """
         called in location of self
@@ -338,7 +424,11 @@ class Node(Connectionist, Logger, Serializer):
 
         # check if all required data to proceed is available and then call process
         # then cleanup aggregated data and advance our own clock
-        if self._should_process(**_current_data):
+        if self._default_should_process:
+            should_process = self._ready(self.data_storage.arrived(ctr))
+        else:
+            should_process = self._should_process(**_current_data)
+        if should_process:
             self.debug('[Processed]', ctr, _current_data.keys())
             self._ctr = ctr
             emit_data = self._call_user_fn_process(self.process, 'process', **_current_data, _ctr=ctr)
@@ -391,23 +481,30 @@ class Node(Connectionist, Logger, Serializer):
         1. All non-optional inputs must be present unless their bridge is closed, they may be None
         2. Optional inputs must be present if the input port is connected, but can be omitted if the bridge is closed
         -> psudeo: (optional and connected) or not closed
-        "not closed" is more expensive to calc so we hope for early termination in the first condition as those values do not change, we should pre-calc them in _on_start or similar
-        -> see ready() for the pre-calculation
+        Both are kept as bits (see ready() for the pre-calculation and Multiprocessing_Data_Storage for the closed ones), so that this does not depend on the number of inputs
+        Unless overridden, _process does not call this, but checks the bits of the inputs that received the ctr directly
         """
-        given_keys = set(kwargs.keys())
-        required_keys = set([key for key, key_not_in_bridge in self._required_keys if
-            # the key is required as long as the bridge is not closed and empty
-            # if the key is is not present in the storage bridges, the node is wrongly connected, but the key should still be required
-            # if key_not_in_bridge or returns True early not evaluating the second part
-            # if key_not_in_bridge is false (ie the key is present), the second part determines if the whole statement is true
-            (key_not_in_bridge or \
-            not self.data_storage.in_bridges[key].closed_and_empty())
-        ])
+        given = 0
+        for key in kwargs:
+            given |= self._input_bits.get(key, 0)
+        return self._ready(given)
 
+    def _ready(self, given):
+        # the key is required as long as the bridge is not closed and empty
         # it's okay if we get more keys than are needed
         # e.g. we might get one key, whose bridge is then closed and get the other key later
         # then the given would move from {1} to {1, 2} and the required would have moved from {1, 2} to {2} => given >= required
-        return given_keys >= required_keys
+        return self._required_mask & ~(given | self.data_storage.closed_mask) == 0
+
+    # _computer thread
+    def _on_input_closed(self):
+        # ctrs that were skipped waiting for this input are complete now
+        # the closed bit is set a few loop iterations after the last item arrived, so nodes overriding _should_process decide again as well
+        for ctr in self.data_storage.pending_ctrs():
+            if self._ctr is not None and ctr <= self._ctr:
+                continue
+            if not self._default_should_process or self._ready(self.data_storage.arrived(ctr)):
+                self._process(ctr)
 
     def process_time_series(self, ts):
         return ts
@@ -71,6 +71,11 @@ class Producer(Node, abstract_class=True):
 
         # finish either if no data is present anymore or parent told us to stop (via stop() -> _onstop())
         while not self.stop_event.is_set():
+            # if our receivers block, wait until they have room, so that we produce at the speed of the slowest node downstream
+            await self.data_storage.wait_credit()
+            if self.stop_event.is_set():
+                break
+
             if not fn():
                 # generator empty, thus stopping the production :-)
                 self.stop_event.set()
@@ -39,6 +39,11 @@ class Producer_async(Producer, abstract_class=True):
             
         # finish either if no data is present anymore or parent told us to stop (via stop() -> _onbeforestop())
         while not self.stop_event.is_set():
+            # if our receivers block, wait until they have room, so that we produce at the speed of the slowest node downstream
+            await self.data_storage.wait_credit()
+            if self.stop_event.is_set():
+                break
+
             emit_data, empty = await _anext(runner)
              
             if empty:
@@ -7,6 +7,7 @@ class Register():
     def __init__(self):
         self.nodes = Entrypoint_Register(entrypoints='livenodes.nodes')
         self.bridges = Entrypoint_Register(entrypoints='livenodes.bridges')
+        self.codecs = Entrypoint_Register(entrypoints='livenodes.codecs')
 
     def installed_packages(self):
         packages = []
@@ -14,12 +15,15 @@ class Register():
             packages.append(item.__module__.split('.')[0])
         for item in self.bridges.values():
             packages.append(item.__module__.split('.')[0])
+        for item in self.codecs.values():
+            packages.append(item.__module__.split('.')[0])
         return list(dict.fromkeys(packages)) # works because from 3.7 dict insertion order is preserved (as opposed to sets)
 
     def reload(self, invalidate_caches=False):
         logger.debug('Reloading modules')            
         self.nodes.reload(invalidate_caches)
         self.bridges.reload(invalidate_caches)
+        self.codecs.reload(invalidate_caches)
         logger.debug('Reloading complete')
 
     def prefetch(self):
@@ -27,6 +31,7 @@ class Register():
         logger.debug('Prefetching entrypoints')
         self.nodes.prefetch()
         self.bridges.prefetch()
+        self.codecs.prefetch()
         logger.debug('Prefetching complete')
 
     def package_enable(self, package_name):
@@ -38,10 +43,12 @@ class Register():
     def register_callback(self, fn):
         self.nodes.register_callback(fn)
         self.bridges.register_callback(fn)
+        self.codecs.register_callback(fn)
     
     def deregister_callback(self, fn):
         self.nodes.deregister_callback(fn)
         self.bridges.deregister_callback(fn)
+        self.codecs.deregister_callback(fn)
 
 
 class Entrypoint_Register():
@@ -0,0 +1,240 @@
+"""
+Micro-benchmarks for the bridges.
+
+Not collected by pytest, run directly:
+    python tests/bridge_bench.py
+"""
+import time
+import queue
+import pickle
+import asyncio
+import threading as th
+import multiprocessing as mp
+
+import numpy as np
+
+from livenodes.components.bridges import Bridge_thread, Bridge_pipe, Bridge_process
+from livenodes.components.bridges.codec import Codec, Codec_pickle, Codec_ndarray, Codec_str_list
+from livenodes.components.bridges.ctr_buffer import Ctr_buffer
+
+MP_CTX = mp.get_context('fork')
+
+
+class Polling_Bridge_thread(Bridge_thread):
+    # previous receive path of Bridge_thread: poll a queue.Queue every millisecond
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.queue = queue.Queue()
+
+    def put(self, ctr, item):
+        self.queue.put_nowait((ctr, item))
+
+    async def update(self):
+        while True:
+            try:
+                itm_ctr, item = self.queue.get_nowait()
+                break
+            except queue.Empty:
+                await asyncio.sleep(0.001)
+        self._read[itm_ctr] = item
+        return itm_ctr
+
+
+def thread_hop_latency(bridge_cls, n=2000):
+    # ping-pong between two threads with their own event loops, returns the mean time per hop in seconds
+    ping = bridge_cls(_from='1:1:1', _to='1:1:2')
+    pong = bridge_cls(_from='1:1:2', _to='1:1:1')
+    ready = th.Barrier(2)
+
+    def echo():
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+
+        async def run():
+            ping.ready_recv()
+            pong.ready_send()
+            ready.wait()
+            for _ in range(n):
+                ctr = await ping.update()
+                ping.discard_before(ctr)
+                pong.put(ctr, ctr)
+
+        loop.run_until_complete(run())
+        loop.close()
+
+    worker = th.Thread(target=echo)
+    worker.start()
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+
+    async def run():
+        pong.ready_recv()
+        ping.ready_send()
+        ready.wait()
+        start = time.perf_counter()
+        for ctr in range(n):
+            ping.put(ctr, ctr)
+            ctr = await pong.update()
+            pong.discard_before(ctr)
+        return time.perf_counter() - start
+
+    elapsed = loop.run_until_complete(run())
+    loop.close()
+    worker.join()
+    return elapsed / (2 * n)
+
+
+class Codec_pickle_inband(Codec):
+    # previous serialization: numpy buffers are copied into the pickle stream
+    @staticmethod
+    def encode(item):
+        return [pickle.dumps(item, protocol=pickle.HIGHEST_PROTOCOL)]
+
+    @staticmethod
+    def decode(frames):
+        return pickle.loads(frames[0])
+
+
+def process_transfer_time(codec, item, n=200):
+    # sends n items from a forked process through a Bridge_pipe, returns the mean time per message in seconds
+    bridge = Bridge_pipe(_from='1:1', _to='2:1')
+    bridge.codec = codec
+
+    def send():
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+
+        async def run():
+            bridge.ready_send()
+            for ctr in range(n):
+                bridge.put(ctr, item)
+                await asyncio.sleep(0)
+            bridge.close()
+
+        loop.run_until_complete(run())
+        loop.close()
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+
+    async def run():
+        bridge.ready_recv()
+        sender = MP_CTX.Process(target=send)
+        start = time.perf_counter()
+        sender.start()
+        for _ in range(n):
+            ctr = await bridge.update()
+            bridge.discard_before(ctr)
+        elapsed = time.perf_counter() - start
+        sender.join()
+        return elapsed
+
+    elapsed = loop.run_until_complete(run())
+    loop.close()
+    return elapsed / n
+
+
+def scalar_stream_rate(max_batch, n=20000):
+    # a producer emitting scalars as fast as it can through a Bridge_process, returns the messages per second the receiver gets
+    bridge = Bridge_process(_from='1:1', _to='2:1')
+    bridge.max_batch = max_batch
+
+    def send():
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+
+        async def run():
+            bridge.ready_send()
+            for ctr in range(n):
+                bridge.put(ctr, float(ctr))
+                if ctr % 100 == 0:
+                    await asyncio.sleep(0)
+            bridge.close()
+
+        loop.run_until_complete(run())
+        loop.close()
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+
+    async def run():
+        bridge.ready_recv()
+        sender = MP_CTX.Process(target=send)
+        start = time.perf_counter()
+        sender.start()
+        for _ in range(n):
+            ctr = await bridge.update()
+            bridge.discard_before(ctr)
+        elapsed = time.perf_counter() - start
+        sender.join()
+        return elapsed
+
+    elapsed = loop.run_until_complete(run())
+    loop.close()
+    return n / elapsed
+
+
+def serialization_costs(codec, item):
+    # bytes the codec copies into its own (in-band) stream vs bytes passed through as separate frames
+    frames = codec.encode(item)
+    return len(frames[0]), sum(memoryview(frame).nbytes for frame in frames[1:])
+
+
+def codec_round_trip(codec, item, n=10000):
+    # mean time to encode and decode an item in seconds
+    start = time.perf_counter()
+    for _ in range(n):
+        codec.decode(codec.encode(item))
+    return (time.perf_counter() - start) / n
+
+
+def pending_ctrs_time(use_buffer, n_pending=1000, n=10000):
+    # a bridge holding n_pending ctrs (e.g. waiting for a slow join partner), that receives, looks up and discards one ctr per step
+    # returns the mean time per step in seconds, for the previous dict (rebuilt on every discard) or the Ctr_buffer
+    read = Ctr_buffer() if use_buffer else {}
+    for ctr in range(n_pending):
+        read[ctr] = ctr
+
+    start = time.perf_counter()
+    for ctr in range(n):
+        read[ctr + n_pending] = ctr
+        if ctr in read:
+            read[ctr]
+        if use_buffer:
+            read.pop_until(ctr)
+        else:
+            read = {key: val for key, val in read.items() if key > ctr}
+    return (time.perf_counter() - start) / n
+
+
+if __name__ == "__main__":
+    for bridge_cls in [Polling_Bridge_thread, Bridge_thread]:
+        latency = thread_hop_latency(bridge_cls)
+        print(f'{bridge_cls.__name__:>24}: {latency * 1e6:8.1f} us per thread hop')
+
+    payloads = {
+        'array 1KB': np.random.rand(128),
+        'array 1MB': np.random.rand(128 * 1024),
+        'ret dict': {'data': np.random.rand(32, 4096), 'annotation': ['EMG1', 'EMG2', 'EMG3']},
+    }
+    for name, item in payloads.items():
+        for codec in [Codec_pickle_inband, Codec_pickle]:
+            copied, passed = serialization_costs(codec, item)
+            latency = process_transfer_time(codec, item)
+            print(f'{name:>10} {codec.__name__:>20}: {copied:>9} bytes copied into pickle stream, {passed:>9} bytes as frames, {latency * 1e6:8.1f} us per message')
+
+    for max_batch in [1, Bridge_process.max_batch]:
+        print(f'Bridge_process max_batch {max_batch:>3}: {scalar_stream_rate(max_batch):10.0f} scalar messages per second')
+
+    port_payloads = {
+        'array 32x16': (np.random.rand(32, 16), Codec_ndarray),
+        'array 1MB': (np.random.rand(128 * 1024), Codec_ndarray),
+        'channels': (['EMG1', 'EMG2', 'EMG3', 'EMG4', 'Gyro1', 'Gyro2'], Codec_str_list),
+    }
+    for name, (item, port_codec) in port_payloads.items():
+        for codec in [Codec_pickle_inband, Codec_pickle, port_codec]:
+            print(f'{name:>12} {codec.__name__:>20}: {codec_round_trip(codec, item) * 1e6:8.2f} us per encode/decode')
+
+    for use_buffer in [False, True]:
+        print(f"{'Ctr_buffer' if use_buffer else 'dict':>12}: {pending_ctrs_time(use_buffer) * 1e6:8.2f} us per processed ctr with 1000 pending ctrs")
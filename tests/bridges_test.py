@@ -0,0 +1,1669 @@
+import os
+import mmap
+import socket
+import time
+import hmac
+import logging
+import json
+import pickle
+import struct
+import platform
+import threading as th
+import asyncio
+import multiprocessing as mp
+from multiprocessing import resource_tracker
+import numpy as np
+import pytest
+
+from livenodes import Graph, Node, Producer, Ports_collection
+from livenodes.node import freeze
+from livenodes.components.port import Port
+from livenodes.components.bridges import Bridge_shm, Bridge_thread, Bridge_local, Bridge_pipe, Bridge_process, Bridge_socket
+from livenodes.components.bridges.codec import Codec_pickle, Codec_ndarray, Codec_str_list, get_codec
+from livenodes.components.bridges import Multiprocessing_Data_Storage
+from livenodes.components.bridges import calibration
+from livenodes.components.bridges.bridge_stats import Bridge_stats
+from livenodes.components.bridges.ctr_buffer import Ctr_buffer
+from livenodes.components.bridges.compression import Compressor
+from livenodes.components.bridges.shared_pool import Shared_Buffer_Pool, Pool_Releaser
+from livenodes.components.bridges.bridge_socket import _Connection, _Listener
+
+MP_CTX = mp.get_context('fork')
+
+@pytest.fixture()
+def async_loop_provider():
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    yield loop
+    loop.close()
+
+@pytest.fixture(autouse=True)
+def socket_authkey(monkeypatch):
+    # the secret shared by all hosts of a graph (see Bridge_socket)
+    monkeypatch.setattr(Bridge_socket, 'authkey', b'secret')
+
+def send_all(bridge, items):
+    bridge.ready_send()
+    for ctr, item in enumerate(items):
+        bridge.put(ctr, item)
+    bridge.close()
+
+async def receive_all_n(bridge, n):
+    # mimic a node: get the value, process (here: copy) it and discard the ctr afterwards
+    res = []
+    for _ in range(n):
+        ctr = await bridge.update()
+        found, item = bridge.get(ctr)
+        assert found
+        is_view = isinstance(item, np.ndarray) and isinstance(item.base, mmap.mmap)
+        res.append((ctr, item.copy() if isinstance(item, np.ndarray) else item, is_view))
+        del item
+        bridge.discard_before(ctr)
+    return res
+
+async def receive_all(bridge, n):
+    res = await receive_all_n(bridge, n)
+    await bridge.onclose()
+    return res
+
+def send_all_async(bridge, items):
+    # sender with a running loop, so that bridges can use it to write out what did not fit right away
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+
+    async def run():
+        bridge.ready_send()
+        for ctr, item in enumerate(items):
+            bridge.put(ctr, item)
+            await asyncio.sleep(0)
+        bridge.close()
+
+    loop.run_until_complete(run())
+    loop.close()
+
+def run_across_processes(loop, bridge, items, sender_fn=send_all):
+    bridge.ready_recv()
+    sender = MP_CTX.Process(target=sender_fn, args=(bridge, items))
+    sender.start()
+    res = loop.run_until_complete(asyncio.wait_for(receive_all(bridge, len(items)), timeout=10))
+    sender.join()
+    return res
+
+
+class Port_Frame(Port):
+    example_values = [np.zeros((2, 2))]
+
+    @classmethod
+    def check_value(cls, value):
+        if not isinstance(value, np.ndarray):
+            return False, f"Should be numpy array; got {type(value)}."
+        return True, None
+
+class Ports_frame(Ports_collection):
+    data: Port_Frame = Port_Frame("Data")
+
+class Ports_none(Ports_collection):
+    pass
+
+class Frames(Producer):
+    ports_in = Ports_none()
+    ports_out = Ports_frame()
+
+    def _run(self):
+        for ctr in range(20):
+            yield self.ret(data=np.full((128, 128), ctr, dtype=np.float64))
+
+class Save_sum(Node):
+    ports_in = Ports_frame()
+    ports_out = Ports_none()
+
+    def __init__(self, name='Save_sum', **kwargs):
+        super().__init__(name, **kwargs)
+        self.out = mp.SimpleQueue()
+
+    def process(self, data, **kwargs):
+        self.out.put(float(data.sum()))
+
+    def get_state_and_close(self):
+        res = []
+        while not self.out.empty():
+            res.append(self.out.get())
+        self.out.close()
+        return res
+
+
+class TestBridgeThread():
+
+    def test_wakes_receiver_without_polling(self, async_loop_provider, monkeypatch):
+        bridge = Bridge_thread(_from='1:1:1', _to='1:1:2')
+        bridge.ready_recv()
+
+        def sender():
+            bridge.ready_send()
+            for ctr in range(20):
+                # give the receiver time to wait on an empty inbox every other item
+                if ctr % 2 == 0:
+                    time.sleep(0.002)
+                bridge.put(ctr, ctr * 2)
+            bridge.close()
+
+        async def no_sleep(*args, **kwargs):
+            raise AssertionError('update should not poll')
+
+        monkeypatch.setattr(asyncio, 'sleep', no_sleep)
+        worker = th.Thread(target=sender)
+        worker.start()
+        res = async_loop_provider.run_until_complete(asyncio.wait_for(receive_all_n(bridge, 20), timeout=10))
+        worker.join()
+        monkeypatch.undo()
+
+        assert [(ctr, item) for ctr, item, _ in res] == [(ctr, ctr * 2) for ctr in range(20)]
+        assert bridge.closed_and_empty()
+
+
+class TestBridgeClose():
+
+    @pytest.mark.parametrize("bridge_cls,_from,_to", [(Bridge_local, '1:1:1', '1:1:1'), (Bridge_thread, '1:1:1', '1:1:2')])
+    def test_onclose_after_last_item(self, async_loop_provider, bridge_cls, _from, _to):
+        bridge = bridge_cls(_from=_from, _to=_to)
+        bridge.ready_send()
+        bridge.ready_recv()
+
+        async def run():
+            closed = asyncio.ensure_future(bridge.onclose())
+            bridge.put(0, 'a')
+            bridge.put(1, 'b')
+            bridge.close()
+            await asyncio.sleep(0)
+            # closed, but items not consumed yet
+            assert not closed.done()
+
+            res = await receive_all_n(bridge, 1)
+            await asyncio.sleep(0)
+            assert not closed.done()
+
+            res += await receive_all_n(bridge, 1)
+            await asyncio.wait_for(closed, timeout=1)
+            # later awaits return right away
+            await asyncio.wait_for(bridge.onclose(), timeout=1)
+            return res
+
+        res = async_loop_provider.run_until_complete(run())
+        assert [item for _, item, _ in res] == ['a', 'b']
+
+    @pytest.mark.parametrize("bridge_cls", [Bridge_process, Bridge_shm])
+    def test_onclose_resolved_by_update(self, async_loop_provider, bridge_cls):
+        bridge = bridge_cls(_from='1:1', _to='2:1')
+        bridge.ready_send()
+        bridge.ready_recv()
+        # whether the queue was read by a listener polling in update or by onclose
+        by_update = []
+        fetch = bridge._fetch
+        def fetch_and_record():
+            by_update.append(bridge._polling)
+            return fetch()
+        bridge._fetch = fetch_and_record
+
+        async def listen():
+            # mimic a node's listener, which keeps updating after the last item
+            res = await receive_all_n(bridge, 2)
+            await bridge.update()
+            return res
+
+        async def run():
+            listener = asyncio.ensure_future(listen())
+            await asyncio.sleep(0)
+            closed = asyncio.ensure_future(bridge.onclose())
+            bridge.put(0, 'a')
+            bridge.put(1, 'b')
+            bridge.close()
+            await asyncio.wait_for(closed, timeout=10)
+            assert not listener.done()
+            listener.cancel()
+
+        async_loop_provider.run_until_complete(run())
+        assert len(by_update) > 0 and all(by_update)
+
+
+class TestBridgeOverflow():
+
+    @pytest.mark.parametrize("bridge_cls,_from,_to", [
+        (Bridge_local, '1:1:1', '1:1:1'),
+        (Bridge_thread, '1:1:1', '1:1:2'),
+        (Bridge_process, '1:1', '2:1'),
+        (Bridge_pipe, '1:1', '2:1'),
+    ])
+    @pytest.mark.parametrize("overflow,expected", [
+        ('drop_oldest', [7, 8, 9]),
+        ('drop_newest', [0, 1, 2]),
+        ('latest', [9]),
+    ])
+    def test_drop_policies(self, async_loop_provider, bridge_cls, _from, _to, overflow, expected):
+        # the receiver only starts reading once all 10 items are sent
+        bridge = bridge_cls(_from=_from, _to=_to, capacity=3, overflow=overflow, name='A.data -> B.data')
+        reports = []
+        bridge.register_reporter(lambda **kwargs: reports.append(kwargs))
+
+        bridge.ready_recv()
+        if bridge.crosses_process():
+            sender = MP_CTX.Process(target=send_all, args=(bridge, list(range(10))))
+            sender.start()
+            sender.join()
+        else:
+            send_all(bridge, list(range(10)))
+        res = async_loop_provider.run_until_complete(asyncio.wait_for(receive_all(bridge, len(expected)), timeout=10))
+
+        assert [item for _, item, _ in res] == expected
+        assert bridge.closed_and_empty()
+        assert {'dropped': {'A.data -> B.data': 10 - len(expected)}} in reports
+
+    @pytest.mark.parametrize("bridge_cls,_from,_to", [
+        (Bridge_thread, '1:1:1', '1:1:2'),
+        (Bridge_process, '1:1', '2:1'),
+        (Bridge_pipe, '1:1', '2:1'),
+    ])
+    def test_block(self, async_loop_provider, bridge_cls, _from, _to):
+        bridge = bridge_cls(_from=_from, _to=_to, capacity=2, overflow='block')
+        bridge.ready_recv()
+        if bridge.crosses_process():
+            sender = MP_CTX.Process(target=send_all_async, args=(bridge, list(range(10))))
+        else:
+            sender = th.Thread(target=send_all_async, args=(bridge, list(range(10))))
+        sender.start()
+
+        async def run():
+            # the sender cannot get ahead of us by more than the capacity
+            await asyncio.sleep(0.3)
+            assert sender.is_alive()
+            return await receive_all(bridge, 10)
+
+        res = async_loop_provider.run_until_complete(asyncio.wait_for(run(), timeout=10))
+        sender.join()
+        assert [item for _, item, _ in res] == list(range(10))
+        assert bridge.n_dropped == 0
+
+    def test_receiver_stopped_only_blocking(self):
+        # only a blocking sender waits for the receiver
+        assert Bridge_process(_from='1:1', _to='2:1')._receiver_stopped is None
+        assert Bridge_process(_from='1:1', _to='2:1', capacity=2, overflow='drop_oldest')._receiver_stopped is None
+        assert Bridge_process(_from='1:1', _to='2:1', capacity=2, overflow='block')._receiver_stopped is not None
+
+    @pytest.mark.parametrize("bridge_cls,_from,_to", [
+        (Bridge_local, '1:1:1', '1:1:1'),
+        (Bridge_thread, '1:1:1', '1:1:2'),
+        (Bridge_process, '1:1', '2:1'),
+        (Bridge_pipe, '1:1', '2:1'),
+    ])
+    def test_wait_credit(self, async_loop_provider, bridge_cls, _from, _to):
+        bridge = bridge_cls(_from=_from, _to=_to, capacity=2, overflow='block')
+
+        def receive_later():
+            # takes the first item after a while
+            loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(loop)
+            bridge.ready_recv()
+            time.sleep(0.2)
+            loop.run_until_complete(receive_all_n(bridge, 1))
+            loop.close()
+
+        async def run():
+            bridge.ready_send()
+            if bridge.crosses_process():
+                receiver = MP_CTX.Process(target=receive_later)
+                receiver.start()
+            else:
+                bridge.ready_recv()
+                receiver = None
+                asyncio.get_event_loop().call_later(0.2, asyncio.ensure_future, receive_all_n(bridge, 1))
+
+            bridge.put(0, 'a')
+            assert bridge.has_credit()
+            bridge.put(1, 'b')
+            assert not bridge.has_credit()
+
+            start = time.time()
+            await asyncio.wait_for(bridge.wait_credit(), timeout=5)
+            assert time.time() - start > 0.1
+            assert bridge.has_credit()
+            if receiver is not None:
+                receiver.join()
+
+        async_loop_provider.run_until_complete(run())
+
+    def test_block_gives_up_on_stopped_receiver(self, async_loop_provider):
+        bridge = Bridge_thread(_from='1:1:1', _to='1:1:2', capacity=1, overflow='block')
+        bridge.ready_recv()
+
+        async def run():
+            # the receiving node is stopped while waiting for input
+            update = asyncio.ensure_future(bridge.update())
+            await asyncio.sleep(0.01)
+            update.cancel()
+            await asyncio.sleep(0.01)
+
+        async_loop_provider.run_until_complete(run())
+        sender = th.Thread(target=send_all, args=(bridge, list(range(5))))
+        sender.start()
+        sender.join(timeout=2)
+        assert not sender.is_alive()
+
+
+class Timed_frames(Producer):
+    ports_in = Ports_none()
+    ports_out = Ports_frame()
+
+    def __init__(self, name='Timed_frames', **kwargs):
+        super().__init__(name, **kwargs)
+        self.emitted = mp.SimpleQueue()
+
+    def _run(self):
+        for ctr in range(30):
+            self.emitted.put(time.time())
+            yield self.ret(data=np.full((2, 2), ctr, dtype=np.float64))
+
+class Pass_frame(Node):
+    ports_in = Ports_frame()
+    ports_out = Ports_frame()
+
+    def process(self, data, **kwargs):
+        return self.ret(data=data)
+
+class Slow_save(Save_sum):
+
+    def process(self, data, **kwargs):
+        time.sleep(0.01)
+        self.out.put((float(data[0, 0]), time.time()))
+
+class Ports_frame_pair(Ports_collection):
+    data: Port_Frame = Port_Frame("Data")
+    other: Port_Frame = Port_Frame("Other")
+
+class Add_frames(Node):
+    ports_in = Ports_frame_pair()
+    ports_out = Ports_frame()
+
+    def process(self, data, other, **kwargs):
+        return self.ret(data=data + other)
+
+
+class TestCredit():
+
+    @pytest.mark.parametrize("locations", [['1:1', '2:1', '3:1'], ['1:1:1', '1:1:2', '1:1:3'], ['', '', '']])
+    def test_producer_waits_for_slowest_node(self, locations):
+        # producer -> pass -> slow sink, with blocking connections of capacity 2 the producer may only be a few items ahead of the sink
+        data = Timed_frames(name="A", compute_on=locations[0])
+        pass_frame = Pass_frame(name="B", compute_on=locations[1])
+        out = Slow_save(name="C", compute_on=locations[2])
+        pass_frame.add_input(data, emit_port=data.ports_out.data, recv_port=pass_frame.ports_in.data, capacity=2, overflow='block')
+        out.add_input(pass_frame, emit_port=pass_frame.ports_out.data, recv_port=out.ports_in.data, capacity=2, overflow='block')
+
+        g = Graph(start_node=data)
+        g.start_all()
+        g.join_all()
+        g.stop_all()
+
+        processed = out.get_state_and_close()
+        emitted = []
+        while not data.emitted.empty():
+            emitted.append(data.emitted.get())
+
+        assert [ctr for ctr, _ in processed] == list(range(30))
+        # in flight: 2 per connection, one in each node
+        in_flight = 2 + 2 + 3
+        for ctr in range(in_flight, 30):
+            assert emitted[ctr] >= processed[ctr - in_flight][1]
+        assert g.is_finished()
+
+    @pytest.mark.parametrize("locations", [['1:1', '1:1', '1:2'], ['1:1', '1:1', '2:1'], ['', '', '']])
+    def test_multi_input_node_with_blocking_output(self, locations):
+        # every input listener of the join awaits credit of the same blocking output
+        data = Frames(name="A", compute_on=locations[0])
+        other = Frames(name="A2", compute_on=locations[1])
+        add = Add_frames(name="B", compute_on=locations[1])
+        out = Save_sum(name="C", compute_on=locations[2])
+        add.add_input(data, emit_port=data.ports_out.data, recv_port=add.ports_in.data)
+        add.add_input(other, emit_port=other.ports_out.data, recv_port=add.ports_in.other)
+        out.add_input(add, emit_port=add.ports_out.data, recv_port=out.ports_in.data, capacity=1, overflow='block')
+
+        g = Graph(start_node=data)
+        g.start_all()
+        g.join_all(timeout=20)
+        g.stop_all()
+
+        assert out.get_state_and_close() == [2 * 128 * 128 * ctr for ctr in range(20)]
+
+
+
+class TestBridgeProcess():
+
+    def test_batches_items(self, async_loop_provider):
+        bridge = Bridge_process(_from='1:1', _to='2:1')
+        bridge.ready_send()
+        bridge.ready_recv()
+
+        transfers = []
+        get_nowait = bridge.queue.get_nowait
+        def counting_get_nowait():
+            batch = get_nowait()
+            transfers.append(len(batch))
+            return batch
+        bridge.queue.get_nowait = counting_get_nowait
+
+        async def run():
+            # items arrive faster than the receiver takes them
+            for ctr in range(200):
+                bridge.put(ctr, ctr)
+            # the rest is sent after max_delay
+            return await asyncio.wait_for(receive_all_n(bridge, 200), timeout=5)
+
+        res = async_loop_provider.run_until_complete(run())
+        assert [item for _, item, _ in res] == list(range(200))
+        assert sum(transfers) == 200
+        assert max(transfers) <= Bridge_process.max_batch
+        assert len(transfers) < 20
+
+    def test_batches_across_processes(self, async_loop_provider):
+        items = list(range(500))
+        res = run_across_processes(async_loop_provider, Bridge_process(_from='1:1', _to='2:1'), items, sender_fn=send_all_async)
+        assert [item for _, item, _ in res] == items
+
+    @pytest.mark.parametrize("bridge_cls", [Bridge_process, Bridge_shm])
+    def test_end_of_stream_in_band(self, async_loop_provider, monkeypatch, bridge_cls):
+        bridge = bridge_cls(_from='1:1', _to='2:1')
+        bridge.ready_recv()
+        sender = MP_CTX.Process(target=send_all_async, args=(bridge, [np.arange(3), 'b', 'c']))
+        sender.start()
+        sender.join()
+        # the sender closed, but we did not get to the end of the stream yet
+        assert not bridge.closed()
+
+        res = async_loop_provider.run_until_complete(asyncio.wait_for(receive_all(bridge, 3), timeout=10))
+        assert [item for _, item, _ in res][1:] == ['b', 'c']
+        # from here on without looking at the queue
+        monkeypatch.setattr(bridge, 'queue', None)
+        assert bridge.closed_and_empty()
+
+
+class TestBridgePipe():
+
+    def test_can_handle(self):
+        assert Bridge_pipe.can_handle('1:1', '2:1')[0]
+        assert not Bridge_pipe.can_handle('1:1', '1:2')[0]
+
+    @pytest.mark.parametrize("sender_fn", [send_all, send_all_async])
+    def test_payloads_across_processes(self, async_loop_provider, sender_fn):
+        # mixes small items with items larger than both the pipe and the receive buffer
+        large = np.arange(4 * Bridge_pipe.buffer_size, dtype=np.float64)
+        items = [1, large, {'data': large[:10], 'annotation': ['a', 'b']}, 'text', large * 2, None]
+        bridge = Bridge_pipe(_from='1:1', _to='2:1')
+        res = run_across_processes(async_loop_provider, bridge, items, sender_fn=sender_fn)
+
+        assert [ctr for ctr, _, _ in res] == list(range(len(items)))
+        np.testing.assert_array_equal(res[1][1], large)
+        np.testing.assert_array_equal(res[2][1]['data'], large[:10])
+        assert res[2][1]['annotation'] == ['a', 'b']
+        np.testing.assert_array_equal(res[4][1], large * 2)
+        assert [res[i][1] for i in [0, 3, 5]] == [1, 'text', None]
+        assert bridge.closed_and_empty()
+
+    def test_more_frames_than_iov_max(self, async_loop_provider):
+        # pickle protocol 5 sends every array of the list as its own frame
+        item = [np.full(3, i, dtype=np.float64) for i in range(2 * os.sysconf('SC_IOV_MAX'))]
+        bridge = Bridge_pipe(_from='1:1', _to='2:1')
+        res = run_across_processes(async_loop_provider, bridge, [item, 'after'], sender_fn=send_all_async)
+        assert len(res[0][1]) == len(item)
+        np.testing.assert_array_equal(res[0][1][-1], item[-1])
+        assert res[1][1] == 'after'
+
+    def test_update_without_polling(self, async_loop_provider, monkeypatch):
+        bridge = Bridge_pipe(_from='1:1', _to='2:1')
+
+        async def no_sleep(*args, **kwargs):
+            raise AssertionError('update should not poll')
+
+        bridge.ready_recv()
+        monkeypatch.setattr(asyncio, 'sleep', no_sleep)
+        sender = MP_CTX.Process(target=send_all, args=(bridge, list(range(5))))
+        sender.start()
+        res = async_loop_provider.run_until_complete(asyncio.wait_for(receive_all_n(bridge, 5), timeout=10))
+        sender.join()
+        monkeypatch.undo()
+        assert [item for _, item, _ in res] == list(range(5))
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+class TestBridgeSocket():
+
+    def test_can_handle(self):
+        assert Bridge_socket.can_handle('127.0.0.1:7001:1:1', '127.0.0.1:7002:1:1')[0]
+        assert not Bridge_socket.can_handle('127.0.0.1:7001:1:1', '127.0.0.1:7001:2:1')[0]
+        # the receiving host needs a port to listen on
+        assert not Bridge_socket.can_handle('127.0.0.1:7001:1:1', '1:1')[0]
+
+    def test_payloads_across_processes(self, async_loop_provider):
+        large = np.arange(4 * Bridge_pipe.buffer_size, dtype=np.float64)
+        items = [1, large, {'data': large[:10], 'annotation': ['a', 'b']}, 'text', None]
+        bridge = Bridge_socket(_from=f'127.0.0.1:{free_port()}:1:1', _to=f'127.0.0.1:{free_port()}:1:1', name='A.data -> B.data')
+        res = run_across_processes(async_loop_provider, bridge, items, sender_fn=send_all_async)
+
+        assert [ctr for ctr, _, _ in res] == list(range(len(items)))
+        np.testing.assert_array_equal(res[1][1], large)
+        np.testing.assert_array_equal(res[2][1]['data'], large[:10])
+        assert res[2][1]['annotation'] == ['a', 'b']
+        assert [res[i][1] for i in [0, 3, 4]] == [1, 'text', None]
+        assert bridge.closed_and_empty()
+
+    def test_more_frames_than_iov_max(self, async_loop_provider):
+        item = [np.full(3, i, dtype=np.float64) for i in range(2 * os.sysconf('SC_IOV_MAX'))]
+        bridge = Bridge_socket(_from=f'127.0.0.1:{free_port()}:1:1', _to=f'127.0.0.1:{free_port()}:1:1', name='A.data -> B.data')
+
+        def send_connected(bridge, items):
+            # once connected, the frames are sent right away instead of being queued
+            async def run():
+                bridge.ready_send()
+                bridge.put(0, 'before')
+                while bridge._conn._sock is None or len(bridge._conn._outbox) > 0:
+                    await asyncio.sleep(0.01)
+                for ctr, item in enumerate(items[1:], start=1):
+                    bridge.put(ctr, item)
+                bridge.close()
+            asyncio.run(run())
+
+        res = run_across_processes(async_loop_provider, bridge, ['before', item, 'after'], sender_fn=send_connected)
+        assert len(res[1][1]) == len(item)
+        np.testing.assert_array_equal(res[1][1][-1], item[-1])
+        assert [res[0][1], res[2][1]] == ['before', 'after']
+
+    def test_connection_reuse(self, async_loop_provider):
+        _from, _to = f'127.0.0.1:{free_port()}:1:1', f'127.0.0.1:{free_port()}:1:1'
+        bridges = [Bridge_socket(_from=_from, _to=_to, name=f'A.data -> {name}.data') for name in ['B', 'C']]
+
+        async def run():
+            for bridge in bridges:
+                bridge.ready_recv()
+                bridge.ready_send()
+            assert bridges[0]._conn is bridges[1]._conn
+            for ctr in range(5):
+                for bridge in bridges:
+                    bridge.put(ctr, (bridge.name, ctr))
+            res = [await asyncio.wait_for(receive_all_n(bridge, 5), timeout=10) for bridge in bridges]
+            for bridge in bridges:
+                bridge.close()
+                await asyncio.wait_for(bridge.onclose(), timeout=10)
+            return res
+
+        res = async_loop_provider.run_until_complete(run())
+        for bridge, received in zip(bridges, res):
+            assert [item for _, item, _ in received] == [(bridge.name, ctr) for ctr in range(5)]
+
+    @pytest.mark.parametrize("compression", [None, Compressor('zlib', threshold=0)])
+    def test_received_arrays_are_writable(self, async_loop_provider, compression):
+        bridge = Bridge_socket(_from=f'127.0.0.1:{free_port()}:1:1', _to=f'127.0.0.1:{free_port()}:1:1', name='A.data -> B.data', codec=Codec_ndarray, compression=compression)
+
+        async def run():
+            bridge.ready_recv()
+            bridge.ready_send()
+            bridge.put(0, np.ones((2, 3)))
+            ctr = await asyncio.wait_for(bridge.update(), timeout=10)
+            _, item = bridge.get(ctr)
+            bridge.discard_before(ctr)
+            bridge.close()
+            await asyncio.wait_for(bridge.onclose(), timeout=10)
+            return item
+
+        item = async_loop_provider.run_until_complete(run())
+        assert item.flags.writeable
+        item += 1
+        np.testing.assert_array_equal(item, np.full((2, 3), 2.0))
+
+    def test_listener_outlives_first_loop(self, async_loop_provider):
+        _from, _to = f'127.0.0.1:{free_port()}:1:1', f'127.0.0.1:{free_port()}:1:1'
+        first, second = [Bridge_socket(_from=_from, _to=_to, name=f'A.data -> {name}.data') for name in ['B', 'C']]
+        received = []
+
+        def receive(bridge, n):
+            loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(loop)
+            bridge.ready_recv()
+            received.extend(loop.run_until_complete(asyncio.wait_for(receive_all_n(bridge, n), timeout=10)))
+            # the loop of the first receiving thread ends while its bridge is still registered
+            loop.close()
+
+        async def run():
+            loop = asyncio.get_event_loop()
+            first_thread = th.Thread(target=receive, args=(first, 1))
+            first_thread.start()
+            first.ready_send()
+            second.ready_send()
+            first.put(0, 'first')
+            await loop.run_in_executor(None, first_thread.join)
+
+            second_thread = th.Thread(target=receive, args=(second, 5))
+            second_thread.start()
+            for ctr in range(5):
+                second.put(ctr, 'second')
+            await loop.run_in_executor(None, second_thread.join)
+            first.close()
+            second.close()
+
+        async_loop_provider.run_until_complete(run())
+        assert [item for _, item, _ in received] == ['first'] + ['second'] * 5
+        first._listener.deregister(first)
+        second._listener.deregister(second)
+
+    def test_requires_authkey(self, monkeypatch):
+        monkeypatch.setattr(Bridge_socket, 'authkey', b'')
+        with pytest.raises(ValueError, match='SOCKET_BRIDGE_AUTHKEY'):
+            Bridge_socket(_from=f'127.0.0.1:{free_port()}:1:1', _to=f'127.0.0.1:{free_port()}:1:1', name='A.data -> B.data')
+
+    @pytest.mark.parametrize("authkey", [b'wrong', None])
+    def test_refuses_unauthenticated(self, async_loop_provider, authkey):
+        address = ('127.0.0.1', free_port())
+        bridge = Bridge_socket(_from=f'127.0.0.1:{free_port()}:1:1', _to=f'{address[0]}:{address[1]}:1:1', name='A.data -> B.data')
+
+        async def run():
+            bridge.ready_recv()
+            reader, writer = await asyncio.open_connection(*address)
+            challenge = await reader.readexactly(32)
+            # a wrong answer to the challenge, or a peer that skips it and sends a pickled frame right away
+            answer = hmac.new(authkey, challenge, 'sha256').digest() if authkey is not None else b''
+            payload = pickle.dumps('unchecked')
+            writer.write(answer + struct.pack('<BIqIB', 0, 0, 0, 1, 0) + struct.pack('<Q', len(bridge.name)) + bridge.name.encode('utf-8'))
+            writer.write(struct.pack('<BIqIB', 1, 0, 0, 1, 1) + struct.pack('<Q', len(payload)) + payload)
+            # the receiver closes the connection without reading any of it (or resets it, as our frames were not read)
+            try:
+                await writer.drain()
+                assert await asyncio.wait_for(reader.read(), timeout=10) == b''
+                writer.close()
+                await writer.wait_closed()
+            except ConnectionResetError:
+                writer.close()
+            assert not bridge.has_waiting()
+
+        async_loop_provider.run_until_complete(run())
+        bridge._listener.deregister(bridge)
+
+    def test_listener_stops_with_connected_sender(self, async_loop_provider, caplog):
+        _to = f'127.0.0.1:{free_port()}:1:1'
+        sender, receiver = [Bridge_socket(_from=f'127.0.0.1:{free_port()}:1:1', _to=_to, name='A.data -> B.data') for _ in range(2)]
+
+        async def run():
+            receiver.ready_recv()
+            sender.ready_send()
+            sender.put(0, 'a')
+            await asyncio.wait_for(receive_all_n(receiver, 1), timeout=10)
+            # the receiver is done before the sender closed its connection
+            listener = receiver._listener
+            listener.deregister(receiver)
+            await async_loop_provider.run_in_executor(None, listener._thread.join, 10)
+            sender.close()
+
+        async_loop_provider.run_until_complete(run())
+        assert [r for r in caplog.records if r.name == 'asyncio' and r.levelno >= logging.ERROR] == []
+
+    def test_listening_twice_raises(self):
+        port = free_port()
+        with socket.create_server(('127.0.0.1', port)):
+            with pytest.raises(RuntimeError, match='could not listen'):
+                _Listener.get(('127.0.0.1', port), b'secret')
+
+    def test_several_receiving_processes_raise(self):
+        host = f"127.0.0.1:{free_port()}"
+        data = Frames(name="A", compute_on=f"127.0.0.1:{free_port()}:1:1")
+        outs = [Save_sum(name=f"Out{i}", compute_on=f"{host}:{i}:1") for i in [2, 3]]
+        for out in outs:
+            out.add_input(data, emit_port=data.ports_out.data, recv_port=out.ports_in.data)
+
+        with pytest.raises(ValueError, match='Only one process'):
+            Graph(start_node=data).lock_all()
+        for out in outs:
+            out.get_state_and_close()
+
+    def test_graph_across_hosts(self):
+        data = Frames(name="A", compute_on=f"127.0.0.1:{free_port()}:1:1")
+        out = Save_sum(name="Out", compute_on=f"127.0.0.1:{free_port()}:2:1")
+        out.add_input(data, emit_port=data.ports_out.data, recv_port=out.ports_in.data)
+
+        g = Graph(start_node=data)
+        g.start_all()
+        g.join_all()
+        g.stop_all()
+
+        assert out.get_state_and_close() == [128 * 128 * ctr for ctr in range(20)]
+        assert g.is_finished()
+
+
+class Port_Scalar_fast(Port):
+    example_values = [0.]
+    payload_bytes = 8
+    rate = 10_000
+
+    @classmethod
+    def check_value(cls, value):
+        return isinstance(value, float), None
+
+class Ports_scalar_fast(Ports_collection):
+    data: Port_Scalar_fast = Port_Scalar_fast("Data")
+
+class Scalars_fast(Producer):
+    ports_in = Ports_none()
+    ports_out = Ports_scalar_fast()
+
+class Sink_scalar(Node):
+    ports_in = Ports_scalar_fast()
+    ports_out = Ports_none()
+
+class TestResolveBridge():
+
+    @pytest.fixture(autouse=True)
+    def uncalibrated(self, tmp_path, monkeypatch):
+        # the static costs, not the measurements of whoever runs the tests (see TestCalibration)
+        monkeypatch.setattr(calibration, 'BRIDGE_CALIBRATION_FILE', str(tmp_path / 'missing.json'))
+
+    def resolve(self, emit, recv, emit_loc, recv_loc, **settings):
+        emit.compute_on, recv.compute_on = emit_loc, recv_loc
+        recv.add_input(emit, emit_port=emit.ports_out.data, recv_port=recv.ports_in.data, **settings)
+        bridge, _ = Multiprocessing_Data_Storage.resolve_bridge(recv.input_connections[0])
+        return bridge
+
+    def test_by_location(self):
+        assert type(self.resolve(Frames(name="A"), Save_sum(name="B"), "1:1", "1:1")) == Bridge_local
+        assert type(self.resolve(Frames(name="A"), Save_sum(name="B"), "1:1", "1:2")) == Bridge_thread
+        assert type(self.resolve(Frames(name="A"), Save_sum(name="B"), "1:1", "2:1")) == Bridge_pipe
+
+    def test_by_port_hints(self):
+        # small values at high rates are batched through the process queue
+        bridge = self.resolve(Scalars_fast(name="A"), Sink_scalar(name="B"), "1:1", "2:1")
+        assert type(bridge) == Bridge_process
+        assert bridge._data_type == Port_Scalar_fast
+        # but only across processes
+        assert type(self.resolve(Scalars_fast(name="A"), Sink_scalar(name="B"), "1:1", "1:2")) == Bridge_thread
+
+    def test_override(self):
+        assert type(self.resolve(Frames(name="A"), Save_sum(name="B"), "1:1", "2:1", bridge='Bridge_shm')) == Bridge_shm
+        with pytest.raises(ValueError, match='cannot handle'):
+            self.resolve(Frames(name="A"), Save_sum(name="B"), "1:1", "2:1", bridge='Bridge_local')
+        with pytest.raises(ValueError, match='Unknown bridge'):
+            self.resolve(Frames(name="A"), Save_sum(name="B"), "1:1", "2:1", bridge='Bridge_carrier_pigeon')
+
+
+class Port_Status(Port):
+    example_values = ['running']
+    priority = 'control'
+
+    @classmethod
+    def check_value(cls, value):
+        return isinstance(value, str), None
+
+class Ports_status(Ports_collection):
+    data: Port_Status = Port_Status("Status")
+
+class Status(Producer):
+    ports_in = Ports_none()
+    ports_out = Ports_status()
+
+class Sink_status(Node):
+    ports_in = Ports_status()
+    ports_out = Ports_none()
+
+class Ports_frame_status(Ports_collection):
+    data: Port_Frame = Port_Frame("Data")
+    status: Port_Status = Port_Status("Status")
+
+class Save_frame_status(Node):
+    ports_in = Ports_frame_status()
+    ports_out = Ports_none()
+
+    def __init__(self, name='Save_frame_status', **kwargs):
+        super().__init__(name, **kwargs)
+        self.processed = []
+
+    def process(self, data, status=None, _ctr=None, **kwargs):
+        self.processed.append((_ctr, status))
+
+class TestPriority():
+
+    def test_resolve(self):
+        resolve = TestResolveBridge().resolve
+        assert resolve(Frames(name="A"), Save_sum(name="B"), "1:1", "2:1").priority == 'bulk'
+        assert resolve(Status(name="A"), Sink_status(name="B"), "1:1", "2:1").priority == 'control'
+        # the connection overrides the port
+        assert resolve(Frames(name="A"), Save_sum(name="B"), "1:1", "2:1", priority='control').priority == 'control'
+        assert resolve(Status(name="A"), Sink_status(name="B"), "1:1", "2:1", priority='bulk').priority == 'bulk'
+        with pytest.raises(ValueError, match='Unknown priority'):
+            resolve(Frames(name="A"), Save_sum(name="B"), "1:1", "2:1", priority='urgent')
+
+    def test_process_does_not_batch_control(self, async_loop_provider):
+        bridge = Bridge_process(_from='1:1', _to='2:1', priority='control')
+        bridge.ready_send()
+        bridge.ready_recv()
+
+        transfers = []
+        get_nowait = bridge.queue.get_nowait
+        def counting_get_nowait():
+            batch = get_nowait()
+            transfers.append(len(batch))
+            return batch
+        bridge.queue.get_nowait = counting_get_nowait
+
+        async def run():
+            for ctr in range(50):
+                bridge.put(ctr, ctr)
+            return await asyncio.wait_for(receive_all_n(bridge, 50), timeout=5)
+
+        res = async_loop_provider.run_until_complete(run())
+        assert [item for _, item, _ in res] == list(range(50))
+        assert transfers == [1] * 50
+
+    def test_socket_control_lane(self, async_loop_provider):
+        async def run():
+            conn = _Connection(('127.0.0.1', free_port()), b'secret', asyncio.get_event_loop())
+            conn._connecting.cancel()
+            # not connected yet, so everything is queued
+            conn.send([b'a'])
+            conn.send([b'b'])
+            conn.send([b'c'], control=True)
+            conn.send([b'd'], control=True)
+            conn.send([b'e'])
+            assert [parts[0] for _, parts in conn._outbox] == [b'c', b'd', b'a', b'b', b'e']
+
+            # a partly written message is finished first
+            conn._partial = True
+            conn.send([b'f'], control=True)
+            assert [parts[0] for _, parts in conn._outbox] == [b'c', b'd', b'f', b'a', b'b', b'e']
+
+        async_loop_provider.run_until_complete(run())
+
+    def test_socket_control_overtakes_bulk(self, async_loop_provider):
+        _from, _to = f'127.0.0.1:{free_port()}:1:1', f'127.0.0.1:{free_port()}:1:1'
+        bulk = Bridge_socket(_from=_from, _to=_to, name='A.data -> B.data')
+        control = Bridge_socket(_from=_from, _to=_to, name='A.status -> B.status', priority='control')
+        frame = np.ones(2 ** 17)
+
+        async def run():
+            for bridge in [bulk, control]:
+                bridge.ready_recv()
+                bridge.ready_send()
+            # connected and both channels opened
+            await asyncio.wait_for(receive_all_n(control, 0), timeout=10)
+            while bulk._conn._sock is None or len(bulk._conn._outbox) > 0:
+                await asyncio.sleep(0.01)
+
+            # more than the socket buffers hold
+            for ctr in range(200):
+                bulk.put(ctr, frame)
+            control.put(0, 'stopped')
+            await asyncio.wait_for(receive_all_n(control, 1), timeout=10)
+            n_bulk = len(bulk._inbox)
+            await asyncio.wait_for(receive_all_n(bulk, 200), timeout=30)
+            for bridge in [bulk, control]:
+                bridge.close()
+                await asyncio.wait_for(bridge.onclose(), timeout=10)
+            return n_bulk
+
+        assert async_loop_provider.run_until_complete(run()) < 200
+
+    def test_node_takes_control_first(self, async_loop_provider):
+        node = Save_frame_status(name="B")
+        bulk = Bridge_thread(_from='1:1', _to='1:2')
+        control = Bridge_thread(_from='1:1', _to='1:2', priority='control')
+        node.data_storage = Multiprocessing_Data_Storage({'data': bulk, 'status': control}, {})
+        processed = []
+        node._process = lambda ctr: processed.append(ctr)
+
+        for ctr in range(50):
+            bulk.put(ctr, np.zeros((2, 2)))
+        control.put(50, 'stopped')
+
+        async def run():
+            # the bulk listener starts first and could take all of its items without yielding
+            listeners = [asyncio.get_event_loop().create_task(node._await_input(b)) for b in [bulk, control]]
+            while len(processed) < 51:
+                await asyncio.sleep(0.01)
+            for listener in listeners:
+                listener.cancel()
+            await asyncio.gather(*listeners)
+
+        async_loop_provider.run_until_complete(run())
+        assert processed.index(50) <= 1
+        # without control inputs nothing yields
+        assert not node.data_storage.control_waiting(control)
+
+class TestReadiness():
+
+    def ready(self, cls=Save_frame_status):
+        data, status = Frames(name="A"), Status(name="S")
+        node = cls(name="B")
+        node.add_input(data, emit_port=data.ports_out.data, recv_port=node.ports_in.data)
+        node.add_input(status, emit_port=status.ports_out.data, recv_port=node.ports_in.status)
+        node.lock()
+        bridges = {'data': Bridge_thread(_from='1:1', _to='1:2'), 'status': Bridge_thread(_from='1:1', _to='1:2')}
+        node.ready(bridges, {})
+        return node, bridges
+
+    def stop(self, loop, node):
+        for task in [*node.bridge_listeners, node._bridges_closed]:
+            task.cancel()
+        loop.run_until_complete(asyncio.gather(*node.bridge_listeners, node._bridges_closed, return_exceptions=True))
+
+    def test_bits(self, async_loop_provider):
+        node, bridges = self.ready()
+        assert node._required_mask == 0b11
+        # values given directly (e.g. by nodes overriding _should_process) use the same bits
+        assert node._should_process(data=None, status=None)
+        assert not node._should_process(data=None)
+        node.data_storage.closed_mask |= node._input_bits['status']
+        assert node._should_process(data=None)
+        self.stop(async_loop_provider, node)
+
+    def test_processes_complete_ctrs(self, async_loop_provider):
+        node, bridges = self.ready()
+        for ctr in range(3):
+            bridges['data'].put(ctr, np.zeros((2, 2)))
+        for ctr in range(2):
+            bridges['status'].put(ctr, str(ctr))
+
+        async def run():
+            while len(node.processed) < 2:
+                await asyncio.sleep(0.01)
+            # the last ctr waits for the status, until that is closed
+            await asyncio.sleep(0.05)
+            assert node.processed == [(0, '0'), (1, '1')]
+            assert node.data_storage.pending_ctrs() == [2]
+
+            bridges['data'].close()
+            bridges['status'].close()
+            await asyncio.wait_for(node._finished, timeout=5)
+
+        async_loop_provider.run_until_complete(run())
+        self.stop(async_loop_provider, node)
+        assert node.processed == [(0, '0'), (1, '1'), (2, None)]
+
+    def test_overridden_should_process(self, async_loop_provider):
+        class Save_overridden(Save_frame_status):
+            def _should_process(self, **kwargs):
+                return super()._should_process(**kwargs)
+
+        node, bridges = self.ready(Save_overridden)
+        bridges['data'].put(0, np.zeros((2, 2)))
+
+        async def run():
+            while node.data_storage.pending_ctrs() != [0]:
+                await asyncio.sleep(0.01)
+            # the ctr is skipped until the status closes
+            await asyncio.sleep(0.05)
+            assert node.processed == []
+
+            bridges['status'].close()
+            while not node.processed:
+                await asyncio.sleep(0.01)
+            assert node.processed == [(0, None)]
+
+        async_loop_provider.run_until_complete(asyncio.wait_for(run(), timeout=5))
+        self.stop(async_loop_provider, node)
+
+def measured(latency, throughput):
+    return {'8': {'latency': latency, 'throughput': throughput}, '131072': {'latency': latency * 10, 'throughput': throughput / 10}}
+
+class TestCalibration():
+
+    def test_calibrate(self, tmp_path):
+        path = str(tmp_path / 'calibration.json')
+        res = calibration.calibrate(bridges=[Bridge_local, Bridge_pipe], payloads=[8, 1024], n_latency=20, n_throughput=200, path=path)
+        assert set(res['results']['Bridge_local']) == {'local'}
+        assert set(res['results']['Bridge_pipe']) == {'process'}
+        assert set(res['results']['Bridge_pipe']['process']) == {'8', '1024'}
+        assert all(m['latency'] > 0 and m['throughput'] > 0 for m in res['results']['Bridge_pipe']['process'].values())
+        assert calibration.load_calibration(path) == res
+
+    def test_resolve_by_measurements(self, tmp_path, monkeypatch):
+        path = tmp_path / 'calibration.json'
+        path.write_text(json.dumps({'machine': platform.node(), 'results': {
+            'Bridge_pipe': {'process': measured(1e-4, 10_000)},
+            'Bridge_process': {'process': measured(2e-3, 200_000)},
+            'Bridge_shm': {'process': measured(5e-5, 5_000)},
+        }}))
+        monkeypatch.setattr(calibration, 'BRIDGE_CALIBRATION_FILE', str(path))
+
+        # lowest latency
+        assert type(TestResolveBridge().resolve(Frames(name="A"), Save_sum(name="B"), "1:1", "2:1")) == Bridge_shm
+        # lowest latency among the bridges keeping up with the port's rate
+        assert type(TestResolveBridge().resolve(Scalars_fast(name="A"), Sink_scalar(name="B"), "1:1", "2:1")) == Bridge_pipe
+        # relations without measurements keep the static costs
+        assert type(TestResolveBridge().resolve(Frames(name="A"), Save_sum(name="B"), "1:1", "1:2")) == Bridge_thread
+        # but not bridges that would ignore the connection's settings
+        assert type(TestResolveBridge().resolve(Frames(name="A"), Save_sum(name="B"), "1:1", "2:1", capacity=2)) == Bridge_pipe
+        assert type(TestResolveBridge().resolve(Frames(name="A"), Save_sum(name="B"), "1:1", "2:1", overflow='latest')) == Bridge_pipe
+        assert type(TestResolveBridge().resolve(Frames(name="A"), Save_sum(name="B"), "1:1", "2:1", compression='zlib')) == Bridge_pipe
+
+    def test_honors(self):
+        assert Bridge_pipe.honors(capacity=2, compression='zlib')
+        assert not Bridge_thread.honors(compression='zlib')
+        assert not Bridge_shm.honors(capacity=2) and not Bridge_shm.honors(overflow='latest')
+        assert Bridge_socket.honors(capacity=2, overflow='drop_oldest') and not Bridge_socket.honors(capacity=2)
+
+    def test_rank_by_throughput(self):
+        res = {'results': {'Bridge_pipe': {'process': measured(1e-4, 10_000)}, 'Bridge_process': {'process': measured(2e-3, 20_000)}}}
+        class Port_hinted(Port_Scalar_fast):
+            example_values = [0.]
+            payload_bytes = 100_000
+            rate = 50_000
+        # nothing keeps up: highest throughput, measured with the payload size closest to the declared one
+        assert calibration.rank_bridges([Bridge_pipe, Bridge_process], "1:1", "2:1", Port_hinted, res) == [Bridge_process, Bridge_pipe]
+        # not all bridges measured
+        assert calibration.rank_bridges([Bridge_pipe, Bridge_shm], "1:1", "2:1", Port_hinted, res) is None
+
+
+class TestCodecPickle():
+
+    def test_buffers_out_of_band(self):
+        data = np.random.rand(64, 64)
+        item = {'data': data, 'annotation': ['EMG1', 'EMG2'], 'nested': [data[0].copy()]}
+        frames = Codec_pickle.encode(item)
+
+        # the pickle stream itself only describes the item, the array data is in separate frames
+        assert len(frames) == 3
+        assert len(frames[0]) < 1024
+        assert sum(memoryview(frame).nbytes for frame in frames[1:]) == data.nbytes + data[0].nbytes
+
+        # decode uses the received buffers as they are
+        received = [bytes(frames[0])] + [bytearray(frame) for frame in frames[1:]]
+        decoded = Codec_pickle.decode(received)
+        np.testing.assert_array_equal(decoded['data'], data)
+        assert decoded['annotation'] == ['EMG1', 'EMG2']
+        received[1][:8] = np.float64(-1).tobytes()
+        assert decoded['data'][0, 0] == -1
+
+
+class Port_Frame_raw(Port_Frame):
+    example_values = [np.zeros((2, 2))]
+    codec = Codec_ndarray
+
+class Port_Channels(Port):
+    example_values = [["EMG1", "EMG2"]]
+    codec = 'Codec_str_list'
+
+    @classmethod
+    def check_value(cls, value):
+        return type(value) is list, None
+
+class TestCodecs():
+
+    @pytest.mark.parametrize("item", [
+        np.arange(12, dtype=np.float32).reshape((1, 3, 4)),
+        np.arange(12, dtype='>i2').reshape((3, 4)).T,
+        np.array(3.5),
+        np.zeros((0, 4)),
+        np.array(['a', 'bc']),
+    ])
+    def test_ndarray(self, item):
+        assert Codec_ndarray.accepts(item)
+        frames = Codec_ndarray.encode(item)
+        decoded = Codec_ndarray.decode([bytes(frames[0]), bytearray(frames[1])])
+        np.testing.assert_array_equal(decoded, item)
+        assert decoded.dtype == item.dtype
+        assert decoded.shape == item.shape
+
+    def test_ndarray_accepts(self):
+        assert not Codec_ndarray.accepts([1, 2])
+        assert not Codec_ndarray.accepts(np.array([{'a': 1}], dtype=object))
+
+    def test_str_list(self):
+        item = ["EMG1", "EMG2", "", "Gyro ü"]
+        assert Codec_str_list.accepts(item)
+        assert not Codec_str_list.accepts(["EMG1", 2])
+        assert not Codec_str_list.accepts(("EMG1", "EMG2"))
+        assert not Codec_str_list.accepts(["EMG1\x00"])
+        for value in [item, [], [""]]:
+            frames = Codec_str_list.encode(value)
+            assert Codec_str_list.decode([bytearray(frame) for frame in frames]) == value
+
+    def test_get_codec(self):
+        assert get_codec(Port_Frame("Data")) is Codec_pickle
+        assert get_codec(Port_Frame_raw) is Codec_ndarray
+        assert get_codec(Port_Channels("Channels")) is Codec_str_list
+
+    def test_bridge_codec_from_emit_port(self):
+        class Ports_raw(Ports_collection):
+            data: Port_Frame_raw = Port_Frame_raw("Data")
+
+        class Frames_raw(Frames):
+            ports_out = Ports_raw()
+
+        data = Frames_raw(name="A", compute_on="1:1")
+        out = Save_sum(name="Out", compute_on="2:1")
+        out.add_input(data, emit_port=data.ports_out.data, recv_port=out.ports_in.data)
+
+        bridge, _ = Multiprocessing_Data_Storage.resolve_bridge(out.input_connections[0])
+        assert bridge.codec is Codec_ndarray
+
+    def test_pipe_falls_back_to_pickle(self, async_loop_provider):
+        items = [np.ones((3, 3)), {'data': np.ones(3)}, np.arange(4), np.array([{'a': 1}], dtype=object)]
+        bridge = Bridge_pipe(_from='1:1', _to='2:1', codec=Codec_ndarray)
+        res = run_across_processes(async_loop_provider, bridge, items)
+
+        assert [ctr for ctr, _, _ in res] == list(range(len(items)))
+        np.testing.assert_array_equal(res[0][1], items[0])
+        np.testing.assert_array_equal(res[1][1]['data'], items[1]['data'])
+        np.testing.assert_array_equal(res[2][1], items[2])
+        assert res[3][1][0] == {'a': 1}
+
+
+class Codec_counting(Codec_pickle):
+    n_encoded = 0
+
+    @classmethod
+    def encode(cls, item):
+        cls.n_encoded += 1
+        return Codec_pickle.encode(item)
+
+class TestFanOut():
+
+    def test_encode_once(self, async_loop_provider):
+        pipes = [Bridge_pipe(_from='1:1', _to=f'{i + 2}:1', codec=Codec_counting) for i in range(4)]
+        thread = Bridge_thread(_from='1:1:1', _to='1:1:2')
+        storage = Multiprocessing_Data_Storage(input_endpoints={}, output_endpoints={'data': pipes + [thread]})
+        for b in pipes + [thread]:
+            b.ready_recv()
+
+        items = [{'data': np.arange(10) * i} for i in range(3)]
+        for ctr, item in enumerate(items):
+            storage.put('data', ctr, item)
+        storage.close_bridges()
+        assert Codec_counting.n_encoded == len(items)
+
+        for b in pipes:
+            res = async_loop_provider.run_until_complete(asyncio.wait_for(receive_all(b, len(items)), timeout=10))
+            for (_, received, _), sent in zip(res, items):
+                np.testing.assert_array_equal(received['data'], sent['data'])
+
+        # same process bridges still pass the object itself
+        res = async_loop_provider.run_until_complete(asyncio.wait_for(receive_all(thread, len(items)), timeout=10))
+        assert all(received is sent for (_, received, _), sent in zip(res, items))
+
+    @pytest.mark.parametrize("n_bridges,n_pickled", [(1, 0), (3, 3)])
+    def test_pickle_once_for_process_bridges(self, async_loop_provider, monkeypatch, n_bridges, n_pickled):
+        pickled = []
+        encode = Bridge_process.encode
+        monkeypatch.setattr(Bridge_process, 'encode', lambda self, item: pickled.append(item) or encode(self, item))
+        bridges = [Bridge_process(_from='1:1', _to=f'{i + 2}:1') for i in range(n_bridges)]
+        storage = Multiprocessing_Data_Storage(input_endpoints={}, output_endpoints={'data': bridges})
+        for b in bridges:
+            b.ready_recv()
+
+        items = [{'data': np.arange(10) * i} for i in range(3)]
+        for ctr, item in enumerate(items):
+            storage.put('data', ctr, item)
+        storage.close_bridges()
+        # a single bridge leaves pickling to its queue
+        assert len(pickled) == n_pickled
+
+        for b in bridges:
+            res = async_loop_provider.run_until_complete(asyncio.wait_for(receive_all(b, len(items)), timeout=10))
+            for (_, received, _), sent in zip(res, items):
+                np.testing.assert_array_equal(received['data'], sent['data'])
+
+    @pytest.mark.parametrize("bridge_clss", [[Bridge_pipe, Bridge_process, Bridge_pipe, Bridge_process], [Bridge_process, Bridge_pipe, Bridge_process, Bridge_pipe]])
+    def test_mixed_encoders(self, async_loop_provider, bridge_clss):
+        bridges = [bridge_cls(_from='1:1', _to=f'{i + 2}:1') for i, bridge_cls in enumerate(bridge_clss)]
+        storage = Multiprocessing_Data_Storage(input_endpoints={}, output_endpoints={'data': bridges})
+        for b in bridges:
+            b.ready_recv()
+        # pipes and process bridges each share their own encoding
+        assert len(storage._bridges['data'][0]) == 2
+
+        items = [{'data': np.arange(10) * i} for i in range(3)]
+        for ctr, item in enumerate(items):
+            storage.put('data', ctr, item)
+        storage.close_bridges()
+
+        for b in bridges:
+            res = async_loop_provider.run_until_complete(asyncio.wait_for(receive_all(b, len(items)), timeout=10))
+            for (_, received, _), sent in zip(res, items):
+                np.testing.assert_array_equal(received['data'], sent['data'])
+
+    def test_encode_once_besides_pool(self, async_loop_provider):
+        host = f'127.0.0.1:{free_port()}'
+        _from = f'{host}:1:1'
+        pipe = Bridge_pipe(_from=_from, _to=f'{host}:2:1')
+        sockets = [Bridge_socket(_from=_from, _to=f'127.0.0.1:{free_port()}:1:1', name=f'A.data -> {name}.data', codec=Codec_counting) for name in ['B', 'C']]
+        items = [np.full(Shared_Buffer_Pool.min_bytes, i, dtype=np.uint8) for i in range(3)]
+
+        async def run():
+            storage = Multiprocessing_Data_Storage(input_endpoints={}, output_endpoints={'data': [pipe] + sockets})
+            for b in sockets:
+                b.ready_recv()
+            n_encoded = Codec_counting.n_encoded
+            for ctr, item in enumerate(items):
+                storage.put('data', ctr, item)
+            # the pipe received handles into the pool, the sockets share one encoding per item
+            assert storage._pools['data'].n_written == len(items)
+            assert Codec_counting.n_encoded - n_encoded == len(items)
+            res = [await asyncio.wait_for(receive_all_n(b, len(items)), timeout=10) for b in sockets]
+            storage.close_bridges()
+            for b in sockets:
+                await asyncio.wait_for(b.onclose(), timeout=10)
+            return res
+
+        for res in async_loop_provider.run_until_complete(run()):
+            for (_, received, _), sent in zip(res, items):
+                np.testing.assert_array_equal(received, sent)
+
+
+class TestCtrBuffer():
+
+    def test_pop_until(self):
+        read = Ctr_buffer()
+        for ctr in [0, 2, 3, 7]:
+            read[ctr] = str(ctr)
+        assert 2 in read and 1 not in read
+        assert read[3] == '3'
+        assert read.pop_until(2) == ['0', '2']
+        assert len(read) == 2 and 2 not in read
+        assert read.pop_until(2) == []
+        assert read.pop_until(10) == ['3', '7']
+        assert len(read) == 0
+
+    def test_out_of_order(self):
+        read = Ctr_buffer()
+        for ctr in [5, 1, 3]:
+            read[ctr] = ctr
+        read[3] = 'again'
+        assert len(read) == 3
+        assert read.pop_until(4) == [1, 'again']
+
+
+class TestBridgeStats():
+
+    def test_counters(self):
+        stats = Bridge_stats()
+        for ctr in range(3):
+            stats.put(ctr, nbytes=100, saved=10)
+        stats.got(0)
+        res = stats.read()
+        assert (res['put'], res['got'], res['depth'], res['high_water'], res['bytes'], res['saved']) == (3, 1, 2, 3, 300, 30)
+        assert res['latency']['n'] == 1
+        assert sum(res['latency']['histogram'].values()) == 1
+        assert res['latency']['mean'] < 1
+
+        # dropped items are not waiting anymore
+        stats.got(2, n_dropped=1)
+        res = stats.read()
+        assert (res['got'], res['dropped'], res['depth']) == (2, 1, 0)
+
+    def test_reported_by_receiver(self, async_loop_provider):
+        bridge = Bridge_local(_from='1:1', _to='1:1', name='A.data -> B.data')
+        storage = Multiprocessing_Data_Storage(input_endpoints={'data': bridge}, output_endpoints={})
+        reports = []
+        storage.register_reporter(lambda **kwargs: reports.append(kwargs))
+
+        bridge.ready_send()
+        bridge.stats.put(0)
+        bridge.put(0, 'item')
+        ctr = async_loop_provider.run_until_complete(bridge.update())
+        storage.received(bridge, ctr)
+        assert reports[0]['bridges']['A.data -> B.data']['got'] == 1
+
+    def test_graph_across_processes(self):
+        data = Frames(name="A", compute_on="1:1")
+        out = Save_sum(name="B", compute_on="2:1")
+        out.add_input(data, emit_port=data.ports_out.data, recv_port=out.ports_in.data)
+
+        g = Graph(start_node=data)
+        g.start_all()
+        g.join_all()
+        g.stop_all()
+        out.get_state_and_close()
+
+        # both ends counted in their own process, read here
+        stats = g.bridge_stats()['A [Frames].data -> B [Save_sum].data']
+        assert (stats['put'], stats['got'], stats['depth']) == (20, 20, 0)
+        # the arrays and how they were serialized
+        assert 20 * 128 * 128 * 8 <= stats['bytes'] < 20 * 128 * 128 * 8 * 1.01
+        assert stats['latency']['n'] == 20
+
+
+class TestCompression():
+
+    @pytest.mark.parametrize("method", ['zlib', 'lzma'])
+    def test_threshold(self, method):
+        compressor = Compressor(method, threshold=100)
+        assert compressor.compress([b'x' * 50, b'']) is None
+
+        frames = [b'x' * 1000, np.zeros(500).view(np.uint8).data]
+        compressed, saved = compressor.compress(frames)
+        assert saved == 1000 + 4000 - sum(len(frame) for frame in compressed)
+        assert [bytes(frame) for frame in compressor.decompress(compressed)] == [bytes(frame) for frame in frames]
+
+    def test_incompressible(self):
+        assert Compressor('zlib', threshold=0).compress([np.random.bytes(1000)]) is None
+
+    def test_adaptive(self):
+        compressor = Compressor('zlib', threshold=0, adaptive=True)
+        compressor.adaptive_window, compressor.adaptive_retry, compressor.adaptive_max_ratio = 4, 10, 0.1
+        # saves about half
+        frames = [np.random.bytes(1000) + bytes(1000)]
+        compressed = [compressor.compress(frames) is not None for _ in range(20)]
+        assert compressed == [True] * 4 + [False] * 10 + [True] * 4 + [False] * 2
+
+    def test_pipe(self, async_loop_provider):
+        items = [np.zeros(10_000), 'small', {'labels': ['a'] * 1000}, np.frombuffer(np.random.bytes(8000), dtype=np.uint8)]
+        bridge = Bridge_pipe(_from='1:1', _to='2:1', codec=Codec_ndarray, compression=Compressor('zlib'))
+        encoded = [bridge.encode(item) for item in items]
+        saved = [bridge.encoded_saved(e) for e in encoded]
+        assert saved[0] > 70_000 and saved[1] == 0 and saved[2] > 0
+        # at most the array's header
+        assert saved[3] < 100
+
+        res = run_across_processes(async_loop_provider, bridge, items)
+        np.testing.assert_array_equal(res[0][1], items[0])
+        assert res[1][1] == 'small'
+        assert res[2][1] == items[2]
+        np.testing.assert_array_equal(res[3][1], items[3])
+
+    def test_process_bridges(self, async_loop_provider):
+        # below the size sent through the shared buffer pool
+        items = [np.zeros(Shared_Buffer_Pool.min_bytes // 16), 'small']
+        bridges = [Bridge_process(_from='1:1', _to=f'{i + 2}:1', compression=Compressor('zlib')) for i in range(2)]
+        storage = Multiprocessing_Data_Storage(input_endpoints={}, output_endpoints={'data': bridges})
+        for b in bridges:
+            b.ready_recv()
+        for ctr, item in enumerate(items):
+            storage.put('data', ctr, item)
+        storage.close_bridges()
+        assert all(b.stats.read()['saved'] > 0.9 * items[0].nbytes for b in bridges)
+
+        for b in bridges:
+            res = async_loop_provider.run_until_complete(asyncio.wait_for(receive_all(b, len(items)), timeout=10))
+            np.testing.assert_array_equal(res[0][1], items[0])
+            assert res[1][1] == 'small'
+
+    def test_graph_across_hosts(self):
+        data = Frames(name="A", compute_on=f"127.0.0.1:{free_port()}:1:1")
+        out = Save_sum(name="Out", compute_on=f"127.0.0.1:{free_port()}:2:1")
+        out.add_input(data, emit_port=data.ports_out.data, recv_port=out.ports_in.data, compression='zlib')
+
+        g = Graph(start_node=data)
+        g.start_all()
+        g.join_all()
+        g.stop_all()
+
+        assert out.get_state_and_close() == [128 * 128 * ctr for ctr in range(20)]
+        # constant frames
+        stats = g.bridge_stats()[f'{data}.data -> {out}.data']
+        assert stats['saved'] > 0.9 * 20 * 128 * 128 * 8
+        assert stats['bytes'] + stats['saved'] >= 20 * 128 * 128 * 8
+
+
+class Frames_frozen(Frames):
+    freeze_emitted = True
+
+class Add_inplace(Node):
+    ports_in = Ports_frame()
+    ports_out = Ports_none()
+
+    def __init__(self, name='Add_inplace', **kwargs):
+        super().__init__(name, **kwargs)
+        self.out = mp.SimpleQueue()
+
+    def process(self, data, **kwargs):
+        try:
+            data += 1
+            self.out.put('changed')
+        except ValueError:
+            self.out.put('read-only')
+
+    def get_state_and_close(self):
+        res = []
+        while not self.out.empty():
+            res.append(self.out.get())
+        self.out.close()
+        return res
+
+class TestFreezeEmitted():
+
+    def test_freeze_nested(self):
+        data = {'a': np.zeros(3), 'b': [np.zeros(2), (np.zeros(1), 'text')]}
+        freeze(data)
+        for arr in [data['a'], data['b'][0], data['b'][1][0]]:
+            assert not arr.flags.writeable
+            with pytest.raises(ValueError):
+                arr += 1
+
+    @pytest.mark.parametrize("data_cls,expected", [(Frames, 'changed'), (Frames_frozen, 'read-only')])
+    def test_graph_in_one_thread(self, data_cls, expected):
+        data = data_cls(name="A", compute_on="1:1")
+        inplace = Add_inplace(name="B", compute_on="1:1")
+        out = Save_sum(name="C", compute_on="1:1")
+        inplace.add_input(data, emit_port=data.ports_out.data, recv_port=inplace.ports_in.data)
+        out.add_input(data, emit_port=data.ports_out.data, recv_port=out.ports_in.data)
+
+        g = Graph(start_node=data)
+        g.start_all()
+        g.join_all()
+        g.stop_all()
+
+        assert inplace.get_state_and_close() == [expected] * 20
+        if expected == 'read-only':
+            assert out.get_state_and_close() == [128 * 128 * ctr for ctr in range(20)]
+
+    def test_only_references(self):
+        local = Bridge_local(_from='1:1', _to='1:1')
+        pipe = Bridge_pipe(_from='1:1', _to='2:1')
+        storage = Multiprocessing_Data_Storage(input_endpoints={}, output_endpoints={'a': [local, pipe], 'b': [pipe]})
+        assert storage.passes_references('a')
+        assert not storage.passes_references('b')
+
+
+def receive_in_process(bridge, n, out):
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    bridge.ready_recv()
+    res = loop.run_until_complete(asyncio.wait_for(receive_all(bridge, n), timeout=10))
+    loop.close()
+    out.put([float(np.sum(item)) for _, item, _ in res])
+
+def open_fds():
+    # (fd, what it refers to), pipes and shared memory segments are unique by the latter
+    fds = set()
+    for fd in os.listdir('/proc/self/fd'):
+        try:
+            fds.add((fd, os.readlink(f'/proc/self/fd/{fd}')))
+        except OSError:
+            pass
+    return fds
+
+class TestReleaseParent():
+
+    @pytest.mark.parametrize("bridge_cls", [Bridge_pipe, Bridge_process, Bridge_shm])
+    def test_both_ends_forked(self, bridge_cls):
+        items = [np.full((4, 4), i, dtype=np.float64) for i in range(10)]
+        out = MP_CTX.SimpleQueue()
+        # the shared memory of the stats is allocated from an arena and shared memory segments are tracked by a helper process, both stay open once created
+        Bridge_stats()
+        resource_tracker.ensure_running()
+
+        before = open_fds()
+        bridge = bridge_cls(_from='1:1', _to='2:1', capacity=2)
+        created = open_fds() - before
+        assert len(created) > 0
+
+        receiver = MP_CTX.Process(target=receive_in_process, args=(bridge, len(items), out))
+        sender = MP_CTX.Process(target=send_all_async, args=(bridge, items))
+        receiver.start()
+        sender.start()
+        # the forked processes use their own copies
+        bridge.release_parent()
+        assert created.isdisjoint(open_fds())
+
+        assert out.get() == [16.0 * i for i in range(10)]
+        sender.join()
+        receiver.join()
+
+    def test_graph_releases_after_setup(self):
+        data = Frames(name="A", compute_on="1:1")
+        out = Save_sum(name="B", compute_on="2:1")
+        out.add_input(data, emit_port=data.ports_out.data, recv_port=out.ports_in.data)
+
+        g = Graph(start_node=data)
+        g.start_all()
+        bridge = g.bridges['B [Save_sum]']['recv']['data']
+        assert isinstance(bridge, Bridge_pipe)
+        assert bridge._r is None and bridge._w is None
+        g.join_all()
+        g.stop_all()
+        assert out.get_state_and_close() == [128 * 128 * ctr for ctr in range(20)]
+
+
+class TestBridgeShm():
+
+    def test_can_handle(self):
+        assert Bridge_shm.can_handle('1:1', '2:1')[0]
+        assert not Bridge_shm.can_handle('1:1', '1:2')[0]
+        assert not Bridge_shm.can_handle('', '')[0]
+
+    def test_arrays_zero_copy(self, async_loop_provider):
+        items = [np.arange(i, i + 12, dtype=np.float64).reshape((1, 3, 4)) for i in range(3 * Bridge_shm.n_slots)]
+        bridge = Bridge_shm(_from='1:1', _to='2:1')
+        bridge.ready_send()
+        bridge.ready_recv()
+
+        async def interleaved():
+            res = []
+            for ctr, item in enumerate(items):
+                bridge.put(ctr, item)
+                res.extend(await receive_all_n(bridge, 1))
+            bridge.close()
+            await bridge.onclose()
+            return res
+
+        res = async_loop_provider.run_until_complete(asyncio.wait_for(interleaved(), timeout=10))
+        assert [ctr for ctr, _, _ in res] == list(range(len(items)))
+        for (_, received, is_view), sent in zip(res, items):
+            np.testing.assert_array_equal(received, sent)
+            assert received.dtype == sent.dtype
+            # slots are handed back after the ctr was processed, so the ring is re-used and never falls back to pickling
+            assert is_view
+
+    def test_full_ring_falls_back(self, async_loop_provider):
+        items = [np.full((4, 4), i) for i in range(3 * Bridge_shm.n_slots)]
+        bridge = Bridge_shm(_from='1:1', _to='2:1')
+        res = run_across_processes(async_loop_provider, bridge, items)
+
+        assert [ctr for ctr, _, _ in res] == list(range(len(items)))
+        for (_, received, _), sent in zip(res, items):
+            np.testing.assert_array_equal(received, sent)
+
+    def test_mixed_payloads_keep_order(self, async_loop_provider):
+        too_large = np.zeros(Bridge_shm.slot_size, dtype=np.uint8)
+        items = [np.ones((2, 2)), ["EMG1", "EMG2"], too_large, 20, np.array(['a', 'bc']), np.array([{'a': 1}], dtype=object)]
+        bridge = Bridge_shm(_from='1:1', _to='2:1')
+        res = run_across_processes(async_loop_provider, bridge, items)
+
+        assert [ctr for ctr, _, _ in res] == list(range(len(items)))
+        assert [is_view for _, _, is_view in res] == [True, False, False, False, True, False]
+        for (_, received, _), sent in zip(res, items):
+            if isinstance(sent, np.ndarray):
+                np.testing.assert_array_equal(received, sent)
+            else:
+                assert received == sent
+
+
+def shm_exists(name):
+    return os.path.exists(f'/dev/shm/{name}')
+
+class TestSharedBufferPool():
+
+    def test_accepts(self):
+        pool = Shared_Buffer_Pool(n_consumers=1)
+        assert pool.accepts(np.zeros(Shared_Buffer_Pool.min_bytes, dtype=np.uint8))
+        assert not pool.accepts(np.zeros(8, dtype=np.uint8))
+        assert not pool.accepts(np.array([{'a': 1}] * Shared_Buffer_Pool.min_bytes, dtype=object))
+        assert not pool.accepts([0] * Shared_Buffer_Pool.min_bytes)
+
+    def test_write_once_handle_per_consumer(self):
+        pool = Shared_Buffer_Pool(n_consumers=4)
+        frame = np.random.rand(64, 256)
+        handles = pool.write(frame)
+
+        assert len(handles) == 4
+        views = [pickle.loads(pickle.dumps(h)).resolve() for h in handles]
+        for view in views:
+            np.testing.assert_array_equal(view, frame)
+        # all consumers look at the same memory
+        views[0][0, 0] = -1
+        assert all(view[0, 0] == -1 for view in views)
+        del views
+
+        name = pool._segment.name
+        pool.close()
+        assert shm_exists(name)
+        for h in handles:
+            h.release()
+        assert not shm_exists(name)
+
+    def test_slots_recycled_and_starvation(self):
+        pool = Shared_Buffer_Pool(n_consumers=2)
+        frame = np.ones(Shared_Buffer_Pool.min_bytes, dtype=np.uint8)
+        held = [pool.write(frame) for _ in range(pool.n_slots)]
+        assert pool.stats()['occupied'] == pool.n_slots
+
+        # only one consumer released the first slot: still occupied
+        held[0][0].release()
+        assert pool.write(frame) is None
+        held[0][1].release()
+        held[0] = pool.write(frame)
+        assert held[0] is not None
+
+        stats = pool.stats()
+        assert stats['written'] == pool.n_slots + 1
+        assert stats['starved'] == 1
+
+        # the segment is only removed once the emitter closed and every consumer released every slot
+        name = pool._segment.name
+        pool.close()
+        for handles in held:
+            assert shm_exists(name)
+            for h in handles:
+                h.release()
+        assert not shm_exists(name)
+
+    def test_releaser_keeps_referenced_views(self, async_loop_provider):
+        pool = Shared_Buffer_Pool(n_consumers=1)
+        frame = np.ones(Shared_Buffer_Pool.min_bytes, dtype=np.uint8)
+        kept, dropped = pool.write(frame)[0], pool.write(frame)[0]
+        view = kept.resolve()
+        dropped.resolve()
+
+        releaser = Pool_Releaser()
+        releaser.add(kept)
+        releaser.add(dropped)
+        async_loop_provider.run_until_complete(asyncio.sleep(0))
+        assert pool.stats()['occupied'] == 1
+
+        del view
+        releaser.release()
+        assert pool.stats()['occupied'] == 0
+        pool.close()
+
+
+class TestPooledFanOut():
+
+    def test_graph_fan_out(self):
+        data = Frames(name="A", compute_on="1:1")
+        outs = [Save_sum(name=f"Out{i}", compute_on=f"{i + 2}:1") for i in range(3)]
+        for out in outs:
+            out.add_input(data, emit_port=data.ports_out.data, recv_port=out.ports_in.data)
+
+        g = Graph(start_node=data)
+        g.start_all()
+        g.join_all()
+        g.stop_all()
+
+        for out in outs:
+            assert out.get_state_and_close() == [128 * 128 * ctr for ctr in range(20)]
+        assert g.is_finished()
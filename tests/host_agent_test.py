@@ -0,0 +1,83 @@
+import socket
+import multiprocessing as mp
+
+import pytest
+
+from livenodes import Graph
+from livenodes.components.computer import Host_agent, Processor_host
+from livenodes.components.bridges import Bridge_socket
+from utils import Data, Quadratic, Save
+
+MP_CTX = mp.get_context('fork')
+
+
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+@pytest.fixture(autouse=True)
+def socket_authkey(monkeypatch):
+    # the secret shared by all hosts of a graph (see Bridge_socket), which the forked agent inherits
+    monkeypatch.setattr(Bridge_socket, 'authkey', b'secret')
+
+@pytest.fixture()
+def agent():
+    # nodes are instantiated through the registry, so the agent has to know the test nodes (ie has imported utils), which a forked process does
+    port = free_port()
+    process = MP_CTX.Process(target=Host_agent(host='127.0.0.1', port=port).serve, kwargs={'sessions': 1})
+    process.start()
+    yield process, f"127.0.0.1:{port}"
+    if process.is_alive():
+        process.terminate()
+        process.join()
+
+
+class TestHostAgent():
+
+    def test_graph_across_agent(self, agent):
+        agent, address = agent
+        main_host, agent_host = f"127.0.0.1:{free_port()}", f"127.0.0.1:{free_port()}"
+
+        data = Data(name="A", compute_on=f"{main_host}:1:1")
+        quadratic = Quadratic(name="B", compute_on=f"{agent_host}:1:1")
+        out = Save(name="C", compute_on=f"{main_host}:2:1")
+        quadratic.add_input(data, emit_port=data.ports_out.data, recv_port=quadratic.ports_in.data)
+        out.add_input(quadratic, emit_port=quadratic.ports_out.data, recv_port=out.ports_in.data)
+
+        g = Graph(start_node=data)
+        g.start_all(agents={agent_host: address})
+        assert sorted(map(str, g.computers)) == ['CMP-HS:' + agent_host, 'CMP-PR:1', 'CMP-PR:2']
+        g.join_all()
+        g.stop_all()
+
+        assert out.get_state_and_close() == [x ** 2 for x in range(10)]
+        agent.join(timeout=10)
+        assert agent.exitcode == 0
+
+    def test_setup_fails_on_unknown_nodes(self, agent):
+        agent, address = agent
+
+        data = Data(name="A")
+        cmp = Processor_host(location="127.0.0.1:1", agent=address, graph=data.to_compact_dict(graph=True), nodes=['X [Data]'])
+        with pytest.raises(RuntimeError, match='Nodes not in graph'):
+            cmp.setup()
+        cmp.close()
+
+        agent.join(timeout=10)
+        assert agent.exitcode == 0
+
+    def test_graph_is_not_executed(self, agent, tmp_path):
+        agent, address = agent
+        marker = tmp_path / 'executed'
+
+        cmp = Processor_host(location="127.0.0.1:1", agent=address, graph=f"!!python/object/apply:os.system ['touch {marker}']", nodes=[])
+        with pytest.raises(RuntimeError):
+            cmp.setup()
+        cmp.close()
+
+        agent.join(timeout=10)
+        assert not marker.exists()
+
+    def test_listens_on_localhost(self):
+        assert Host_agent().host == '127.0.0.1'
@@ -95,7 +95,59 @@ class TestNodeOperations():
         assert str(graph) == "B [SimpleNode]"
         assert str(graph.input_connections[0]._emit_node) == "A [SimpleNode]"
 
-    
+    def test_connection_settings(self):
+        node_a = SimpleNode(name="A")
+        node_b = SimpleNode(name="B")
+        node_b.add_input(node_a, emit_port=node_a.ports_out.data, recv_port=node_b.ports_in.data, capacity=4, overflow='drop_oldest')
+
+        dct = node_a.to_compact_dict(graph=True)
+        assert dct['Connections'] == {"A [SimpleNode].data -> B [SimpleNode].data": {'capacity': 4, 'overflow': 'drop_oldest'}}
+        con = Node.from_compact_dict(dct).input_connections[0]
+        assert (con.capacity, con.overflow) == (4, 'drop_oldest')
+
+        con = Node.from_dict(node_a.to_dict(graph=True)).output_connections[0]
+        assert (con.capacity, con.overflow) == (4, 'drop_oldest')
+
+    def test_connection_bridge_override(self):
+        node_a = SimpleNode(name="A")
+        node_b = SimpleNode(name="B")
+        node_b.add_input(node_a, emit_port=node_a.ports_out.data, recv_port=node_b.ports_in.data, bridge='Bridge_process')
+
+        dct = node_a.to_compact_dict(graph=True)
+        assert dct['Connections'] == {"A [SimpleNode].data -> B [SimpleNode].data": {'bridge': 'Bridge_process'}}
+        assert Node.from_compact_dict(dct).input_connections[0].bridge == 'Bridge_process'
+
+    def test_connection_compression(self):
+        node_a = SimpleNode(name="A")
+        node_b = SimpleNode(name="B")
+        node_b.add_input(node_a, emit_port=node_a.ports_out.data, recv_port=node_b.ports_in.data, compression='lzma', compression_adaptive=True)
+
+        dct = node_a.to_compact_dict(graph=True)
+        assert dct['Connections'] == {"A [SimpleNode].data -> B [SimpleNode].data": {'compression': 'lzma', 'compression_adaptive': True}}
+        con = Node.from_compact_dict(dct).input_connections[0]
+        assert (con.compression, con.compression_threshold, con.compression_adaptive) == ('lzma', None, True)
+
+    def test_connection_priority(self):
+        node_a = SimpleNode(name="A")
+        node_b = SimpleNode(name="B")
+        node_b.add_input(node_a, emit_port=node_a.ports_out.data, recv_port=node_b.ports_in.data, priority='control')
+
+        dct = node_a.to_compact_dict(graph=True)
+        assert dct['Connections'] == {"A [SimpleNode].data -> B [SimpleNode].data": {'priority': 'control'}}
+        assert Node.from_compact_dict(dct).input_connections[0].priority == 'control'
+
+    def test_connection_settings_invalid(self):
+        node_a = SimpleNode(name="A")
+        node_b = SimpleNode(name="B")
+        with pytest.raises(ValueError):
+            node_b.add_input(node_a, emit_port=node_a.ports_out.data, recv_port=node_b.ports_in.data, overflow='drop_all')
+        with pytest.raises(ValueError):
+            node_b.add_input(node_a, emit_port=node_a.ports_out.data, recv_port=node_b.ports_in.data, capacity=0)
+        with pytest.raises(ValueError):
+            node_b.add_input(node_a, emit_port=node_a.ports_out.data, recv_port=node_b.ports_in.data, compression='gzip')
+        with pytest.raises(ValueError):
+            node_b.add_input(node_a, emit_port=node_a.ports_out.data, recv_port=node_b.ports_in.data, priority='urgent')
+
     def test_graph_json_same_name(self):
         node_a = SimpleNode(name="A")
         node_b = SimpleNode(name="B")
@@ -1,9 +1,73 @@
+import numpy as np
 import pytest
-from tests.utils import Data
+from tests.utils import Data, Port_Ints
+from livenodes.components.bridges import Multiprocessing_Data_Storage
 
 class TestWarnings():
 
     def test_nonexisting_port(self):
         data = Data(name="A", compute_on="")
         with pytest.raises(ValueError):
-            data._emit_data(data=[], channel='nonexistantportname')
\ No newline at end of file
+            data._emit_data(data=[], channel='nonexistantportname')
+
+class TestTypeCheck():
+
+    def emitting(self, monkeypatch, type_check):
+        data = Data(name="A", compute_on="")
+        data.type_check, data.type_check_n = type_check, 3
+        data.data_storage = Multiprocessing_Data_Storage(input_endpoints={}, output_endpoints={'data': []})
+        checked = []
+        check_value = Port_Ints.check_value
+        monkeypatch.setattr(Port_Ints, 'check_value', classmethod(lambda cls, value: checked.append(value) or check_value(value)))
+        return data, checked
+
+    @pytest.mark.parametrize("type_check,expected", [
+        ('always', list(range(10))),
+        ('first', [0, 1, 2]),
+        ('every', [0, 3, 6, 9]),
+        # a known signature is checked again every type_check_n values
+        ('signature', [0, 3, 6, 9]),
+    ])
+    def test_policies(self, monkeypatch, type_check, expected):
+        data, checked = self.emitting(monkeypatch, type_check)
+        for ctr in range(10):
+            data._emit_data(data=ctr, ctr=ctr)
+        assert checked == expected
+
+    def test_signature_catches_new_types(self, monkeypatch):
+        data, checked = self.emitting(monkeypatch, 'signature')
+        data._emit_data(data=1, ctr=0)
+        with pytest.raises(AssertionError):
+            data._emit_data(data='1', ctr=1)
+        # a failed signature is checked again
+        with pytest.raises(AssertionError):
+            data._emit_data(data='2', ctr=2)
+        with pytest.raises(AssertionError):
+            data._emit_data(data=np.zeros(2, dtype=int), ctr=3)
+        assert len(checked) == 4
+
+    def test_signature_of_nested_lists(self, monkeypatch):
+        data, checked = self.emitting(monkeypatch, 'signature')
+        data.type_check_n = 5
+        def ints(value):
+            return all(ints(v) for v in value) if isinstance(value, list) else type(value) == int
+        monkeypatch.setattr(Port_Ints, 'check_value', classmethod(lambda cls, value: checked.append(value) or (ints(value), 'Should be (lists of) ints')))
+
+        data._emit_data(data=[[1, 2]], ctr=0)
+        data._emit_data(data=[[3]], ctr=1)
+        # the inner type is part of the signature
+        with pytest.raises(AssertionError):
+            data._emit_data(data=[['a']], ctr=2)
+        assert checked == [[[1, 2]], [['a']]]
+
+        # later elements are not, but are checked periodically
+        with pytest.raises(AssertionError):
+            for ctr in range(3, 10):
+                data._emit_data(data=[[1, 'a']], ctr=ctr)
+        assert ctr == 6
+
+    def test_unknown(self):
+        class Data_unchecked(Data):
+            type_check = 'never'
+        with pytest.raises(ValueError):
+            Data_unchecked(name="A")
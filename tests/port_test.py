@@ -158,6 +158,18 @@ class TestPorts():
         assert a._asdict() == {'any': a.any}
         assert a._fields == ['any']
 
+    def test_port_collection_lookup(self):
+        ports = type('Ports_two', (Ports_collection,), {'b': Port_Any("B"), 'a': Port_Int("A")})()
+        # ordered by key, the first one is the default
+        assert ports._fields == ['a', 'b']
+        assert list(ports) == [ports.a, ports.b]
+        assert ports._default is ports.a
+        assert ports._get('b') is ports.b
+        with pytest.raises(AttributeError):
+            ports._get('_asdict')
+        # instances do not share the contextualized ports
+        assert ports._get('a') is not type(ports).a
+
     def test_raise_namedtuple_error(self):
         class Quadratic(Node):
             ports_in = Ports_deprecated()